@@ -1,17 +1,28 @@
 import asyncio
+import copy
 import datetime
+import functools
 import uuid
 from typing import Optional
 
-from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, SystemMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage, SystemMessage
 from langchain_core.runnables import RunnableConfig
-from langchain_gigachat import GigaChat
+from langgraph.graph.state import CompiledStateGraph
 
+from app.cassette import turn_cassette
+from app.circuit_breaker import llm_breaker
+from app.degraded import build_degraded_answer, retrieve_for_degraded
 from app.graph.enums import StageEnum
 from app.graph.nodes import Graph
+from app.llm.enums import PriorityEnum
+from app.llm.factory import get_chat_model
+from app.llm.resilience import deadline_scope
 from app.llm.tools.rag import Doc
 from app.models import AgentResponse
+from app.singleflight import SingleFlight
+from app.state_manager import state_manager
 from app.states import AgentState
+from app.telemetry import observe_turn
 
 from app.config import SETTINGS
 
@@ -20,20 +31,22 @@ import logging
 logging.basicConfig(level=logging.INFO)
 
 
+@functools.lru_cache(maxsize=None)
+def get_compiled_graph(priority: PriorityEnum) -> CompiledStateGraph:
+    """Граф компилируется один раз на приоритет и переиспользуется всеми запросами"""
+    return Graph(llm=get_chat_model(), priority=priority).compile_graph()
+
+
 class Agent:
 
     def __init__(
             self,
             message: str,
             state: AgentState | None = None,
-            session_id: str | None = None
+            session_id: str | None = None,
+            priority: PriorityEnum = PriorityEnum.INTERACTIVE
     ) -> None:
         """Инициализация графа"""
-        gigachat = GigaChat(
-            credentials=SETTINGS.GIGACHAT_CREDENTIALS,
-            model=SETTINGS.MODEL,
-            verify_ssl_certs=False
-        )
         self.session_id = session_id
         if not self.session_id:
             self.session_id = str(uuid.uuid4())
@@ -71,13 +84,21 @@ class Agent:
             self.state["current_phrase"] = message
             self.state["messages"].append(HumanMessage(content=message))
 
-        self.graph = Graph(llm=gigachat)
-        # компилируем граф
-        self.compiled = self.graph.compile_graph()
+        # скомпилированный граф переиспользуется между запросами
+        self.compiled = get_compiled_graph(priority)
 
 
     async def invoke(self) -> tuple[AgentResponse, AgentState]:
         """Асинхронный запуск графа"""
+        # Запись или воспроизведение вызовов LLM и Qdrant этого хода (CASSETTE_MODE)
+        async with turn_cassette(self.session_id, self.state["current_phrase"]):
+            return await self._run()
+
+    async def _run(self) -> tuple[AgentResponse, AgentState]:
+        # LLM недоступна: сразу отвечаем найденными фрагментами, не проходя граф
+        if llm_breaker.is_open:
+            return await self.degraded_invoke()
+
         run_config = RunnableConfig(
             run_id=self.session_id,
             recursion_limit=100,
@@ -85,12 +106,38 @@ class Agent:
                 "thread_id": self.session_id
             }
         )
-        state: AgentState =  await self.compiled.ainvoke(
-            self.state, run_config
-        )
+        # Все повторы вызовов LLM ограничены общим дедлайном запроса
+        with deadline_scope(SETTINGS.AGENT_REQUEST_TIMEOUT):
+            state: AgentState = await self.compiled.ainvoke(
+                self.state, run_config
+            )
+
+        observe_turn(state["iteration"], "error" if state["error"] else "ok")
+
+        # Предохранитель разомкнулся по ходу выполнения — лучше частичный ответ, чем ошибка
+        if state["error"] and llm_breaker.is_open:
+            return await self.degraded_invoke()
 
         return self.return_message_and_state_from_state(state)
 
+    async def degraded_invoke(self) -> tuple[AgentResponse, AgentState]:
+        """Деградированный режим: топ найденных фрагментов и экстрактивная выжимка без LLM"""
+        query = self.state["current_phrase"]
+        documents = await retrieve_for_degraded(query)
+        answer = build_degraded_answer(query, documents)
+
+        logging.warning(msg={"event": "Degraded answer", "session_id": self.session_id, "documents": len(documents)})
+
+        state = self.state
+        state["documents"] = documents
+        state["final_answer"] = answer
+        state["messages"].append(AIMessage(content=answer))
+        state["error"] = None
+        response, state = self.return_message_and_state_from_state(state)
+        response.is_degraded = True
+        response.is_error = not documents
+        return response, state
+
     @staticmethod
     def return_message_and_state_from_state(state: AgentState) -> tuple[AgentResponse, AgentState]:
         state["next_action"] = None,
@@ -176,6 +223,49 @@ class Agent:
 
         return agent_state
 
+# Склейка одинаковых первых запросов (см. AGENT_COALESCE_FIRST_TURN)
+agent_flight = SingleFlight("agent_first_turn")
+
+
+async def run_agent_turn(
+        query: str,
+        session_id: str,
+        priority: PriorityEnum = PriorityEnum.INTERACTIVE
+) -> AgentResponse:
+    """Один ход диалога: загрузить состояние сессии, запустить агента, сохранить состояние"""
+    # Получаем или создаем состояние
+    state = await state_manager.get_state(session_id)
+    # Первый ход — сессия без истории: get_session_id заранее сохраняет пустое состояние для новых чатов
+    is_first_turn = not state or not state.get("messages")
+    if not state:
+        session_id, state = await state_manager.create_state(session_id)
+
+    async def invoke() -> tuple[AgentResponse, AgentState]:
+        agent = Agent(
+            message=query,
+            state=None,
+            session_id=session_id,
+            priority=priority
+        )
+        return await agent.invoke()
+
+    if is_first_turn and SETTINGS.AGENT_COALESCE_FIRST_TURN:
+        # Одинаковые первые вопросы из разных чатов разделяют один прогон графа
+        key = " ".join(query.lower().split())
+        shared_response, shared_state = await agent_flight.do(key, invoke)
+        # Копируем до любого await: общий результат не должен меняться под другими сессиями
+        new_state = copy.deepcopy(shared_state)
+        new_state["session_id"] = session_id
+        response_model = shared_response.model_copy(update={"session_id": session_id})
+    else:
+        response_model, new_state = await invoke()
+
+    # Сохраняем обновленное состояние
+    await state_manager.save_state(session_id, new_state)
+
+    return response_model
+
+
 if __name__ == '__main__':
     async def main():
         agent = Agent(
@@ -0,0 +1,313 @@
+"""
+Детерминированный сквозной бенчмарк агента без сети
+
+Сценарная модель (app/llm/fake.py), фейковый эмбеддер и Qdrant в памяти: измеряется только
+собственная стоимость графа — время узлов, копирование и сериализация состояния,
+запросы в секунду при N одновременных сессиях через Agent.invoke и через /invoke.
+
+Запуск: python -m app.benchmark --sessions 1 8 32 --requests 20 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import copy
+import json
+import logging
+import os
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    Distance,
+    PointStruct,
+    VectorParams,
+)
+
+from app.config import SETTINGS
+from app.graph import nodes
+from app.graph.enums import CollectionsEnum
+from app.llm.enums import LLMBackendEnum
+from app.llm.factory import get_chat_model
+from app.llm.fake import FAKE_EMBEDDING_SIZE
+from app.rag_client import rag_client
+from app.states import AgentState
+from app.telemetry import LLM_TOKENS
+
+QUERIES = [
+    "Расскажи про LLM",
+    "Что такое JavaScript?",
+    "Как работает Python?",
+    "Расскажи про машинное обучение",
+    "Что такое нейросети?",
+]
+TOPICS = ["LLM", "JavaScript", "Python", "машинное обучение", "нейросети", "Go", "Rust", "Kubernetes"]
+
+
+def use_offline_backends(llm_latency: float) -> None:
+    """Переключить модель и эмбеддер на фейковые; вызывать до создания агентов"""
+    from app.agent import get_compiled_graph
+
+    SETTINGS.LLM_BACKEND = LLMBackendEnum.FAKE
+    SETTINGS.FAKE_LLM_LATENCY = llm_latency
+    rag_client.embedding_model = None
+    get_chat_model.cache_clear()
+    get_compiled_graph.cache_clear()
+
+
+async def seed_collection(documents: int, seed: int = 42) -> None:
+    """Наполнить Qdrant в памяти синтетическими статьями и повесить алиас, как в рабочей схеме"""
+    rng = np.random.default_rng(seed)
+    client = AsyncQdrantClient(":memory:")
+    collection_name = f"{CollectionsEnum.HABR_ARTICLES}_v1"
+    await client.create_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=FAKE_EMBEDDING_SIZE, distance=Distance.COSINE)
+    )
+    texts = []
+    for i in range(documents):
+        topic = TOPICS[i % len(TOPICS)]
+        words = rng.choice(["статья", "пример", "код", "модель", "данные", "сервис", "запрос"], size=120)
+        # Предложения по 12 слов: есть что отбирать при сжатии контекста
+        texts.append(f"{topic}: " + ". ".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12)) + ".")
+    vectors = await rag_client.embeddings.aembed_documents(texts)
+    await client.upsert(
+        collection_name=collection_name,
+        points=[
+            PointStruct(
+                id=i,
+                vector=vector,
+                payload={
+                    "page_content": text,
+                    "metadata": {"source": f"article_{i}.txt", "file_path": f"article_{i}.txt", "chunk_index": 0}
+                }
+            )
+            for i, (text, vector) in enumerate(zip(texts, vectors))
+        ]
+    )
+    await client.update_collection_aliases(change_aliases_operations=[
+        CreateAliasOperation(create_alias=CreateAlias(
+            collection_name=collection_name, alias_name=CollectionsEnum.HABR_ARTICLES
+        ))
+    ])
+    rag_client.async_client = client
+
+
+class NodeTimings:
+    """Сбор времени выполнения узлов графа через node_observers"""
+
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def __call__(self, name: str, elapsed: float) -> None:
+        self.samples[str(name)].append(elapsed)
+
+    def reset(self) -> None:
+        self.samples.clear()
+
+    def summary(self) -> dict:
+        return {
+            name: {
+                "calls": len(values),
+                "mean_ms": float(np.mean(values)) * 1000,
+                "p95_ms": float(np.percentile(values, 95)) * 1000,
+                "total_ms": float(np.sum(values)) * 1000,
+            }
+            for name, values in sorted(self.samples.items())
+        }
+
+
+def latency_summary(latencies: list[float], elapsed: float) -> dict:
+    values = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "max_ms": float(values.max()),
+    }
+
+
+def prompt_tokens() -> float:
+    """Всего входных токенов LLM с начала процесса (сценарная модель считает их по длине промпта)"""
+    return sum(
+        sample.value
+        for metric in LLM_TOKENS.collect()
+        for sample in metric.samples
+        if sample.name.endswith("_total") and sample.labels.get("kind") == "prompt"
+    )
+
+
+async def run_sessions(sessions: int, requests: int, call) -> dict:
+    """N сессий параллельно, в каждой последовательные запросы"""
+    latencies = []
+    errors = 0
+    tokens_before = prompt_tokens()
+
+    async def session(index: int) -> None:
+        nonlocal errors
+        session_id = f"bench-{index}-{uuid.uuid4().hex[:8]}"
+        for i in range(requests):
+            started_at = time.perf_counter()
+            ok = await call(QUERIES[(index + i) % len(QUERIES)], session_id)
+            latencies.append(time.perf_counter() - started_at)
+            errors += not ok
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    return {
+        "sessions": sessions,
+        "errors": errors,
+        "prompt_tokens_per_turn": (prompt_tokens() - tokens_before) / len(latencies),
+        **latency_summary(latencies, time.perf_counter() - started_at),
+    }
+
+
+async def invoke_agent(query: str, session_id: str) -> bool:
+    from app.agent import Agent
+
+    response, _ = await Agent(message=query, session_id=session_id).invoke()
+    return not response.is_error
+
+
+def measure(call, repeat: int) -> float:
+    """Среднее время вызова в миллисекундах"""
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        call()
+    return (time.perf_counter() - started_at) / repeat * 1000
+
+
+async def state_costs(repeat: int) -> dict:
+    """Стоимость копирования (склейка первых ходов) и сериализации состояния (Redis) после полного хода"""
+    from app.agent import Agent
+    from app.state_manager import StateManager
+
+    _, state = await Agent(message=QUERIES[0], session_id="bench-state").invoke()
+    serialized = StateManager.serialize_state(copy.deepcopy(state))
+    # serialize_state меняет состояние: копии готовятся заранее, в замер попадает только сериализация
+    copies = [copy.deepcopy(state) for _ in range(repeat)]
+    return {
+        "state_bytes": len(serialized.encode("utf-8")),
+        "messages": len(state["messages"]),
+        "deepcopy_ms": measure(lambda: copy.deepcopy(state), repeat),
+        "serialize_ms": measure(lambda: StateManager.serialize_state(copies.pop()), repeat),
+        "deserialize_ms": measure(lambda: AgentState(**json.loads(serialized)), repeat),
+    }
+
+
+async def connect_state_store() -> str:
+    """Хранилище сессий для /invoke: fakeredis, если установлен, иначе Redis из REDIS_URL"""
+    from app.state_manager import state_manager
+
+    try:
+        from fakeredis import FakeAsyncRedis
+    except ImportError:
+        await state_manager.connect()
+        return SETTINGS.REDIS_URL
+    state_manager.redis_client = FakeAsyncRedis(decode_responses=True)
+    return "fakeredis"
+
+
+def api_caller(client):
+    async def call(query: str, session_id: str) -> bool:
+        response = await client.post("/invoke", json={"query": query}, headers={"X-Session-Id": session_id})
+        return response.status_code == 200 and not response.json().get("is_error")
+    return call
+
+
+async def run(args) -> dict:
+    use_offline_backends(args.llm_latency)
+    SETTINGS.RETRIEVAL_ADAPTIVE_K = not args.fixed_k
+    SETTINGS.RETRIEVAL_NEIGHBORS = args.neighbors
+    if args.compress is not None:
+        SETTINGS.CONTEXT_COMPRESSION_ENABLED = True
+        SETTINGS.CONTEXT_COMPRESSION_RATIO = args.compress
+    await seed_collection(args.documents)
+    timings = NodeTimings()
+    nodes.node_observers.append(timings)
+
+    report = {
+        "settings": {
+            "llm_latency_s": args.llm_latency,
+            "documents": args.documents,
+            "requests_per_session": args.requests,
+            "llm_model_max_concurrency": SETTINGS.LLM_MODEL_MAX_CONCURRENCY,
+            "adaptive_k": SETTINGS.RETRIEVAL_ADAPTIVE_K,
+            "neighbors": SETTINGS.RETRIEVAL_NEIGHBORS,
+            "compression_ratio": SETTINGS.CONTEXT_COMPRESSION_RATIO if SETTINGS.CONTEXT_COMPRESSION_ENABLED else None,
+        },
+        "agent": [],
+        "api": [],
+    }
+
+    # Прогрев: первые вызовы платят за импорт и инициализацию
+    await invoke_agent(QUERIES[0], "bench-warmup")
+    report["state"] = await state_costs(args.state_repeat)
+
+    timings.reset()
+    for sessions in args.sessions:
+        report["agent"].append(await run_sessions(sessions, args.requests, invoke_agent))
+    report["nodes"] = timings.summary()
+
+    if not args.skip_api:
+        import httpx
+        from app.main import app
+
+        report["settings"]["state_store"] = await connect_state_store()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for sessions in args.sessions:
+                report["api"].append(await run_sessions(sessions, args.requests, api_caller(client)))
+
+    nodes.node_observers.remove(timings)
+    return report
+
+
+def print_report(report: dict) -> None:
+    state = report["state"]
+    print(f"\n📦 Состояние: {state['state_bytes']} байт, {state['messages']} сообщений; "
+          f"deepcopy {state['deepcopy_ms']:.3f}ms, сериализация {state['serialize_ms']:.3f}ms, "
+          f"десериализация {state['deserialize_ms']:.3f}ms")
+    print("\n⏱️  Узлы графа:")
+    for name, row in report["nodes"].items():
+        print(f"   {name:<10} вызовов {row['calls']:<6} mean {row['mean_ms']:.2f}ms p95 {row['p95_ms']:.2f}ms")
+    for mode in ("agent", "api"):
+        for row in report[mode]:
+            print(f"🚀 {mode:<5} сессий {row['sessions']:<4} {row['rps']:.1f} rps, "
+                  f"p50 {row['p50_ms']:.1f}ms p95 {row['p95_ms']:.1f}ms, ошибок {row['errors']}, "
+                  f"входных токенов за ход {row['prompt_tokens_per_turn']:.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк агента без сети")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="Число одновременных сессий")
+    parser.add_argument("--requests", type=int, default=10, help="Запросов на сессию")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Имитация времени ответа модели (сек.)")
+    parser.add_argument("--documents", type=int, default=500, help="Документов в Qdrant в памяти")
+    parser.add_argument("--state-repeat", type=int, default=200, help="Повторов замера копирования/сериализации")
+    parser.add_argument("--skip-api", action="store_true", help="Не измерять /invoke")
+    parser.add_argument("--neighbors", type=int, default=0, help="Склеивать найденные чанки с ±N соседями")
+    parser.add_argument("--compress", type=float, help="Сжимать найденные документы до этой доли текста")
+    parser.add_argument("--fixed-k", action="store_true", help="Без адаптивного top-k: для сравнения токенов за ход")
+    parser.add_argument("--output", help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    # Узлы печатают сообщения в stdout — во время замеров вывод уходит в /dev/null
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчёт сохранён в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
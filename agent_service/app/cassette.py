@@ -0,0 +1,352 @@
+"""
+Запись и воспроизведение обращений к LLM и Qdrant («кассеты»)
+
+CASSETTE_MODE=record: каждый ход агента сохраняется в CASSETTE_DIR сжатым JSON — запрос пользователя,
+ответы LLM, результаты поиска, латентности, токены и последовательность узлов графа.
+CASSETTE_MODE=replay: вызовы обслуживаются из кассет по порядку, с исходной латентностью,
+умноженной на CASSETTE_LATENCY_SCALE. Так реальный трафик прогоняется офлайн на новой сборке.
+
+    python -m app.cassette replay --cassettes cassettes --output replays --latency-scale 0
+    python -m app.cassette compare cassettes replays
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from enum import StrEnum
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from app.config import SETTINGS
+from app.telemetry import llm_message
+
+# 2: ответы structured output хранятся как сообщение модели (raw), парсер применяется при воспроизведении
+CASSETTE_VERSION = 2
+
+
+class CassetteModeEnum(StrEnum):
+    OFF = "off"
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class InteractionKindEnum(StrEnum):
+    LLM = "llm"
+    SEARCH = "search"
+
+
+class CassetteMissError(Exception):
+    """В кассете нет записи для очередного вызова"""
+
+
+def canonical_request(request: Any) -> Any:
+    """Содержательная часть запроса: у сообщений — тип, текст и вызовы инструментов, без id и служебных полей"""
+    if isinstance(request, BaseMessage):
+        tool_calls = [(call["name"], canonical_request(call["args"])) for call in getattr(request, "tool_calls", [])]
+        return request.type, request.content, tool_calls
+    if isinstance(request, dict):
+        return sorted((str(key), canonical_request(value)) for key, value in request.items())
+    if isinstance(request, (list, tuple)):
+        return [canonical_request(item) for item in request]
+    return str(request)
+
+
+def request_fingerprint(request: Any) -> str:
+    return hashlib.sha256(repr(canonical_request(request)).encode("utf-8")).hexdigest()[:16]
+
+
+def encode_llm_response(response: Any) -> dict:
+    if isinstance(response, BaseMessage):
+        return {"type": "message", "data": message_to_dict(response)}
+    if isinstance(response, dict) and isinstance(response.get("raw"), BaseMessage):
+        # Structured output с include_raw: parsed не сохраняется — CustomParser разбирает raw
+        errors = response.get("parsing_errors")
+        return {"type": "structured", "data": {
+            "raw": message_to_dict(response["raw"]), "parsing_errors": str(errors) if errors else None
+        }}
+    return {"type": "value", "data": response}
+
+
+def decode_llm_response(encoded: dict) -> Any:
+    if encoded["type"] == "message":
+        return messages_from_dict([encoded["data"]])[0]
+    if encoded["type"] == "structured":
+        data = encoded["data"]
+        return {"raw": messages_from_dict([data["raw"]])[0], "parsed": None, "parsing_errors": data["parsing_errors"]}
+    return encoded["data"]
+
+
+def encode_documents(documents: list[Document]) -> list[dict]:
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+
+
+def decode_documents(encoded: list[dict]) -> list[Document]:
+    return [Document(page_content=doc["page_content"], metadata=dict(doc["metadata"])) for doc in encoded]
+
+
+class Cassette:
+    """Запись одного хода агента; в режиме воспроизведения отдаёт вызовы по порядку для каждого вида"""
+
+    def __init__(
+            self,
+            session_id: str,
+            query: str,
+            mode: CassetteModeEnum,
+            source: Optional[dict] = None,
+            latency_scale: float = 1.0
+    ) -> None:
+        self.session_id = session_id
+        self.query = query
+        self.mode = mode
+        self.source = source
+        self.latency_scale = latency_scale
+        self.interactions: list[dict] = []
+        self.nodes: list[str] = []
+        self.misses = 0
+        self.mismatches = 0
+        self.started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+        self._queues: dict[str, deque] = defaultdict(deque)
+        for interaction in (source or {}).get("interactions", []):
+            self._queues[interaction["kind"]].append(interaction)
+
+    async def llm(self, request: Any, call: Callable[[], Awaitable[Any]]) -> Any:
+        return await self._play(InteractionKindEnum.LLM, request, call, encode_llm_response, decode_llm_response)
+
+    async def search(self, request: dict, call: Callable[[], Awaitable[list[Document]]]) -> list[Document]:
+        return await self._play(InteractionKindEnum.SEARCH, request, call, encode_documents, decode_documents)
+
+    async def _play(self, kind: str, request: Any, call: Callable, encode: Callable, decode: Callable) -> Any:
+        fingerprint = request_fingerprint(request)
+        entry = {"kind": kind, "request_hash": fingerprint, "request_chars": len(repr(canonical_request(request)))}
+        if kind == InteractionKindEnum.SEARCH:
+            entry["request"] = request
+
+        if self.mode == CassetteModeEnum.REPLAY:
+            if not self._queues[kind]:
+                self.misses += 1
+                raise CassetteMissError(f"Нет записи {kind} #{len(self.interactions)} в кассете {self.session_id}")
+            recorded = self._queues[kind].popleft()
+            # Промпт изменился относительно записи — ответ всё равно отдаётся, расхождение учитывается
+            if recorded["request_hash"] != fingerprint:
+                self.mismatches += 1
+            if self.latency_scale:
+                await asyncio.sleep(recorded["latency"] * self.latency_scale)
+            entry.update(latency=recorded["latency"], tokens=recorded.get("tokens"), response=recorded["response"])
+            self.interactions.append(entry)
+            return decode(recorded["response"])
+
+        started_at = time.perf_counter()
+        response = await call()
+        entry.update(
+            latency=time.perf_counter() - started_at,
+            tokens=getattr(llm_message(response), "usage_metadata", None),
+            response=encode(response)
+        )
+        self.interactions.append(entry)
+        return response
+
+    def to_dict(self) -> dict:
+        return {
+            "version": CASSETTE_VERSION,
+            "mode": self.mode,
+            "session_id": self.session_id,
+            "query": self.query,
+            "recorded_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "duration": self.duration,
+            "nodes": self.nodes,
+            "misses": self.misses,
+            "mismatches": self.mismatches,
+            "source": (self.source or {}).get("file"),
+            "interactions": self.interactions,
+        }
+
+    def save(self, directory: Path) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = directory / f"{stamp}-{self.session_id}-{uuid.uuid4().hex[:6]}.json.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"), default=str)
+        return path
+
+
+def load_cassette(path: Path) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        data = json.load(f)
+    data["file"] = path.name
+    return data
+
+
+def load_cassettes(directory: Path) -> list[dict]:
+    cassettes = []
+    for path in sorted(directory.glob("*.json.gz")):
+        cassette = load_cassette(path)
+        # Старые кассеты хранят разобранные ответы structured output и без токенов — их нужно перезаписать
+        if cassette.get("version") != CASSETTE_VERSION:
+            logging.warning(msg={"event": "Skipping cassette of another version", "file": path.name,
+                                 "version": cassette.get("version")})
+            continue
+        cassettes.append(cassette)
+    return cassettes
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class CassetteLibrary:
+    """Кассеты для воспроизведения в сервисе: подбираются по тексту запроса, по кругу"""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._by_query: Optional[dict[str, deque]] = None
+
+    def find(self, query: str) -> Optional[dict]:
+        if self._by_query is None:
+            self._by_query = defaultdict(deque)
+            for cassette in load_cassettes(self.directory):
+                self._by_query[normalize_query(cassette["query"])].append(cassette)
+        candidates = self._by_query.get(normalize_query(query))
+        if not candidates:
+            return None
+        candidates.rotate(-1)
+        return candidates[-1]
+
+
+current_cassette: contextvars.ContextVar[Optional[Cassette]] = contextvars.ContextVar("current_cassette", default=None)
+cassette_library = CassetteLibrary(Path(SETTINGS.CASSETTE_DIR))
+
+
+def record_node(name: str, elapsed: float) -> None:
+    """Наблюдатель узлов графа: последовательность узлов попадает в текущую кассету"""
+    cassette = current_cassette.get()
+    if cassette is not None:
+        cassette.nodes.append(str(name))
+
+
+@contextlib.asynccontextmanager
+async def turn_cassette(session_id: str, query: str):
+    """Кассета на ход агента согласно CASSETTE_MODE; уже установленная (драйвер воспроизведения) не меняется"""
+    if current_cassette.get() is not None or SETTINGS.CASSETTE_MODE == CassetteModeEnum.OFF:
+        yield current_cassette.get()
+        return
+
+    if SETTINGS.CASSETTE_MODE == CassetteModeEnum.REPLAY:
+        source = cassette_library.find(query)
+        if source is None:
+            logging.warning(msg={"event": "Cassette not found", "session_id": session_id, "query": query})
+            yield None
+            return
+        cassette = Cassette(session_id, query, CassetteModeEnum.REPLAY, source, SETTINGS.CASSETTE_LATENCY_SCALE)
+    else:
+        cassette = Cassette(session_id, query, CassetteModeEnum.RECORD)
+
+    token = current_cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        current_cassette.reset(token)
+        cassette.duration = time.perf_counter() - cassette.started_at
+        if cassette.mode == CassetteModeEnum.RECORD:
+            await asyncio.to_thread(cassette.save, Path(SETTINGS.CASSETTE_DIR))
+
+
+async def cassette_call(kind: InteractionKindEnum, request: Any, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Вызов через текущую кассету (запись/воспроизведение) или напрямую, если кассеты нет"""
+    cassette = current_cassette.get()
+    if cassette is None:
+        return await call()
+    if kind == InteractionKindEnum.LLM:
+        return await cassette.llm(request, call)
+    return await cassette.search(request, call)
+
+
+# ------------------------- офлайн-воспроизведение и сравнение -------------------------
+
+async def replay_directory(source_dir: Path, output_dir: Path, latency_scale: float) -> None:
+    """Прогнать записанные ходы через текущую сборку агента и сохранить новые кассеты"""
+    from app.agent import Agent
+
+    for source in load_cassettes(source_dir):
+        cassette = Cassette(source["session_id"], source["query"], CassetteModeEnum.REPLAY, source, latency_scale)
+        token = current_cassette.set(cassette)
+        try:
+            response, _ = await Agent(message=source["query"], session_id=source["session_id"]).invoke()
+        finally:
+            current_cassette.reset(token)
+        cassette.duration = time.perf_counter() - cassette.started_at
+        path = cassette.save(output_dir)
+        print(f"{'❌' if response.is_error else '✅'} {source['file']} -> {path.name}: "
+              f"{cassette.duration * 1000:.0f}ms, расхождений {cassette.mismatches}, промахов {cassette.misses}")
+
+
+def summarize(cassettes: list[dict]) -> dict:
+    """Сводка по набору кассет: вызовы, токены, размер промптов, узлы графа"""
+    summary = Counter()
+    nodes = Counter()
+    for cassette in cassettes:
+        summary["turns"] += 1
+        summary["duration_ms"] += (cassette.get("duration") or 0) * 1000
+        summary["misses"] += cassette.get("misses", 0)
+        summary["mismatches"] += cassette.get("mismatches", 0)
+        nodes.update(cassette.get("nodes", []))
+        for interaction in cassette["interactions"]:
+            summary[f"{interaction['kind']}_calls"] += 1
+            summary[f"{interaction['kind']}_latency_ms"] += interaction["latency"] * 1000
+            summary[f"{interaction['kind']}_request_chars"] += interaction["request_chars"]
+            for key in ("input_tokens", "output_tokens"):
+                summary[key] += (interaction.get("tokens") or {}).get(key, 0)
+    return {"totals": dict(summary), "nodes": dict(nodes)}
+
+
+def compare_summaries(base: dict, candidate: dict) -> list[tuple[str, float, float]]:
+    rows = []
+    for section in ("totals", "nodes"):
+        for key in sorted(set(base[section]) | set(candidate[section])):
+            rows.append((f"{section}.{key}", base[section].get(key, 0), candidate[section].get(key, 0)))
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Кассеты вызовов LLM и Qdrant")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subparsers.add_parser("replay", help="Воспроизвести кассеты на текущей сборке")
+    replay_parser.add_argument("--cassettes", type=Path, default=Path(SETTINGS.CASSETTE_DIR))
+    replay_parser.add_argument("--output", type=Path, required=True)
+    replay_parser.add_argument("--latency-scale", type=float, default=SETTINGS.CASSETTE_LATENCY_SCALE)
+
+    compare_parser = subparsers.add_parser("compare", help="Сравнить два набора кассет")
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("candidate", type=Path)
+    compare_parser.add_argument("--output", type=Path, help="Сохранить сравнение в JSON")
+
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        asyncio.run(replay_directory(args.cassettes, args.output, args.latency_scale))
+        return
+
+    base, candidate = summarize(load_cassettes(args.base)), summarize(load_cassettes(args.candidate))
+    rows = compare_summaries(base, candidate)
+    print(f"{'метрика':<36}{'база':>14}{'кандидат':>14}{'Δ':>12}")
+    for key, before, after in rows:
+        print(f"{key:<36}{before:>14.0f}{after:>14.0f}{after - before:>+12.0f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"base": base, "candidate": candidate}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from enum import StrEnum
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+from app.config import SETTINGS
+from app.llm.errors import get_status_code
+from app.llm.resilience import is_retryable
+
+T = TypeVar("T")
+
+
+class CircuitStateEnum(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenException(Exception):
+    """Вызов отклонён: предохранитель разомкнут"""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_qdrant_failure(exc: BaseException) -> bool:
+    """Отказ инфраструктуры Qdrant (недоступность, таймаут, 5xx), а не ошибка запроса"""
+    if isinstance(exc, UnexpectedResponse):
+        return exc.status_code is None or exc.status_code >= 500
+    return isinstance(exc, (ResponseHandlingException, httpx.TransportError, httpx.TimeoutException, TimeoutError))
+
+
+def is_llm_failure(exc: BaseException) -> bool:
+    """Отказ LLM (недоступность, таймаут, 5xx); 429 — сигнал планировщику снизить нагрузку, а не отказ"""
+    return is_retryable(exc) and get_status_code(exc) != 429
+
+
+class CircuitBreaker:
+    """Предохранитель: после серии отказов перестаёт вызывать зависимость на recovery_timeout секунд"""
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = 5,
+            recovery_timeout: float = 30.0,
+            half_open_max_calls: int = 1,
+            is_failure: Callable[[BaseException], bool] = is_retryable
+    ) -> None:
+        self.name = name
+        self.failure_threshold = int(failure_threshold)
+        self.recovery_timeout = float(recovery_timeout)
+        self.half_open_max_calls = int(half_open_max_calls)
+        self.is_failure = is_failure
+
+        self._state = CircuitStateEnum.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> CircuitStateEnum:
+        if self._state == CircuitStateEnum.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = CircuitStateEnum.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == CircuitStateEnum.OPEN
+
+    def _allow(self) -> None:
+        state = self.state
+        if state == CircuitStateEnum.OPEN:
+            self._rejected += 1
+            raise CircuitOpenException(self.name, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        if state == CircuitStateEnum.HALF_OPEN:
+            # В полуоткрытом состоянии пропускаем только пробные вызовы
+            if self._half_open_calls >= self.half_open_max_calls:
+                self._rejected += 1
+                raise CircuitOpenException(self.name, self.recovery_timeout)
+            self._half_open_calls += 1
+
+    def record_success(self) -> None:
+        if self._state != CircuitStateEnum.CLOSED:
+            logging.info(msg={"event": "Circuit closed", "circuit": self.name})
+        self._state = CircuitStateEnum.CLOSED
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == CircuitStateEnum.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._state = CircuitStateEnum.OPEN
+            self._opened_at = time.monotonic()
+            logging.warning(msg={"event": "Circuit opened", "circuit": self.name, "failures": self._failures})
+
+    async def call(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Выполнить вызов под защитой предохранителя"""
+        self._allow()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            if self._state == CircuitStateEnum.HALF_OPEN:
+                # Отменённый пробный вызов не должен навсегда занять слот
+                self._half_open_calls -= 1
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            elif self._state == CircuitStateEnum.HALF_OPEN:
+                # Не инфраструктурная ошибка: зависимость отвечает, пробный вызов засчитываем
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state.value,
+            "failures": self._failures,
+            "rejected": self._rejected,
+        }
+
+
+# Глобальные предохранители внешних зависимостей
+llm_breaker = CircuitBreaker(
+    name="llm",
+    failure_threshold=SETTINGS.LLM_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=SETTINGS.LLM_BREAKER_RECOVERY_TIMEOUT,
+    is_failure=is_llm_failure,
+)
+qdrant_breaker = CircuitBreaker(
+    name="qdrant",
+    failure_threshold=SETTINGS.QDRANT_BREAKER_FAILURE_THRESHOLD,
+    recovery_timeout=SETTINGS.QDRANT_BREAKER_RECOVERY_TIMEOUT,
+    is_failure=is_qdrant_failure,
+)
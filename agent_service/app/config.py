@@ -26,15 +26,126 @@ class Settings(BaseSettings):
     QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")
     QDRANT_API_KEY: Optional[str] = os.getenv("QDRANT_API_KEY", None)
     QDRANT_COLLECTION: str = os.getenv("DOCUMENTS", None)
+    # Ширина поиска по графу HNSW (None — значение коллекции); больше — выше полнота, медленнее
+    QDRANT_HNSW_EF: Optional[int] = os.getenv("QDRANT_HNSW_EF", None)
+    # Пересчёт скоров по исходным векторам для квантованных коллекций и коэффициент перевыборки
+    QDRANT_QUANTIZATION_RESCORE: bool = os.getenv("QDRANT_QUANTIZATION_RESCORE", True)
+    QDRANT_QUANTIZATION_OVERSAMPLING: float = os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING", 2.0)
+
+    # Кэш результатов поиска: ссылки на точки в LRU и Redis, тексты чанков в LRU процесса
+    SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", True)
+    SEARCH_CACHE_SIZE: int = os.getenv("SEARCH_CACHE_SIZE", 1024)
+    SEARCH_CACHE_PAYLOAD_SIZE: int = os.getenv("SEARCH_CACHE_PAYLOAD_SIZE", 4096)
+    SEARCH_CACHE_TTL: int = os.getenv("SEARCH_CACHE_TTL", 3600)
+    # Как долго считать известной коллекцию за алиасом (сек.)
+    SEARCH_CACHE_ALIAS_TTL: float = os.getenv("SEARCH_CACHE_ALIAS_TTL", 30.0)
+
+    # Адаптивный top-k: из RETRIEVAL_MAX_K кандидатов в контекст попадают документы не ниже порога скора
+    # и до первого относительного падения скора больше RETRIEVAL_SCORE_DROP; не меньше RETRIEVAL_MIN_K
+    RETRIEVAL_ADAPTIVE_K: bool = os.getenv("RETRIEVAL_ADAPTIVE_K", True)
+    RETRIEVAL_MAX_K: int = os.getenv("RETRIEVAL_MAX_K", 6)
+    RETRIEVAL_MIN_K: int = os.getenv("RETRIEVAL_MIN_K", 1)
+    RETRIEVAL_SCORE_FLOOR: Optional[float] = os.getenv("RETRIEVAL_SCORE_FLOOR", None)
+    RETRIEVAL_SCORE_DROP: Optional[float] = os.getenv("RETRIEVAL_SCORE_DROP", 0.2)
+    # Подавление почти-дубликатов и MMR-отбор RETRIEVAL_MAX_K документов из RETRIEVAL_FETCH_K кандидатов
+    RETRIEVAL_DIVERSIFY: bool = os.getenv("RETRIEVAL_DIVERSIFY", True)
+    RETRIEVAL_FETCH_K: int = os.getenv("RETRIEVAL_FETCH_K", 12)
+    # 1 — только релевантность, 0 — только разнообразие
+    RETRIEVAL_MMR_LAMBDA: float = os.getenv("RETRIEVAL_MMR_LAMBDA", 0.7)
+    # Косинус шинглов, начиная с которого чанки считаются дубликатами
+    RETRIEVAL_DUPLICATE_THRESHOLD: float = os.getenv("RETRIEVAL_DUPLICATE_THRESHOLD", 0.8)
+    # Локальный реранкер: off | features (признаки, без модели) | onnx (кросс-энкодер из RERANKER_ONNX_PATH)
+    RERANKER: str = os.getenv("RERANKER", "off")
+    # Кандидатов из поиска для переранжирования
+    RERANK_FETCH_K: int = os.getenv("RERANK_FETCH_K", 30)
+    # Каталог с model.onnx и tokenizer.json
+    RERANKER_ONNX_PATH: Optional[str] = os.getenv("RERANKER_ONNX_PATH", None)
+    RERANKER_MAX_LENGTH: int = os.getenv("RERANKER_MAX_LENGTH", 512)
+    # Сколько соседних чанков с каждой стороны дочитывать к найденному (0 — выключено) и размер их кэша
+    RETRIEVAL_NEIGHBORS: int = os.getenv("RETRIEVAL_NEIGHBORS", 0)
+    RETRIEVAL_NEIGHBORS_CACHE_SIZE: int = os.getenv("RETRIEVAL_NEIGHBORS_CACHE_SIZE", 4096)
+    # Экстрактивное сжатие документов: остаются лучшие по запросу предложения, не длиннее доли RATIO от текста
+    CONTEXT_COMPRESSION_ENABLED: bool = os.getenv("CONTEXT_COMPRESSION_ENABLED", False)
+    CONTEXT_COMPRESSION_RATIO: float = os.getenv("CONTEXT_COMPRESSION_RATIO", 0.4)
+    CONTEXT_COMPRESSION_MIN_SENTENCES: int = os.getenv("CONTEXT_COMPRESSION_MIN_SENTENCES", 2)
 
     # LLM (пример для OpenAI)
     GIGACHAT_CREDENTIALS: str = os.getenv("GIGACHAT_CREDENTIALS", None)
+    GIGACHAT_SCOPE: Optional[str] = os.getenv("GIGACHAT_SCOPE", None)
+    # Токен обновляется заранее, за столько секунд до истечения
+    GIGACHAT_TOKEN_REFRESH_MARGIN: float = os.getenv("GIGACHAT_TOKEN_REFRESH_MARGIN", 60.0)
     MODEL: str = os.getenv("MODEL", None)
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", None)
+    # gigachat или fake — сценарная модель без сети для бенчмарков и нагрузочных тестов
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "gigachat")
+    FAKE_LLM_LATENCY: float = os.getenv("FAKE_LLM_LATENCY", 0.0)
+    FAKE_LLM_TOOL_ROUNDS: int = os.getenv("FAKE_LLM_TOOL_ROUNDS", 1)
+
+    # Кассеты вызовов LLM и Qdrant: off, record или replay
+    CASSETTE_MODE: str = os.getenv("CASSETTE_MODE", "off")
+    CASSETTE_DIR: str = os.getenv("CASSETTE_DIR", "cassettes")
+    # Множитель записанной латентности при воспроизведении (0 — без задержек)
+    CASSETTE_LATENCY_SCALE: float = os.getenv("CASSETTE_LATENCY_SCALE", 1.0)
+
+    # Трассировка OpenTelemetry (нужен opentelemetry-sdk и opentelemetry-exporter-otlp)
+    OTEL_ENABLED: bool = os.getenv("OTEL_ENABLED", False)
+    OTEL_SERVICE_NAME: str = os.getenv("OTEL_SERVICE_NAME", "agent_service")
+
+    # Детектор блокировок цикла событий и профилировщик /debug/profile
+    LOOP_MONITOR_ENABLED: bool = os.getenv("LOOP_MONITOR_ENABLED", True)
+    LOOP_MONITOR_INTERVAL: float = os.getenv("LOOP_MONITOR_INTERVAL", 0.1)
+    LOOP_LAG_THRESHOLD: float = os.getenv("LOOP_LAG_THRESHOLD", 0.25)
+    # Без токена эндпоинт профилировщика выключен
+    DEBUG_PROFILE_TOKEN: Optional[str] = os.getenv("DEBUG_PROFILE_TOKEN", None)
+    DEBUG_PROFILE_MAX_SECONDS: float = os.getenv("DEBUG_PROFILE_MAX_SECONDS", 60.0)
+
+    # Фоновые проверки зависимостей для /health, /livez, /readyz
+    HEALTH_PROBE_INTERVAL: float = os.getenv("HEALTH_PROBE_INTERVAL", 10.0)
+    HEALTH_PROBE_TIMEOUT: float = os.getenv("HEALTH_PROBE_TIMEOUT", 3.0)
+    # Результат старше этого считается неизвестным (сек.)
+    HEALTH_STALE_AFTER: float = os.getenv("HEALTH_STALE_AFTER", 30.0)
+
+    # Прогрев при старте: таймаут каждого шага (сек.)
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", True)
+    WARMUP_TIMEOUT: float = os.getenv("WARMUP_TIMEOUT", 30.0)
 
     # Агент
     AGENT_MAX_ITERATIONS: int = os.getenv("AGENT_MAX_ITERATIONS", None)
     AGENT_MAX_TOKENS: int = os.getenv("AGENT_MAX_TOKENS", None)
+    AGENT_COALESCE_FIRST_TURN: bool = os.getenv("AGENT_COALESCE_FIRST_TURN", False)
+
+    # Планировщик вызовов LLM
+    LLM_MAX_CONCURRENCY: int = os.getenv("LLM_MAX_CONCURRENCY", 16)
+    LLM_MODEL_MAX_CONCURRENCY: int = os.getenv("LLM_MODEL_MAX_CONCURRENCY", 8)
+    LLM_MIN_CONCURRENCY: int = os.getenv("LLM_MIN_CONCURRENCY", 1)
+    LLM_TARGET_LATENCY: float = os.getenv("LLM_TARGET_LATENCY", 20.0)
+    LLM_QUEUE_MAX_SIZE: int = os.getenv("LLM_QUEUE_MAX_SIZE", 64)
+    LLM_BACKGROUND_QUEUE_MAX_SIZE: int = os.getenv("LLM_BACKGROUND_QUEUE_MAX_SIZE", 16)
+
+    # Повторы и хеджирование вызовов LLM
+    AGENT_REQUEST_TIMEOUT: float = os.getenv("AGENT_REQUEST_TIMEOUT", 110.0)
+    LLM_RETRY_ATTEMPTS: int = os.getenv("LLM_RETRY_ATTEMPTS", 3)
+    LLM_RETRY_BACKOFF: float = os.getenv("LLM_RETRY_BACKOFF", 0.5)
+    LLM_RETRY_BACKOFF_MAX: float = os.getenv("LLM_RETRY_BACKOFF_MAX", 8.0)
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", False)
+    LLM_HEDGE_QUANTILE: float = os.getenv("LLM_HEDGE_QUANTILE", 0.95)
+
+    # Предохранители (circuit breakers)
+    LLM_BREAKER_FAILURE_THRESHOLD: int = os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5)
+    LLM_BREAKER_RECOVERY_TIMEOUT: float = os.getenv("LLM_BREAKER_RECOVERY_TIMEOUT", 30.0)
+    QDRANT_BREAKER_FAILURE_THRESHOLD: int = os.getenv("QDRANT_BREAKER_FAILURE_THRESHOLD", 5)
+    QDRANT_BREAKER_RECOVERY_TIMEOUT: float = os.getenv("QDRANT_BREAKER_RECOVERY_TIMEOUT", 15.0)
+
+    # Асинхронные задания (Redis Streams)
+    JOB_RESULT_TTL: int = os.getenv("JOB_RESULT_TTL", 3600)
+    JOB_QUEUE_MAX_SIZE: int = os.getenv("JOB_QUEUE_MAX_SIZE", 1000)
+    JOB_STREAM_MAXLEN: int = os.getenv("JOB_STREAM_MAXLEN", 10000)
+    JOB_CLAIM_IDLE_MS: int = os.getenv("JOB_CLAIM_IDLE_MS", 180000)
+    JOB_MAX_DELIVERIES: int = os.getenv("JOB_MAX_DELIVERIES", 3)
+    JOB_READ_BLOCK_MS: int = os.getenv("JOB_READ_BLOCK_MS", 5000)
+    JOB_SSE_KEEPALIVE: float = os.getenv("JOB_SSE_KEEPALIVE", 15.0)
+    JOB_WORKER_PROCESSES: int = os.getenv("JOB_WORKER_PROCESSES", 2)
+    JOB_WORKER_CONCURRENCY: int = os.getenv("JOB_WORKER_CONCURRENCY", 4)
 
 
 SETTINGS = Settings()
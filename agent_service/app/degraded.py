@@ -0,0 +1,77 @@
+import logging
+import math
+import re
+
+from app.graph.enums import CollectionsEnum
+from app.llm.tools.rag import Doc
+from app.rag_client import rag_client
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+")
+WORD_RE = re.compile(r"\w{3,}", re.UNICODE)
+
+DEGRADED_HEADER = (
+    "Сервис генерации ответов сейчас перегружен или недоступен, поэтому ниже приведены "
+    "наиболее релевантные фрагменты из базы знаний без обработки языковой моделью."
+)
+DEGRADED_EMPTY = (
+    "Во время обработки вашего запроса произошли технические неполадки. Пожалуйста, попробуйте повторить запрос позже."
+)
+
+
+def _terms(text: str) -> set[str]:
+    return {word.lower() for word in WORD_RE.findall(text)}
+
+
+def extractive_summary(query: str, documents: list[Doc], max_sentences: int = 3) -> list[str]:
+    """Выбрать из документов предложения с наибольшим пересечением с запросом"""
+    query_terms = _terms(query)
+    candidates = []
+    for doc_index, doc in enumerate(documents):
+        for sentence_index, sentence in enumerate(SENTENCE_SPLIT_RE.split(doc.page_content)):
+            sentence = sentence.strip()
+            sentence_terms = _terms(sentence)
+            if not sentence_terms:
+                continue
+            # Нормируем на длину, чтобы не выигрывали просто длинные предложения
+            score = len(query_terms & sentence_terms) / math.sqrt(len(sentence_terms))
+            if score > 0:
+                candidates.append((score, doc_index, sentence_index, sentence))
+
+    best = sorted(candidates, key=lambda item: item[0], reverse=True)[:max_sentences]
+    # Возвращаем в порядке следования в источниках, чтобы выжимка читалась связно
+    return [sentence for _, _, _, sentence in sorted(best, key=lambda item: (item[1], item[2]))]
+
+
+def build_degraded_answer(query: str, documents: list[Doc], snippet_size: int = 300) -> str:
+    """Ответ без LLM: выжимка и топ фрагментов с источниками"""
+    if not documents:
+        return DEGRADED_EMPTY
+
+    parts = [DEGRADED_HEADER]
+    summary = extractive_summary(query, documents)
+    if summary:
+        parts.append("Кратко: " + " ".join(summary))
+
+    fragments = []
+    for index, doc in enumerate(documents, 1):
+        snippet = doc.page_content[:snippet_size].rstrip()
+        if len(doc.page_content) > snippet_size:
+            snippet += "…"
+        fragments.append(f"[{index}] {doc.source}\n{snippet}")
+    parts.append("\n\n".join(fragments))
+
+    return "\n\n".join(parts)
+
+
+async def retrieve_for_degraded(query: str, k: int = 4) -> list[Doc]:
+    """Поиск по основной коллекции в обход графа (без участия LLM)"""
+    try:
+        docs = await rag_client.search(
+            collection_name=CollectionsEnum.HABR_ARTICLES,
+            query=query,
+            k=k
+        )
+    except Exception as e:
+        logging.error(msg={"event": "Degraded retrieval failed", "error": repr(e)})
+        return []
+    return [Doc.from_document(it) for it in docs]
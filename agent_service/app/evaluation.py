@@ -0,0 +1,376 @@
+"""
+Офлайн-оценка поиска: recall@k, MRR, nDCG@k и латентность p50/p95 на эталонном наборе запросов
+
+Эталон — JSONL, по строке на запрос:
+    {"id": "q1", "query": "...", "relevant": [{"file_path": "a.txt", "char_start": 0, "char_end": 900, "grade": 2}]}
+Найденный чанк релевантен, если совпадает file_path (или source) и его диапазон символов пересекается
+с эталонным; без char_start/char_end релевантен любой чанк файла. Так разметка переживает смену чанкера.
+
+Запуск:
+    python -m app.evaluation run --k 6 --output report.json --baseline data/eval/baseline.json
+    python -m app.evaluation bootstrap --size 100
+"""
+import argparse
+import asyncio
+import functools
+import json
+import math
+import random
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import SETTINGS
+from app.graph.enums import CollectionsEnum
+from app.rag_client import rag_client
+from app.retrieval.cutoff import estimate_tokens
+from app.retrieval.enums import RerankerEnum
+from app.retrieval.pipeline import RefineConfig, fetch_k, refine
+from app.retrieval.rerank import Reranker, create_reranker
+
+EVAL_DIR = Path(__file__).resolve().parents[2] / "data" / "eval"
+GOLD_PATH = EVAL_DIR / "gold.jsonl"
+BASELINE_PATH = EVAL_DIR / "baseline.json"
+
+# Метрики качества: падение больше допуска считается регрессией
+QUALITY_METRICS = ("recall", "mrr", "ndcg", "hit_rate")
+
+
+@dataclass
+class RetrievalConfig:
+    """Конфигурация поиска, которую оценивает прогон"""
+    name: str = "default"
+    collection_name: str = CollectionsEnum.HABR_ARTICLES
+    k: int = 6
+    hnsw_ef: Optional[int] = None
+    timeout: int = 15
+    # Адаптивный top-k: отсечение по порогу и падению скора среди k кандидатов
+    adaptive: bool = False
+    score_floor: Optional[float] = None
+    score_drop: Optional[float] = None
+    min_k: int = 1
+    # Переранжирование rerank_fetch_k кандидатов: off | features | onnx
+    reranker: str = RerankerEnum.OFF
+    rerank_fetch_k: int = 30
+    # MMR-отбор k документов из fetch_k кандидатов с подавлением почти-дубликатов
+    diversify: bool = False
+    fetch_k: Optional[int] = None
+    mmr_lambda: float = 0.7
+    duplicate_threshold: float = 0.8
+    # Соседних чанков с каждой стороны, склеиваемых с найденным
+    neighbors: int = 0
+    # Доля текста документов после экстрактивного сжатия (1 — без сжатия); метрики поиска не меняет, только контекст
+    compression_ratio: float = 1.0
+    compression_min_sentences: int = SETTINGS.CONTEXT_COMPRESSION_MIN_SENTENCES
+
+
+@dataclass
+class GoldQuery:
+    id: str
+    query: str
+    relevant: list[dict] = field(default_factory=list)
+
+
+def load_gold(path: Path) -> list[GoldQuery]:
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                queries.append(GoldQuery(id=str(item["id"]), query=item["query"], relevant=item["relevant"]))
+    return queries
+
+
+@functools.lru_cache(maxsize=None)
+def get_reranker(kind: str) -> Optional[Reranker]:
+    return create_reranker(kind, SETTINGS.RERANKER_ONNX_PATH)
+
+
+def refine_config(config: RetrievalConfig) -> RefineConfig:
+    """Параметры стадий обработки выдачи для оцениваемой конфигурации"""
+    return RefineConfig(
+        max_k=config.k,
+        reranker=get_reranker(config.reranker),
+        rerank_fetch_k=config.rerank_fetch_k,
+        diversify=config.diversify,
+        fetch_k=config.fetch_k or config.k,
+        mmr_lambda=config.mmr_lambda,
+        duplicate_threshold=config.duplicate_threshold,
+        adaptive_k=config.adaptive,
+        score_floor=config.score_floor,
+        score_drop=config.score_drop,
+        min_k=config.min_k,
+        neighbors=config.neighbors,
+        compression_ratio=config.compression_ratio,
+        compression_min_sentences=config.compression_min_sentences,
+    )
+
+
+async def retrieve(config: RetrievalConfig, query: str) -> list[Document]:
+    """Поиск тем же путём, что и у агента: rag_client.search и refine из app.retrieval.pipeline"""
+    stages = refine_config(config)
+    documents = await rag_client.search(
+        collection_name=config.collection_name,
+        query=query,
+        k=fetch_k(stages),
+        timeout=config.timeout,
+        hnsw_ef=config.hnsw_ef
+    )
+    return await refine(config.collection_name, query, documents, stages)
+
+
+def matches(document: Document, gold: dict) -> bool:
+    metadata = document.metadata
+    if "file_path" in gold:
+        if metadata.get("file_path") != gold["file_path"]:
+            return False
+    elif metadata.get("source") != gold.get("source"):
+        return False
+    if gold.get("char_start") is None or metadata.get("char_start") is None:
+        return True
+    return metadata["char_start"] < gold["char_end"] and gold["char_start"] < metadata["char_end"]
+
+
+def score_query(documents: list[Document], relevant: list[dict], k: int) -> dict:
+    """
+    Метрики одного запроса. Каждый эталонный фрагмент засчитывается один раз —
+    дубликаты одного и того же фрагмента в выдаче не завышают recall и nDCG
+    """
+    gains = []
+    found = set()
+    first_rank = None
+    for rank, document in enumerate(documents[:k], start=1):
+        gain = 0.0
+        for i, gold in enumerate(relevant):
+            if i not in found and matches(document, gold):
+                found.add(i)
+                gain = float(gold.get("grade", 1))
+                first_rank = first_rank or rank
+                break
+        gains.append(gain)
+    dcg = sum(gain / math.log2(rank + 1) for rank, gain in enumerate(gains, start=1))
+    ideal = sorted((float(gold.get("grade", 1)) for gold in relevant), reverse=True)[:k]
+    idcg = sum(gain / math.log2(rank + 1) for rank, gain in enumerate(ideal, start=1))
+    return {
+        "recall": len(found) / len(relevant) if relevant else 0.0,
+        "mrr": 1.0 / first_rank if first_rank else 0.0,
+        "ndcg": dcg / idcg if idcg else 0.0,
+        "hit_rate": 1.0 if found else 0.0,
+    }
+
+
+async def evaluate(config: RetrievalConfig, gold_queries: list[GoldQuery], warmup: int = 1) -> dict:
+    """Прогнать эталонные запросы через поиск и собрать отчёт"""
+    for gold in gold_queries[:warmup]:
+        # Прогрев: первый запрос платит за соединения и получение токена
+        await retrieve(config, gold.query)
+
+    per_query = []
+    latencies = []
+    for gold in gold_queries:
+        started_at = time.perf_counter()
+        documents = await retrieve(config, gold.query)
+        latency = time.perf_counter() - started_at
+        latencies.append(latency)
+        per_query.append({
+            "id": gold.id,
+            "latency_ms": latency * 1000,
+            "returned": len(documents),
+            "context_tokens": sum(estimate_tokens(document.page_content) for document in documents),
+            **score_query(documents, gold.relevant, config.k),
+        })
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "config": asdict(config),
+        "queries": len(per_query),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": {
+            metric: float(np.mean([row[metric] for row in per_query])) if per_query else 0.0
+            for metric in QUALITY_METRICS
+        },
+        "context": {
+            metric: float(np.mean([row[metric] for row in per_query])) if per_query else 0.0
+            for metric in ("returned", "context_tokens")
+        },
+        "latency_ms": {
+            "p50": float(np.percentile(latencies_ms, 50)) if per_query else 0.0,
+            "p95": float(np.percentile(latencies_ms, 95)) if per_query else 0.0,
+            "mean": float(latencies_ms.mean()) if per_query else 0.0,
+        },
+        "per_query": per_query,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.01, latency_tolerance: float = 0.2) -> list[str]:
+    """Сравнить отчёт с базовым; возвращает список регрессий"""
+    regressions = []
+    for metric in QUALITY_METRICS:
+        current, previous = report["metrics"][metric], baseline["metrics"].get(metric)
+        if previous is not None and current < previous - tolerance:
+            regressions.append(f"{metric}@{report['config']['k']}: {previous:.3f} → {current:.3f}")
+    previous_p95 = baseline.get("latency_ms", {}).get("p95")
+    if previous_p95 and report["latency_ms"]["p95"] > previous_p95 * (1 + latency_tolerance):
+        regressions.append(f"latency p95: {previous_p95:.0f}ms → {report['latency_ms']['p95']:.0f}ms")
+    return regressions
+
+
+def print_report(report: dict, baseline: Optional[dict] = None) -> None:
+    k = report["config"]["k"]
+    print(f"\n📊 '{report['config']['name']}': {report['queries']} запросов")
+    for metric in QUALITY_METRICS:
+        line = f"   {metric}@{k}: {report['metrics'][metric]:.3f}"
+        if baseline and metric in baseline.get("metrics", {}):
+            line += f" (база {baseline['metrics'][metric]:.3f}, {report['metrics'][metric] - baseline['metrics'][metric]:+.3f})"
+        print(line)
+    latency = report["latency_ms"]
+    line = f"   latency: p50 {latency['p50']:.0f}ms, p95 {latency['p95']:.0f}ms, mean {latency['mean']:.0f}ms"
+    if baseline and "latency_ms" in baseline:
+        # Цена изменения в латентности рядом с приростом качества выше
+        line += f" (база p50 {baseline['latency_ms']['p50']:.0f}ms, {latency['p50'] - baseline['latency_ms']['p50']:+.0f}ms)"
+    print(line)
+    context = report.get("context")
+    if context:
+        line = f"   контекст: {context['returned']:.1f} документов, ~{context['context_tokens']:.0f} токенов"
+        if baseline and "context" in baseline:
+            line += f" (база ~{baseline['context']['context_tokens']:.0f})"
+        print(line)
+
+
+def bootstrap_gold(collection_name: str, size: int, seed: int = 13, max_points: int = 20000) -> list[dict]:
+    """
+    Черновой эталон «известного фрагмента»: запрос — начало случайного чанка, релевантен диапазон
+    этого чанка. Годится для регрессионных сравнений; для оценки качества нужна ручная разметка
+    """
+    points = []
+    offset = None
+    while len(points) < max_points:
+        batch, offset = rag_client.client.scroll(
+            collection_name=collection_name, limit=256, offset=offset, with_payload=True, with_vectors=False
+        )
+        points.extend(batch)
+        if offset is None:
+            break
+    random.Random(seed).shuffle(points)
+
+    gold = []
+    for point in points:
+        if len(gold) >= size:
+            break
+        payload = point.payload or {}
+        metadata = payload.get(rag_client.metadata_payload_key) or {}
+        words = re.findall(r"\w+", payload.get(rag_client.content_payload_key, ""))
+        if len(words) < 8 or "file_path" not in metadata:
+            continue
+        gold.append({
+            "id": f"auto-{len(gold) + 1}",
+            "query": " ".join(words[:12]),
+            "relevant": [{
+                "file_path": metadata["file_path"],
+                "char_start": metadata.get("char_start"),
+                "char_end": metadata.get("char_end"),
+            }],
+        })
+    return gold
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Офлайн-оценка поиска")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Оценить конфигурацию поиска на эталоне")
+    run_parser.add_argument("--gold", type=Path, default=GOLD_PATH)
+    run_parser.add_argument("--name", default="default", help="Имя конфигурации в отчёте")
+    run_parser.add_argument("--collection", default=CollectionsEnum.HABR_ARTICLES)
+    run_parser.add_argument("--k", type=int, default=6)
+    run_parser.add_argument("--hnsw-ef", type=int, default=SETTINGS.QDRANT_HNSW_EF)
+    run_parser.add_argument("--search-cache", action="store_true", help="Искать через кэш результатов")
+    run_parser.add_argument("--adaptive", action="store_true", help="Отсекать слабые совпадения по скору")
+    run_parser.add_argument("--score-floor", type=float, default=SETTINGS.RETRIEVAL_SCORE_FLOOR)
+    run_parser.add_argument("--score-drop", type=float, default=SETTINGS.RETRIEVAL_SCORE_DROP)
+    run_parser.add_argument("--min-k", type=int, default=SETTINGS.RETRIEVAL_MIN_K)
+    run_parser.add_argument("--reranker", default=SETTINGS.RERANKER, choices=list(RerankerEnum))
+    run_parser.add_argument("--rerank-fetch-k", type=int, default=SETTINGS.RERANK_FETCH_K, help="Кандидатов для реранкера")
+    run_parser.add_argument("--diversify", action="store_true", help="Убрать почти-дубликаты и отобрать k по MMR")
+    run_parser.add_argument("--fetch-k", type=int, default=SETTINGS.RETRIEVAL_FETCH_K, help="Кандидатов для MMR")
+    run_parser.add_argument("--mmr-lambda", type=float, default=SETTINGS.RETRIEVAL_MMR_LAMBDA)
+    run_parser.add_argument("--neighbors", type=int, default=0, help="Склеивать найденные чанки с ±N соседями")
+    run_parser.add_argument("--compress", type=float, default=1.0, help="Сжать документы до этой доли текста")
+    run_parser.add_argument("--compress-min-sentences", type=int, default=SETTINGS.CONTEXT_COMPRESSION_MIN_SENTENCES)
+    run_parser.add_argument("--duplicate-threshold", type=float, default=SETTINGS.RETRIEVAL_DUPLICATE_THRESHOLD)
+    run_parser.add_argument("--output", type=Path, help="Сохранить отчёт в JSON")
+    run_parser.add_argument("--baseline", type=Path, help="Сравнить с базовым отчётом")
+    run_parser.add_argument("--save-baseline", action="store_true", help="Записать отчёт как новый базовый")
+    run_parser.add_argument("--tolerance", type=float, default=0.01, help="Допустимое падение метрик качества")
+    run_parser.add_argument("--latency-tolerance", type=float, default=0.2, help="Допустимый относительный рост p95")
+
+    bootstrap_parser = subparsers.add_parser("bootstrap", help="Собрать черновой эталон из коллекции")
+    bootstrap_parser.add_argument("--collection", default=CollectionsEnum.HABR_ARTICLES)
+    bootstrap_parser.add_argument("--size", type=int, default=100)
+    bootstrap_parser.add_argument("--output", type=Path, default=GOLD_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == "bootstrap":
+        gold = bootstrap_gold(args.collection, args.size)
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            for item in gold:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        print(f"💾 {len(gold)} запросов записано в {args.output}")
+        return
+
+    config = RetrievalConfig(
+        name=args.name,
+        collection_name=args.collection,
+        k=args.k,
+        hnsw_ef=args.hnsw_ef,
+        adaptive=args.adaptive,
+        score_floor=args.score_floor,
+        score_drop=args.score_drop,
+        min_k=args.min_k,
+        reranker=args.reranker,
+        rerank_fetch_k=args.rerank_fetch_k,
+        diversify=args.diversify,
+        fetch_k=args.fetch_k,
+        mmr_lambda=args.mmr_lambda,
+        duplicate_threshold=args.duplicate_threshold,
+        neighbors=args.neighbors,
+        compression_ratio=args.compress,
+        compression_min_sentences=args.compress_min_sentences
+    )
+    # Попадания в кэш поиска исказили бы латентность: по умолчанию измеряется сам поиск
+    rag_client.search_cache.enabled = args.search_cache
+    report = asyncio.run(evaluate(config, load_gold(args.gold)))
+    report["gold"] = str(args.gold)
+
+    baseline = None
+    if args.baseline and args.baseline.exists():
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчёт сохранён в {path}")
+
+    if baseline and not args.save_baseline:
+        regressions = compare(report, baseline, args.tolerance, args.latency_tolerance)
+        if regressions:
+            print("❌ Регрессии относительно базового отчёта:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print("✅ Регрессий относительно базового отчёта нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,73 @@
+import functools
 import logging
+import time
 import traceback
-from typing import Any, Literal, Optional
+from typing import Any, Callable, Literal, Optional
 
 from gigachat.exceptions import GigaChatException
 from langchain_core.messages import AIMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
-from langchain_gigachat import GigaChat
+from langchain_core.runnables import Runnable
+from langchain_core.language_models.chat_models import BaseChatModel
 from langgraph.graph import StateGraph
 from langgraph.graph.state import CompiledStateGraph
 from langgraph.types import Command
 from pydantic import BaseModel
 
+from app.cassette import InteractionKindEnum, cassette_call, record_node
+from app.circuit_breaker import llm_breaker
 from app.graph.config import GraphConfig
 from app.graph.descriptions import PLAN_STEPS, COLLECTIONS
 from app.graph.enums import NodesEnum, StepStatusEnum, StageEnum, ReactEnum, RagFlowStatusEnum
+from app.llm.enums import PriorityEnum
 from app.llm.errors import BlackListException
 from app.llm.models import Plan, Step, RagFlow
 from app.llm.parser import CustomParser
 from app.llm.prompts import PlannerPrompts, RagPrompts, ResponsePrompt
+from app.llm.resilience import llm_resilience
+from app.llm.scheduler import llm_scheduler
 from app.llm.tools.rag import rag_tool
 from app.states import AgentState
+from app.telemetry import observe_node
+
+# Наблюдатели за выполнением узлов графа: вызываются с (имя узла, длительность в секундах)
+node_observers: list[Callable[[str, float], None]] = [record_node, observe_node]
+
+
+def observed_node(name: str, node: Callable) -> Callable:
+    """Обёртка узла, сообщающая наблюдателям время его выполнения"""
+
+    @functools.wraps(node)
+    async def wrapper(state: AgentState):
+        started_at = time.perf_counter()
+        try:
+            return await node(state)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            for observer in node_observers:
+                observer(name, elapsed)
+
+    return wrapper
 
 
 class Graph:
 
-    def __init__(self, llm: GigaChat) -> None:
+    def __init__(self, llm: BaseChatModel, priority: PriorityEnum = PriorityEnum.INTERACTIVE) -> None:
         self.llm = llm
+        self.priority = priority
         self.config = GraphConfig
 
 
     def compile_graph(self) -> CompiledStateGraph:
         graph = StateGraph(AgentState)
-        graph.add_node(NodesEnum.ROUTER, self.router_node)
-        graph.add_node(NodesEnum.PLANNER, self.planner_node)
-        graph.add_node(NodesEnum.RETRIEVER, self.retrieve_node)
-        graph.add_node(ReactEnum.THOUGHT, self.reasoning_node)
-        graph.add_node(ReactEnum.FINAL, self.final_react_node)
-        graph.add_node(NodesEnum.RAG_TOOL, self.rag_tool)
-        graph.add_node(NodesEnum.RESPONSE, self.response_node)
-        graph.add_node(NodesEnum.ERROR, self.error_node)
+        graph.add_node(NodesEnum.ROUTER, observed_node(NodesEnum.ROUTER, self.router_node))
+        graph.add_node(NodesEnum.PLANNER, observed_node(NodesEnum.PLANNER, self.planner_node))
+        graph.add_node(NodesEnum.RETRIEVER, observed_node(NodesEnum.RETRIEVER, self.retrieve_node))
+        graph.add_node(ReactEnum.THOUGHT, observed_node(ReactEnum.THOUGHT, self.reasoning_node))
+        graph.add_node(ReactEnum.FINAL, observed_node(ReactEnum.FINAL, self.final_react_node))
+        graph.add_node(NodesEnum.RAG_TOOL, observed_node(NodesEnum.RAG_TOOL, self.rag_tool))
+        graph.add_node(NodesEnum.RESPONSE, observed_node(NodesEnum.RESPONSE, self.response_node))
+        graph.add_node(NodesEnum.ERROR, observed_node(NodesEnum.ERROR, self.error_node))
 
         graph.set_entry_point(NodesEnum.ROUTER)
 
@@ -46,6 +75,20 @@ class Graph:
 
         return compiled
 
+    async def _ainvoke_llm(self, runnable: Runnable, data: Any, **kwargs) -> Any:
+        """Единая точка вызова LLM: предохранитель -> повторы/хеджирование -> планировщик"""
+        # Предохранитель снаружи повторов: логический вызов засчитывается одним отказом, а не каждой попыткой
+        return await llm_breaker.call(
+            lambda: llm_resilience.call(
+                lambda: llm_scheduler.run(
+                    model=self.llm.model or "default",
+                    # Запись/воспроизведение кассет — внутри слота планировщика, как и настоящий вызов
+                    call=lambda: cassette_call(InteractionKindEnum.LLM, data, lambda: runnable.ainvoke(data, **kwargs)),
+                    priority=self.priority
+                )
+            )
+        )
+
     async def get_chain(
             self,
             data: dict | str,
@@ -60,7 +103,7 @@ class Graph:
                 if tools:
                     llm = llm.bind_functions(tools)
                 chain = prompt_template | llm
-                future: AIMessage = await chain.ainvoke(data)
+                future: AIMessage = await self._ainvoke_llm(chain, data)
                 if future.response_metadata.get("finish_reason") == "blacklist":
                     raise BlackListException
                 return future
@@ -68,7 +111,7 @@ class Graph:
                 llm = self.llm
                 if tools:
                     llm = llm.bind_tools(tools)
-                future: AIMessage = await llm.ainvoke(data)
+                future: AIMessage = await self._ainvoke_llm(llm, data)
                 if future.response_metadata.get("finish_reason") == "blacklist":
                     raise BlackListException
                 return future
@@ -98,16 +141,12 @@ class Graph:
             if not (prompt and isinstance(prompt, ChatPromptTemplate)):
                 prompt = ChatPromptTemplate.from_messages([("system", system_prompt), ("human", user_prompt)])
 
-            if parser:
-                parser_ = parser.parser
-                chain = prompt | structured_llm | parser_
-            else:
+            if not parser:
                 raise ValueError("parser must be provided")
-            raw = await chain.ainvoke(
-                input=data,
-                verbose=True
-            )
-            return parser.validate(raw)
+            # Парсер — после вызова: планировщик и кассета видят ответ с raw и считают его токены
+            chain = prompt | structured_llm
+            output = await self._ainvoke_llm(chain, data, verbose=True)
+            return parser.validate(parser.parser(output))
 
         except GigaChatException as e:
             logging.error(msg={"node": None, "traceback": traceback.format_exc(), "error": e, "gigachat_exception": True})
@@ -0,0 +1,153 @@
+"""
+Фоновые проверки зависимостей с кэшированием результата
+
+Пробы Redis, Qdrant (коллекция или алиас на месте) и токена GigaChat выполняются по таймеру;
+/health, /livez и /readyz отвечают из кэша за постоянное время и не нагружают зависимости.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from app.config import SETTINGS
+from app.graph.enums import CollectionsEnum
+from app.llm.enums import LLMBackendEnum
+from app.rag_client import rag_client
+from app.state_manager import state_manager
+
+# Проба возвращает детали для ответа; исключение означает, что зависимость недоступна
+Probe = Callable[[], Awaitable[dict]]
+
+
+@dataclass
+class ProbeResult:
+    ok: bool = False
+    checked_at: Optional[float] = None
+    latency: Optional[float] = None
+    error: Optional[str] = None
+    details: dict = field(default_factory=dict)
+
+
+async def probe_redis() -> dict:
+    await state_manager.redis_client.ping()
+    return {}
+
+
+async def probe_qdrant() -> dict:
+    """Коллекция документов доступна по алиасу (или как обычная коллекция)"""
+    collection_name = CollectionsEnum.HABR_ARTICLES.value
+    aliases = (await rag_client.async_client.get_aliases()).aliases
+    for alias in aliases:
+        if alias.alias_name == collection_name:
+            return {"collection": alias.collection_name, "alias": collection_name}
+    if await rag_client.async_client.collection_exists(collection_name):
+        return {"collection": collection_name}
+    raise LookupError(f"Collection '{collection_name}' not found")
+
+
+async def probe_gigachat_token() -> dict:
+    """Общий токен GigaChat действителен; проба заодно обновляет его заранее, вне пути запроса"""
+    if SETTINGS.LLM_BACKEND == LLMBackendEnum.FAKE:
+        return {"backend": LLMBackendEnum.FAKE.value}
+    from app.llm.auth import gigachat_token
+
+    await gigachat_token.get_token()
+    return {"expires_in": round(gigachat_token.expires_in)}
+
+
+class HealthMonitor:
+    """Периодический опрос зависимостей; снимок состояния собирается без сетевых вызовов"""
+
+    def __init__(self, interval: float = 10.0, timeout: float = 3.0, stale_after: float = 30.0) -> None:
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.probes: dict[str, Probe] = {}
+        # Без критичных зависимостей сервис не готов; остальные переводят его в degraded
+        self.critical: set[str] = set()
+        self.results: dict[str, ProbeResult] = {}
+        self.started_at = time.time()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, probe: Probe, critical: bool = True) -> None:
+        self.probes[name] = probe
+        self.results[name] = ProbeResult()
+        if critical:
+            self.critical.add(name)
+
+    async def start(self) -> None:
+        """Первый опрос синхронно, чтобы /readyz сразу отвечал по делу, затем — в фоне"""
+        if self._task:
+            return
+        await self.refresh()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh()
+
+    async def refresh(self) -> None:
+        await asyncio.gather(*(self._run_probe(name, probe) for name, probe in self.probes.items()))
+
+    async def _run_probe(self, name: str, probe: Probe) -> None:
+        started_at = time.monotonic()
+        result = ProbeResult(checked_at=time.time())
+        try:
+            result.details = await asyncio.wait_for(probe(), timeout=self.timeout)
+            result.ok = True
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.latency = round(time.monotonic() - started_at, 4)
+
+        previous = self.results.get(name)
+        if previous and previous.checked_at and previous.ok != result.ok:
+            log = logging.info if result.ok else logging.warning
+            log(msg={"event": "Dependency health changed", "dependency": name, "ok": result.ok, "error": result.error})
+        self.results[name] = result
+
+    def is_fresh(self, result: ProbeResult) -> bool:
+        return result.checked_at is not None and time.time() - result.checked_at <= self.stale_after
+
+    def is_healthy(self, name: str) -> bool:
+        """Последняя проверка успешна и не устарела"""
+        result = self.results[name]
+        return result.ok and self.is_fresh(result)
+
+    @property
+    def ready(self) -> bool:
+        return all(self.is_healthy(name) for name in self.critical)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        return {
+            name: {
+                **asdict(result),
+                "age": round(now - result.checked_at, 2) if result.checked_at else None,
+                "stale": not self.is_fresh(result),
+                "critical": name in self.critical,
+            }
+            for name, result in self.results.items()
+        }
+
+
+# Глобальный экземпляр монитора
+health_monitor = HealthMonitor(
+    interval=SETTINGS.HEALTH_PROBE_INTERVAL,
+    timeout=SETTINGS.HEALTH_PROBE_TIMEOUT,
+    stale_after=SETTINGS.HEALTH_STALE_AFTER
+)
+health_monitor.register("redis", probe_redis)
+health_monitor.register("qdrant", probe_qdrant)
+# Без LLM сервис отвечает в деградированном режиме, поэтому токен не блокирует готовность
+health_monitor.register("gigachat", probe_gigachat_token, critical=False)
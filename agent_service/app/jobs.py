@@ -0,0 +1,170 @@
+import datetime
+import json
+import uuid
+from enum import StrEnum
+from typing import AsyncIterator, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from app.config import SETTINGS
+from app.llm.enums import PriorityEnum
+from app.models import AgentResponse
+from app.state_manager import state_manager
+
+
+class JobStatusEnum(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+FINAL_JOB_STATUSES = (JobStatusEnum.DONE, JobStatusEnum.FAILED)
+
+
+class JobQueue:
+    """Очередь заданий агента на Redis Streams с группой потребителей"""
+
+    stream_key = "agent_jobs"
+    group_name = "agent_workers"
+
+    def __init__(self, redis_client: Optional[Redis] = None):
+        self._redis_client = redis_client
+
+    @property
+    def redis(self) -> Redis:
+        # По умолчанию переиспользуем подключение менеджера состояний
+        return self._redis_client or state_manager.redis_client
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"agent_job:{job_id}"
+
+    @staticmethod
+    def _events_channel(job_id: str) -> str:
+        return f"agent_job_events:{job_id}"
+
+    async def ensure_group(self) -> None:
+        """Создать стрим и группу потребителей, если их ещё нет"""
+        try:
+            await self.redis.xgroup_create(self.stream_key, self.group_name, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def queue_size(self) -> int:
+        return await self.redis.xlen(self.stream_key)
+
+    async def enqueue(self, query: str, session_id: str, priority: PriorityEnum = PriorityEnum.INTERACTIVE) -> str:
+        """Поставить запрос в очередь и вернуть ID задания"""
+        job_id = uuid.uuid4().hex
+        now = datetime.datetime.now().isoformat()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping={
+                "job_id": job_id,
+                "status": JobStatusEnum.QUEUED,
+                "session_id": session_id,
+                "query": query,
+                "created_at": now,
+                "updated_at": now,
+            })
+            pipe.expire(self._job_key(job_id), SETTINGS.JOB_RESULT_TTL)
+            pipe.xadd(
+                self.stream_key,
+                {"job_id": job_id, "session_id": session_id, "query": query, "priority": priority},
+                maxlen=SETTINGS.JOB_STREAM_MAXLEN,
+                approximate=True
+            )
+            await pipe.execute()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """Получить статус и результат задания"""
+        data = await self.redis.hgetall(self._job_key(job_id))
+        if not data:
+            return None
+        if data.get("result"):
+            data["result"] = json.loads(data["result"])
+        return data
+
+    async def set_status(
+            self,
+            job_id: str,
+            status: JobStatusEnum,
+            result: Optional[AgentResponse] = None,
+            error: Optional[str] = None
+    ) -> None:
+        """Обновить статус задания и оповестить подписчиков SSE"""
+        fields = {"status": status, "updated_at": datetime.datetime.now().isoformat()}
+        if result is not None:
+            fields["result"] = result.model_dump_json()
+        if error is not None:
+            fields["error"] = error
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._job_key(job_id), mapping=fields)
+            pipe.expire(self._job_key(job_id), SETTINGS.JOB_RESULT_TTL)
+            pipe.publish(self._events_channel(job_id), status)
+            await pipe.execute()
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> list[tuple[str, dict]]:
+        """Прочитать новые сообщения для потребителя"""
+        response = await self.redis.xreadgroup(
+            self.group_name, consumer, {self.stream_key: ">"}, count=count, block=block_ms
+        )
+        if not response:
+            return []
+        _, messages = response[0]
+        return messages
+
+    async def claim_stale(self, consumer: str, count: int) -> list[tuple[str, dict]]:
+        """Забрать сообщения, которые давно не подтверждены упавшими потребителями"""
+        _, messages, *_ = await self.redis.xautoclaim(
+            self.stream_key,
+            self.group_name,
+            consumer,
+            min_idle_time=SETTINGS.JOB_CLAIM_IDLE_MS,
+            start_id="0-0",
+            count=count
+        )
+        return [(message_id, fields) for message_id, fields in messages if fields]
+
+    async def delivery_count(self, message_id: str) -> int:
+        pending = await self.redis.xpending_range(
+            self.stream_key, self.group_name, min=message_id, max=message_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def ack(self, message_id: str) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream_key, self.group_name, message_id)
+            pipe.xdel(self.stream_key, message_id)
+            await pipe.execute()
+
+    async def events(self, job_id: str) -> AsyncIterator[dict]:
+        """Поток изменений статуса задания вплоть до финального"""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._events_channel(job_id))
+        try:
+            # Статус читаем после подписки, чтобы не пропустить переход между ними
+            job = await self.get(job_id)
+            if job is None:
+                return
+            yield job
+            while job["status"] not in FINAL_JOB_STATUSES:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SETTINGS.JOB_SSE_KEEPALIVE)
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                if message is None and job["status"] not in FINAL_JOB_STATUSES:
+                    # Keep-alive для прокси между сервисом и клиентом
+                    yield {}
+                    continue
+                yield job
+        finally:
+            await pubsub.unsubscribe(self._events_channel(job_id))
+            await pubsub.aclose()
+
+
+# Глобальный экземпляр очереди заданий
+job_queue = JobQueue()
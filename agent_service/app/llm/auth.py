@@ -0,0 +1,177 @@
+"""
+Общий токен доступа GigaChat для всех клиентов модели и эмбеддингов
+
+Токен кэшируется в памяти процесса и в Redis (общий для воркеров API и заданий), обновляется
+заранее, до истечения. Запрос токена выполняется один раз: внутри процесса — через SingleFlight,
+между процессами — под блокировкой в Redis. Клиенты SDK получают токен через authorization_cvar.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+from gigachat.context import authorization_cvar
+
+from app.config import SETTINGS
+from app.singleflight import SingleFlight
+from app.state_manager import state_manager
+
+TOKEN_KEY = "gigachat_token:{}"
+LOCK_KEY = "gigachat_token_lock:{}"
+
+
+class GigaChatTokenProvider:
+    """Кэш токена в памяти и Redis с обновлением до истечения"""
+
+    def __init__(
+            self,
+            credentials: Optional[str],
+            scope: Optional[str] = None,
+            refresh_margin: float = 60.0,
+            lock_timeout: float = 10.0,
+    ) -> None:
+        self.credentials = credentials
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.lock_timeout = lock_timeout
+        # Ключ зависит от учётных данных, но не раскрывает их
+        self.key = hashlib.sha256(f"{credentials}:{scope}".encode()).hexdigest()[:16]
+        self.flight = SingleFlight("gigachat_token")
+        self._token: Optional[str] = None
+        self._expires_at: float = 0.0
+        self._client = None
+        self._fetches = 0
+        self._redis_hits = 0
+
+    @property
+    def redis_client(self):
+        return state_manager.redis_client
+
+    def _is_usable(self, expires_at: float) -> bool:
+        return expires_at - time.time() > self.refresh_margin
+
+    async def get_token(self) -> str:
+        if self._token and self._is_usable(self._expires_at):
+            return self._token
+        return await self.flight.do(self.key, self._refresh)
+
+    @contextlib.asynccontextmanager
+    async def authorization(self) -> AsyncIterator[str]:
+        """Подставить общий токен в заголовок Authorization вызовов SDK внутри блока"""
+        token = await self.get_token()
+        reset_token = authorization_cvar.set(f"Bearer {token}")
+        try:
+            yield token
+        finally:
+            authorization_cvar.reset(reset_token)
+
+    async def invalidate(self, token: str) -> None:
+        """Токен отклонён API (401): сбросить его, если его ещё не заменили"""
+        if self._token == token:
+            self._token, self._expires_at = None, 0.0
+        if self.redis_client is None:
+            return
+        try:
+            cached = await self.redis_client.get(TOKEN_KEY.format(self.key))
+            if cached and json.loads(cached)["access_token"] == token:
+                await self.redis_client.delete(TOKEN_KEY.format(self.key))
+        except Exception as e:
+            logging.warning(msg={"event": "GigaChat token invalidation failed", "error": e})
+
+    async def _refresh(self) -> str:
+        token = await self._from_redis()
+        if token:
+            return token
+        if self.redis_client is None:
+            return await self._fetch()
+
+        # Между процессами токен запрашивает владелец блокировки, остальные ждут его в Redis
+        lock_key, owner = LOCK_KEY.format(self.key), uuid.uuid4().hex
+        try:
+            acquired = await self.redis_client.set(lock_key, owner, nx=True, px=int(self.lock_timeout * 1000))
+        except Exception as e:
+            logging.warning(msg={"event": "GigaChat token lock failed", "error": e})
+            return await self._fetch()
+
+        if not acquired:
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+                token = await self._from_redis()
+                if token:
+                    return token
+            # Владелец блокировки не справился — запрашиваем сами
+            return await self._fetch()
+
+        try:
+            return await self._fetch()
+        finally:
+            if await self.redis_client.get(lock_key) == owner:
+                await self.redis_client.delete(lock_key)
+
+    async def _from_redis(self) -> Optional[str]:
+        if self.redis_client is None:
+            return None
+        try:
+            cached = await self.redis_client.get(TOKEN_KEY.format(self.key))
+        except Exception as e:
+            logging.warning(msg={"event": "GigaChat token cache read failed", "error": e})
+            return None
+        if not cached:
+            return None
+        data = json.loads(cached)
+        if not self._is_usable(data["expires_at"]):
+            return None
+        self._redis_hits += 1
+        self._token, self._expires_at = data["access_token"], data["expires_at"]
+        return self._token
+
+    async def _fetch(self) -> str:
+        """Новый токен у сервера авторизации"""
+        if self._client is None:
+            from gigachat import GigaChat
+            self._client = GigaChat(credentials=self.credentials, scope=self.scope, verify_ssl_certs=False)
+
+        self._client._reset_token()
+        access_token = await self._client.aget_token()
+        self._fetches += 1
+        # expires_at приходит в миллисекундах
+        self._token, self._expires_at = access_token.access_token, access_token.expires_at / 1000
+        logging.info(msg={"event": "GigaChat token fetched", "expires_in": round(self._expires_at - time.time())})
+
+        if self.redis_client is not None:
+            ttl = int(self._expires_at - time.time() - self.refresh_margin)
+            if ttl > 0:
+                try:
+                    await self.redis_client.set(
+                        TOKEN_KEY.format(self.key),
+                        json.dumps({"access_token": self._token, "expires_at": self._expires_at}),
+                        ex=ttl
+                    )
+                except Exception as e:
+                    logging.warning(msg={"event": "GigaChat token cache write failed", "error": e})
+        return self._token
+
+    @property
+    def expires_in(self) -> float:
+        return self._expires_at - time.time() if self._token else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "fetches": self._fetches,
+            "redis_hits": self._redis_hits,
+            "expires_in": round(self.expires_in),
+            **self.flight.stats(),
+        }
+
+
+# Глобальный экземпляр провайдера токена
+gigachat_token = GigaChatTokenProvider(
+    credentials=SETTINGS.GIGACHAT_CREDENTIALS,
+    scope=SETTINGS.GIGACHAT_SCOPE,
+    refresh_margin=SETTINGS.GIGACHAT_TOKEN_REFRESH_MARGIN
+)
@@ -6,3 +6,13 @@ class ReactStep(StrEnum):
     ACTION = "action"
     ANSWER = "answer"
     ERROR = "error"
+
+
+class PriorityEnum(StrEnum):
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+
+
+class LLMBackendEnum(StrEnum):
+    GIGACHAT = "gigachat"
+    FAKE = "fake"
@@ -1,4 +1,4 @@
-from gigachat.exceptions import GigaChatException
+from gigachat.exceptions import GigaChatException, ResponseError
 
 
 class BlackListException(GigaChatException):
@@ -7,4 +7,17 @@ class BlackListException(GigaChatException):
 
 class ParserException(GigaChatException):
     def __init__(self, *args):
-        super().__init__(*args)
\ No newline at end of file
+        super().__init__(*args)
+
+class SchedulerOverloadedException(GigaChatException):
+    """Очередь планировщика LLM переполнена, запрос отклонён"""
+    def __init__(self, *args, retry_after: int = 1):
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
+def get_status_code(exc: BaseException) -> int | None:
+    """HTTP-код ответа GigaChat, если исключение его содержит"""
+    if isinstance(exc, ResponseError) and len(exc.args) > 1 and isinstance(exc.args[1], int):
+        return exc.args[1]
+    return None
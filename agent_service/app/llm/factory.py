@@ -0,0 +1,41 @@
+import functools
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from app.config import SETTINGS
+from app.llm.enums import LLMBackendEnum
+
+
+def create_chat_model() -> BaseChatModel:
+    """Чат-модель выбранного бэкенда (LLM_BACKEND)"""
+    if SETTINGS.LLM_BACKEND == LLMBackendEnum.FAKE:
+        from app.llm.fake import FakeChatModel
+        return FakeChatModel(latency=SETTINGS.FAKE_LLM_LATENCY, tool_rounds=SETTINGS.FAKE_LLM_TOOL_ROUNDS)
+    # Клиенты GigaChat с общим токеном нужны только этому бэкенду. Сами langchain_gigachat и SDK
+    # загружаются при старте в любом случае: giga_tool в инструменте RAG, исключения SDK в графе
+    from app.llm.gigachat import SharedTokenGigaChat
+    return SharedTokenGigaChat(
+        credentials=SETTINGS.GIGACHAT_CREDENTIALS,
+        model=SETTINGS.MODEL,
+        verify_ssl_certs=False
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_chat_model() -> BaseChatModel:
+    """Общая чат-модель процесса: один пул соединений и один токен на все запросы"""
+    return create_chat_model()
+
+
+def create_embeddings() -> Embeddings:
+    """Модель эмбеддингов выбранного бэкенда (LLM_BACKEND)"""
+    if SETTINGS.LLM_BACKEND == LLMBackendEnum.FAKE:
+        from app.llm.fake import fake_embeddings
+        return fake_embeddings()
+    from app.llm.gigachat import SharedTokenGigaChatEmbeddings
+    return SharedTokenGigaChatEmbeddings(
+        credentials=SETTINGS.GIGACHAT_CREDENTIALS,
+        verify_ssl_certs=False,
+        model=SETTINGS.EMBEDDING_MODEL
+    )
@@ -0,0 +1,140 @@
+"""
+Детерминированная замена GigaChat для бенчмарков и нагрузочных тестов без сети
+
+Модель отвечает по сценарию графа: план (retriever -> response), мысль, вызов rag_call,
+END после нужного числа поисков, успешный RagFlow и текст финального ответа.
+Включается через LLM_BACKEND=fake.
+"""
+import asyncio
+import json
+import re
+import uuid
+from typing import Any, Optional, Sequence
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from app.graph.enums import CollectionsEnum, NodesEnum, RagFlowStatusEnum
+
+# Размерность эмбеддингов фейкового эмбеддера
+FAKE_EMBEDDING_SIZE = 256
+
+PLANNER_INPUT_RE = re.compile(r"Необходимо составить план к запросу:\s*(.+)", re.S)
+TASK_RE = re.compile(r"ТЕКУЩАЯ ЗАДАЧА:\s*(.+)")
+
+
+class FakeChatModel(BaseChatModel):
+    """Сценарная чат-модель с интерфейсом GigaChat: bind_functions, bind_tools, with_structured_output"""
+
+    model: str = "fake"
+    # Имитация времени ответа модели (сек.)
+    latency: float = 0.0
+    # Сколько раз агент вызывает поиск, прежде чем ответить END
+    tool_rounds: int = 1
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gigachat"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        return self.bind(tool_names=[self._tool_name(tool) for tool in tools], **kwargs)
+
+    def bind_functions(self, functions: Sequence[Any], **kwargs: Any) -> Runnable:
+        return self.bind_tools(functions, **kwargs)
+
+    def with_structured_output(self, schema: Any, *, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        bound = self.bind(structured_schema=getattr(schema, "__name__", str(schema)))
+        if include_raw:
+            return bound | RunnableLambda(lambda raw: {"raw": raw, "parsed": None, "parsing_errors": None})
+        return bound | RunnableLambda(lambda raw: json.loads(raw.content))
+
+    @staticmethod
+    def _tool_name(tool: Any) -> str:
+        if isinstance(tool, dict):
+            return tool.get("name") or tool.get("function", {}).get("name")
+        return getattr(tool, "name", None) or getattr(tool, "__name__", "tool")
+
+    def _generate(
+            self,
+            messages: list[BaseMessage],
+            stop: Optional[list[str]] = None,
+            run_manager: Any = None,
+            **kwargs: Any
+    ) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, **kwargs))])
+
+    async def _agenerate(
+            self,
+            messages: list[BaseMessage],
+            stop: Optional[list[str]] = None,
+            run_manager: Any = None,
+            **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._generate(messages, stop, **kwargs)
+
+    def _reply(
+            self,
+            messages: list[BaseMessage],
+            tool_names: Optional[list[str]] = None,
+            structured_schema: Optional[str] = None,
+            **kwargs: Any
+    ) -> AIMessage:
+        text = "\n".join(str(message.content) for message in messages)
+        if structured_schema == "Plan":
+            return self._message(json.dumps(self._plan(text), ensure_ascii=False), text)
+        if structured_schema == "RagFlow":
+            answer = {"status": RagFlowStatusEnum.SUCCESS, "corrections": "", "answer": "Ответ по найденным источникам."}
+            return self._message(json.dumps(answer, ensure_ascii=False), text)
+        if tool_names:
+            # История шагов попадает в промпт строкой: число ToolMessage — число уже выполненных поисков
+            if text.count("ToolMessage(") >= self.tool_rounds:
+                return self._message("END", text)
+            task = TASK_RE.search(text)
+            return self._message("", text, tool_calls=[{
+                "name": tool_names[0],
+                "args": {
+                    "collection_name": CollectionsEnum.HABR_ARTICLES,
+                    "rag_request": task.group(1).strip() if task else text[-200:]
+                },
+                "id": str(uuid.uuid4()),
+                "type": "tool_call",
+            }])
+        return self._message("Нужно найти информацию в коллекции habr_articles.", text)
+
+    @staticmethod
+    def _plan(text: str) -> dict:
+        match = PLANNER_INPUT_RE.search(text)
+        query = match.group(1).strip() if match else text[-200:]
+        return {
+            "global_task": query,
+            "require_documents": True,
+            "plan": [
+                {"name": NodesEnum.RETRIEVER, "task": query},
+                {"name": NodesEnum.RESPONSE, "task": "Сформировать ответ пользователю"},
+            ],
+            "reasoning": "Для ответа нужны источники из базы знаний",
+        }
+
+    def _message(self, content: str, prompt: str, tool_calls: Optional[list] = None) -> AIMessage:
+        # Грубая оценка токенов, чтобы счётчики использования работали как с настоящей моделью
+        input_tokens, output_tokens = len(prompt) // 4, len(content) // 4 + 1
+        return AIMessage(
+            content=content,
+            tool_calls=tool_calls or [],
+            response_metadata={"finish_reason": "function_call" if tool_calls else "stop", "model_name": self.model},
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        )
+
+
+def fake_embeddings() -> DeterministicFakeEmbedding:
+    """Эмбеддер без сети: одинаковый текст всегда даёт одинаковый вектор"""
+    return DeterministicFakeEmbedding(size=FAKE_EMBEDDING_SIZE)
@@ -0,0 +1,50 @@
+"""
+Клиенты GigaChat с общим токеном доступа (см. app.llm.auth)
+
+Асинхронные вызовы модели и эмбеддингов берут токен у gigachat_token вместо собственного
+запроса авторизации; при 401 токен сбрасывается и вызов повторяется один раз.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+from gigachat.exceptions import AuthenticationError
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_gigachat import GigaChat, GigaChatEmbeddings
+
+from app.llm.auth import gigachat_token
+
+T = TypeVar("T")
+
+
+async def with_shared_token(call: Callable[[], Awaitable[T]]) -> T:
+    async with gigachat_token.authorization() as token:
+        try:
+            return await call()
+        except AuthenticationError:
+            await gigachat_token.invalidate(token)
+    async with gigachat_token.authorization():
+        return await call()
+
+
+class SharedTokenGigaChat(GigaChat):
+    """Чат-модель GigaChat с общим токеном"""
+
+    async def _agenerate(self, *args: Any, **kwargs: Any) -> ChatResult:
+        agenerate = super()._agenerate
+        return await with_shared_token(lambda: agenerate(*args, **kwargs))
+
+    async def _astream(self, *args: Any, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async with gigachat_token.authorization():
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+    async def aget_models(self):
+        aget_models = super().aget_models
+        return await with_shared_token(aget_models)
+
+
+class SharedTokenGigaChatEmbeddings(GigaChatEmbeddings):
+    """Эмбеддинги GigaChat с общим токеном; aembed_query вызывает aembed_documents"""
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        aembed_documents = super().aembed_documents
+        return await with_shared_token(lambda: aembed_documents(texts))
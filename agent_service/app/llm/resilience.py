@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Iterator, TypeVar
+
+import httpx
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from app.config import SETTINGS
+from app.llm.errors import BlackListException, ParserException, get_status_code
+
+T = TypeVar("T")
+
+# Момент (time.monotonic), к которому запрос пользователя должен быть обработан
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(timeout: float | None) -> Iterator[None]:
+    """Установить дедлайн запроса для всех вызовов LLM внутри блока"""
+    token = request_deadline.set(time.monotonic() + timeout if timeout else None)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+def remaining_time() -> float | None:
+    """Сколько секунд осталось до дедлайна запроса (None — дедлайна нет)"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Классификация ошибок: повторяем только транзиентные"""
+    if isinstance(exc, (BlackListException, ParserException)):
+        return False
+    status_code = get_status_code(exc)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError))
+
+
+def _deadline_exceeded(retry_state: RetryCallState) -> bool:
+    """Прекращаем повторы, если следующая попытка не успеет начаться до дедлайна"""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= retry_state.upcoming_sleep
+
+
+class LatencyTracker:
+    """Скользящее окно латентностей для расчёта задержки хеджирования"""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMResilience:
+    """Повторы с экспоненциальной задержкой и джиттером + опциональные хеджированные запросы"""
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            backoff_multiplier: float = 0.5,
+            backoff_max: float = 8.0,
+            hedge_enabled: bool = False,
+            hedge_quantile: float = 0.95,
+            hedge_min_samples: int = 20,
+    ) -> None:
+        self.max_attempts = int(max_attempts)
+        self.backoff_multiplier = float(backoff_multiplier)
+        self.backoff_max = float(backoff_max)
+        self.hedge_enabled = bool(hedge_enabled)
+        self.hedge_quantile = float(hedge_quantile)
+        self.hedge_min_samples = int(hedge_min_samples)
+        self.latencies = LatencyTracker()
+
+        # Метрики
+        self._retries = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+
+    def hedge_delay(self) -> float | None:
+        """Задержка перед отправкой дубликата; None — хеджирование не применяется"""
+        if not self.hedge_enabled or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    async def call(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Выполнить вызов с повторами, ограниченными дедлайном запроса"""
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts) | _deadline_exceeded,
+            wait=wait_random_exponential(multiplier=self.backoff_multiplier, max=self.backoff_max),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=self._before_sleep,
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                return await self._attempt(call)
+
+    async def _attempt(self, call: Callable[[], Awaitable[T]]) -> T:
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise asyncio.TimeoutError("Request deadline exceeded")
+
+        started_at = time.monotonic()
+        coro = self._hedged(call) if self.hedge_delay() is not None else call()
+        result = await asyncio.wait_for(coro, timeout=remaining)
+        self.latencies.add(time.monotonic() - started_at)
+        return result
+
+    async def _hedged(self, call: Callable[[], Awaitable[T]]) -> T:
+        """Отправить дубликат, если основной запрос не уложился в p95, и взять первый ответ"""
+        primary = asyncio.ensure_future(call())
+        pending = {primary}
+        # Обе фазы под одним finally: при отмене (дедлайн, отключение клиента) незавершённые запросы снимаются
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+
+            self._hedges += 1
+            hedge = asyncio.ensure_future(call())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    if hedge in succeeded and primary not in succeeded:
+                        self._hedge_wins += 1
+                    return succeeded[0].result()
+                # Ошибка одного из запросов не фатальна, пока жив второй
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _before_sleep(self, retry_state: RetryCallState) -> None:
+        self._retries += 1
+        logging.warning(msg={
+            "event": "LLM call retry",
+            "attempt": retry_state.attempt_number,
+            "sleep": round(retry_state.upcoming_sleep, 3),
+            "error": repr(retry_state.outcome.exception()),
+        })
+
+    def stats(self) -> dict:
+        p95 = self.latencies.quantile(0.95)
+        return {
+            "retries": self._retries,
+            "hedges": self._hedges,
+            "hedge_wins": self._hedge_wins,
+            "latency_p95": round(p95, 4) if p95 is not None else None,
+        }
+
+
+# Глобальный экземпляр слоя устойчивости
+llm_resilience = LLMResilience(
+    max_attempts=SETTINGS.LLM_RETRY_ATTEMPTS,
+    backoff_multiplier=SETTINGS.LLM_RETRY_BACKOFF,
+    backoff_max=SETTINGS.LLM_RETRY_BACKOFF_MAX,
+    hedge_enabled=SETTINGS.LLM_HEDGE_ENABLED,
+    hedge_quantile=SETTINGS.LLM_HEDGE_QUANTILE,
+)
@@ -0,0 +1,273 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, TypeVar
+
+from app.config import SETTINGS
+from app.llm.enums import PriorityEnum
+from app.llm.errors import SchedulerOverloadedException, get_status_code
+from app.telemetry import observe_llm_call
+
+T = TypeVar("T")
+
+# Чем меньше ранг, тем раньше запрос покидает очередь
+PRIORITY_RANKS = {
+    PriorityEnum.INTERACTIVE: 0,
+    PriorityEnum.BACKGROUND: 1,
+}
+
+
+class AdaptiveLimit:
+    """Лимит конкурентности с AIMD-адаптацией (аддитивный рост, мультипликативное снижение)"""
+
+    def __init__(
+            self,
+            max_limit: int,
+            min_limit: int = 1,
+            target_latency: float = 20.0,
+            decrease_factor: float = 0.5,
+            cooldown: float = 2.0
+    ) -> None:
+        self.max_limit = max(int(max_limit), 1)
+        self.min_limit = max(min(int(min_limit), self.max_limit), 1)
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit: float = float(self.max_limit)
+        self.in_flight: int = 0
+        self._last_decrease: float = 0.0
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.in_flight < max(int(self.limit), self.min_limit)
+
+    def on_success(self, latency: float) -> None:
+        if latency > self.target_latency:
+            self.decrease()
+            return
+        # +1 к лимиту примерно за одно «окно» успешных ответов
+        self.limit = min(float(self.max_limit), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def decrease(self) -> None:
+        now = time.monotonic()
+        # Одна всплеск-волна 429 должна снижать лимит один раз, а не на каждом ответе
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+
+
+@dataclass(order=True)
+class _Waiter:
+    rank: int
+    seq: int
+    model: str = field(compare=False)
+    priority: PriorityEnum = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+
+
+class LLMScheduler:
+    """Центральный планировщик вызовов LLM: глобальный и помодельный лимиты, приоритеты, backpressure"""
+
+    def __init__(
+            self,
+            max_concurrency: int = 16,
+            model_max_concurrency: int = 8,
+            min_concurrency: int = 1,
+            target_latency: float = 20.0,
+            queue_max_size: int = 64,
+            background_queue_max_size: int = 16,
+    ) -> None:
+        self.model_max_concurrency = int(model_max_concurrency)
+        self.min_concurrency = int(min_concurrency)
+        self.target_latency = float(target_latency)
+        self.queue_max_sizes = {
+            PriorityEnum.INTERACTIVE: int(queue_max_size),
+            PriorityEnum.BACKGROUND: int(background_queue_max_size),
+        }
+        self._global = AdaptiveLimit(
+            max_limit=max_concurrency,
+            min_limit=min_concurrency,
+            target_latency=self.target_latency
+        )
+        self._models: dict[str, AdaptiveLimit] = {}
+        self._waiters: list[_Waiter] = []
+        self._seq = itertools.count()
+
+        # Метрики
+        self._queue_times: deque[float] = deque(maxlen=1000)
+        self._latencies: deque[float] = deque(maxlen=1000)
+        self._completed = 0
+        self._rejected = 0
+        self._throttled = 0
+
+    def _model_limit(self, model: str) -> AdaptiveLimit:
+        limit = self._models.get(model)
+        if limit is None:
+            limit = AdaptiveLimit(
+                max_limit=self.model_max_concurrency,
+                min_limit=self.min_concurrency,
+                target_latency=self.target_latency
+            )
+            self._models[model] = limit
+        return limit
+
+    def queue_depth(self, priority: PriorityEnum | None = None) -> int:
+        if priority is None:
+            return len(self._waiters)
+        return sum(1 for waiter in self._waiters if waiter.priority == priority)
+
+    def retry_after(self) -> int:
+        """Оценка времени (в секундах), через которое очередь успеет рассосаться"""
+        avg_latency = sum(self._latencies) / len(self._latencies) if self._latencies else 1.0
+        slots = max(int(self._global.limit), 1)
+        return max(1, math.ceil(len(self._waiters) * avg_latency / slots))
+
+    def check_admission(self, priority: PriorityEnum = PriorityEnum.INTERACTIVE) -> None:
+        """Быстрый отказ, если очередь для данного приоритета переполнена"""
+        if self.queue_depth(priority) >= self.queue_max_sizes[priority]:
+            self._rejected += 1
+            raise SchedulerOverloadedException(
+                f"LLM queue is full for priority '{priority}'",
+                retry_after=self.retry_after()
+            )
+
+    async def run(
+            self,
+            model: str,
+            call: Callable[[], Awaitable[T]],
+            priority: PriorityEnum = PriorityEnum.INTERACTIVE
+    ) -> T:
+        """Выполнить вызов LLM, дождавшись свободного слота"""
+        queue_time = await self._acquire(model, priority)
+        started_at = time.monotonic()
+        try:
+            result = await call()
+        except Exception as e:
+            self._on_failure(model, e)
+            observe_llm_call(model, queue_time, time.monotonic() - started_at, None, e)
+            raise
+        else:
+            latency = time.monotonic() - started_at
+            self._on_success(model, latency)
+            observe_llm_call(model, queue_time, latency, result, None)
+            return result
+        finally:
+            self._release(model)
+
+    async def _acquire(self, model: str, priority: PriorityEnum) -> float:
+        """Дождаться слота; возвращает время ожидания в очереди"""
+        model_limit = self._model_limit(model)
+        rank = PRIORITY_RANKS[priority]
+        # Без очереди стартуем сразу, только если никто с не меньшим приоритетом уже не ждёт
+        ahead = any(waiter.rank <= rank for waiter in self._waiters)
+        if not ahead and self._global.has_capacity and model_limit.has_capacity:
+            self._take(model_limit)
+            self._queue_times.append(0.0)
+            return 0.0
+
+        waiter = _Waiter(
+            rank=rank,
+            seq=next(self._seq),
+            model=model,
+            priority=priority,
+            future=asyncio.get_running_loop().create_future()
+        )
+        heapq.heappush(self._waiters, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот уже выдан, но вызов не состоится — возвращаем его
+                self._release(model)
+            else:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+            raise
+        queue_time = time.monotonic() - waiter.enqueued_at
+        self._queue_times.append(queue_time)
+        return queue_time
+
+    def _take(self, model_limit: AdaptiveLimit) -> None:
+        self._global.in_flight += 1
+        model_limit.in_flight += 1
+
+    def _release(self, model: str) -> None:
+        self._global.in_flight -= 1
+        self._model_limit(model).in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Раздать освободившиеся слоты ожидающим в порядке приоритета"""
+        granted = []
+        for waiter in sorted(self._waiters):
+            if not self._global.has_capacity:
+                break
+            model_limit = self._model_limit(waiter.model)
+            if waiter.future.done() or not model_limit.has_capacity:
+                continue
+            self._take(model_limit)
+            waiter.future.set_result(None)
+            granted.append(waiter)
+        if granted:
+            self._waiters = [waiter for waiter in self._waiters if waiter not in granted]
+            heapq.heapify(self._waiters)
+
+    def _on_success(self, model: str, latency: float) -> None:
+        self._completed += 1
+        self._latencies.append(latency)
+        self._global.on_success(latency)
+        self._model_limit(model).on_success(latency)
+
+    def _on_failure(self, model: str, exc: BaseException) -> None:
+        if get_status_code(exc) == 429:
+            self._throttled += 1
+            self._global.decrease()
+            self._model_limit(model).decrease()
+            logging.warning(msg={
+                "event": "LLM rate limited",
+                "model": model,
+                "global_limit": self._global.limit,
+                "model_limit": self._models[model].limit
+            })
+
+    def stats(self) -> dict:
+        """Снимок метрик планировщика"""
+        queue_times = sorted(self._queue_times)
+
+        def percentile(q: float) -> float:
+            if not queue_times:
+                return 0.0
+            return queue_times[min(len(queue_times) - 1, int(q * len(queue_times)))]
+
+        return {
+            "in_flight": self._global.in_flight,
+            "global_limit": round(self._global.limit, 2),
+            "model_limits": {model: round(limit.limit, 2) for model, limit in self._models.items()},
+            "queue_depth": {priority.value: self.queue_depth(priority) for priority in PriorityEnum},
+            "queue_time": {
+                "p50": round(percentile(0.5), 4),
+                "p95": round(percentile(0.95), 4),
+                "max": round(queue_times[-1], 4) if queue_times else 0.0,
+            },
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "throttled": self._throttled,
+        }
+
+
+# Глобальный экземпляр планировщика
+llm_scheduler = LLMScheduler(
+    max_concurrency=SETTINGS.LLM_MAX_CONCURRENCY,
+    model_max_concurrency=SETTINGS.LLM_MODEL_MAX_CONCURRENCY,
+    min_concurrency=SETTINGS.LLM_MIN_CONCURRENCY,
+    target_latency=SETTINGS.LLM_TARGET_LATENCY,
+    queue_max_size=SETTINGS.LLM_QUEUE_MAX_SIZE,
+    background_queue_max_size=SETTINGS.LLM_BACKGROUND_QUEUE_MAX_SIZE,
+)
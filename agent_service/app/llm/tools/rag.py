@@ -1,20 +1,32 @@
 import logging
 import traceback
+from typing import Optional
 
 from langchain_core.documents import Document
-from langchain_gigachat import GigaChatEmbeddings
 from langchain_gigachat.tools.giga_tool import giga_tool
 from pydantic import BaseModel, Field
 
-from langchain_qdrant import QdrantVectorStore
-
 from app.config import SETTINGS
+from app.rag_client import rag_client
+from app.retrieval.pipeline import fetch_k, refine
 
 
 class Doc(BaseModel):
     page_content: str
     source: str
     collection_name: str
+    # Скор сходства из поиска: по нему узлы могут упорядочить или сократить контекст
+    score: Optional[float] = None
+
+    @classmethod
+    def from_document(cls, document: Document) -> "Doc":
+        """Преобразовать документ LangChain из поиска в Doc"""
+        return cls(
+            page_content=document.page_content,
+            source=document.metadata.get("source"),
+            collection_name=document.metadata.get("_collection_name"),
+            score=document.metadata.get("_score"),
+        )
 
 
 class RagResult(BaseModel):
@@ -44,34 +56,15 @@ async def rag_call(
         logging.info(
             msg={"event": "Вызов RAG", "collection_name": collection_name, "rag_request": rag_request}
         )
-        embeddings = GigaChatEmbeddings(
-            credentials=SETTINGS.GIGACHAT_CREDENTIALS,
-            verify_ssl_certs=False,
-            model=SETTINGS.EMBEDDING_MODEL
-        )
-
-        qdrant = QdrantVectorStore.from_existing_collection(
-            embedding=embeddings,
+        docs: list[Document] = await rag_client.search(
             collection_name=collection_name,
-            url=SETTINGS.QDRANT_URL,
-        )
-
-        logging.info(
-            msg={"event": "Вызов RAG", "collection_name": collection_name, "rag_request": rag_request}
-        )
-
-        docs: list[Document] = await qdrant.asimilarity_search(
             query=rag_request,
-            k=6,
-            timeout=15
+            k=fetch_k(),
+            timeout=15,
+            hnsw_ef=SETTINGS.QDRANT_HNSW_EF
         )
-        result_docs = [
-            Doc(
-                page_content=it.page_content,
-                source=it.metadata.get("source"),
-                collection_name=it.metadata.get("_collection_name"),
-            ) for it in docs
-        ]
+        docs = await refine(collection_name, rag_request, docs)
+        result_docs = [Doc.from_document(it) for it in docs]
 
         return RagResult(documents=result_docs, status=True)
     except Exception as e:
@@ -84,6 +77,9 @@ rag_tool = rag_call
 if __name__ == "__main__":
     import asyncio
 
+    from langchain_gigachat import GigaChatEmbeddings
+    from langchain_qdrant import QdrantVectorStore
+
     async def rag_call_test(
             collection_name: str = Field(description="Название коллекции данных, в которой будет производиться поиск"),
             rag_request: str = Field(description="Текст запроса для RAG")
@@ -1,16 +1,35 @@
+import time
+
+# Точка отсчёта холодного старта: отсюда начинается импорт приложения
+IMPORT_STARTED_AT = time.perf_counter()
+
 import traceback
 
-from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import time
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import asyncio
+import secrets
+import threading
 import uuid
 
 from app.config import SETTINGS
-from app.models import AgentRequest, AgentResponse
+from app.health import health_monitor
+from app.jobs import JobStatusEnum, job_queue
+from app.models import AgentRequest, AgentResponse, JobResponse
 from app.state_manager import state_manager
-from app.agent import Agent
+from app.agent import agent_flight, run_agent_turn
+from app.circuit_breaker import llm_breaker, qdrant_breaker
+from app.llm.auth import gigachat_token
+from app.llm.errors import SchedulerOverloadedException
+from app.llm.resilience import llm_resilience
+from app.llm.scheduler import llm_scheduler
+from app.profiling import loop_monitor, sampling_profiler
 from app.rag_client import rag_client
+from app.telemetry import observe_request, render_metrics, request_span
+from app.warmup import warmup
+
+IMPORT_TIME = time.perf_counter() - IMPORT_STARTED_AT
 
 # Создаем приложение
 app = FastAPI(
@@ -36,10 +55,17 @@ async def log_requests(request: Request, call_next):
     request_id = str(uuid.uuid4())
     start_time = time.time()
 
-    response = await call_next(request)
+    with request_span(request.method, request.url.path):
+        response = await call_next(request)
 
     process_time = time.time() - start_time
+    # Шаблон маршрута вместо пути, чтобы /jobs/{job_id} не плодил метки
+    route_path = getattr(request.scope.get("route"), "path", "unmatched")
+    observe_request(request.method, route_path, response.status_code, process_time)
+    warmup.observe_request(route_path, process_time)
     print(f"{request.method} {request.url.path} - {response.status_code} - {process_time:.2f}s - {request_id}")
+    # Время обработки сервисом: клиент вычитает его из своей латентности и получает ожидание в очереди
+    response.headers["X-Process-Time"] = f"{process_time:.4f}"
 
     return response
 
@@ -63,28 +89,68 @@ async def invoke_agent(
     """
     Основной эндпоинт для взаимодействия с агентом
     """
+    # Быстрый отказ (503 + Retry-After), если очередь к LLM переполнена
+    llm_scheduler.check_admission(request.priority)
+
     try:
-        # Получаем или создаем состояние
-        state = await state_manager.get_state(session_id)
-        if not state:
-            session_id, state = await state_manager.create_state(session_id)
-
-        agent = Agent(
-            message=request.query,
-            state=None,
-            session_id=session_id
+        return await run_agent_turn(
+            query=request.query,
+            session_id=session_id,
+            priority=request.priority
         )
-        response_model, new_state = await agent.invoke()
-
-        # Сохраняем обновленное состояние
-        await state_manager.save_state(session_id, new_state)
-
-        return response_model
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent error: {str(e)}, trace: {traceback.format_exc()}")
 
 
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(
+        request: AgentRequest,
+        session_id: str = Depends(get_session_id)
+):
+    """
+    Поставить запрос в очередь на выполнение воркерами агента
+    """
+    if await job_queue.queue_size() >= SETTINGS.JOB_QUEUE_MAX_SIZE:
+        raise HTTPException(status_code=503, detail="Job queue is full, try again later")
+
+    job_id = await job_queue.enqueue(
+        query=request.query,
+        session_id=session_id,
+        priority=request.priority
+    )
+    return JobResponse(job_id=job_id, status=JobStatusEnum.QUEUED, session_id=session_id)
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Получить статус и результат задания (polling)
+    """
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobResponse(**job)
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Поток изменений статуса задания (Server-Sent Events)
+    """
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        async for job in job_queue.events(job_id):
+            if not job:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {job['status']}\ndata: {JobResponse(**job).model_dump_json()}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 @app.post("/session/reset")
 async def reset_session(session_id: str = Depends(get_session_id)):
     """
@@ -99,37 +165,99 @@ async def reset_session(session_id: str = Depends(get_session_id)):
 
 @app.get("/health")
 async def health_check():
-    """Проверка здоровья сервиса"""
+    """Проверка здоровья сервиса по кэшу фоновых проб"""
+    probes = health_monitor.snapshot()
     status = {
         "status": "healthy",
         "timestamp": time.time(),
         "services": {
-            "redis": False,
-            "qdrant": False
-        }
+            "redis": health_monitor.is_healthy("redis"),
+            "qdrant": health_monitor.is_healthy("qdrant"),
+            "gigachat": health_monitor.is_healthy("gigachat")
+        },
+        "probes": probes
     }
 
-    # Проверяем Redis
-    try:
-        await state_manager.redis_client.ping()  # Асинхронный вызов
-        status["services"]["redis"] = True
-    except Exception as e:
-        print(f"Redis health check failed: {e}")
-        status["services"]["redis"] = False
-
-    # Проверяем Qdrant
-    try:
-        status["services"]["qdrant"] = await rag_client.health_check()
-    except:
-        status["services"]["qdrant"] = False
+    status["circuit_breakers"] = {
+        "llm": llm_breaker.stats(),
+        "qdrant": qdrant_breaker.stats()
+    }
 
-    # Если какой-то сервис недоступен
-    if not all(status["services"].values()):
+    # Если какой-то сервис недоступен или предохранитель разомкнут
+    if not all(status["services"].values()) or llm_breaker.is_open or qdrant_breaker.is_open:
         status["status"] = "degraded"
 
     return status
 
 
+@app.get("/livez")
+async def liveness():
+    """Процесс жив и цикл событий отвечает"""
+    return {"status": "alive", "uptime": round(time.time() - health_monitor.started_at, 1)}
+
+
+@app.get("/readyz")
+async def readiness():
+    """Готовность принимать трафик: прогрев завершён, критичные зависимости доступны по последним пробам"""
+    ready = warmup.done and health_monitor.ready
+    body = {
+        "status": "ready" if ready else "not_ready",
+        "warmup": warmup.done,
+        "dependencies": {
+            name: {"ok": health_monitor.is_healthy(name), "age": probe["age"], "critical": probe["critical"]}
+            for name, probe in health_monitor.snapshot().items()
+        }
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+@app.get("/stats")
+async def stats():
+    """Внутренние метрики компонентов сервиса"""
+    return {
+        "llm_scheduler": llm_scheduler.stats(),
+        "event_loop": loop_monitor.stats(),
+        "warmup": warmup.stats(),
+        "gigachat_token": gigachat_token.stats(),
+        "llm_resilience": llm_resilience.stats(),
+        "search_cache": rag_client.search_cache.stats(),
+        "singleflight": {
+            "rag_search": rag_client.search_flight.stats(),
+            "agent_first_turn": agent_flight.stats()
+        }
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(
+        seconds: float = Query(10.0, gt=0),
+        interval: float = Query(0.005, gt=0),
+        loop_only: bool = Query(True),
+        x_debug_token: str = Header(None, alias="X-Debug-Token")
+):
+    """
+    Настенный сэмплирующий профиль работающего сервиса в формате collapsed stacks (flamegraph)
+    """
+    if not SETTINGS.DEBUG_PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_debug_token or not secrets.compare_digest(x_debug_token, SETTINGS.DEBUG_PROFILE_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+    if sampling_profiler.busy:
+        raise HTTPException(status_code=409, detail="Profiling is already in progress")
+
+    # Обработчик выполняется в потоке цикла событий — по умолчанию сэмплируется только он
+    thread_id = threading.get_ident() if loop_only else None
+    seconds = min(seconds, SETTINGS.DEBUG_PROFILE_MAX_SECONDS)
+    return await asyncio.to_thread(sampling_profiler.profile, seconds, interval, thread_id)
+
+
 # Обработчики событий
 @app.on_event("startup")
 async def startup_event():
@@ -138,6 +266,15 @@ async def startup_event():
 
     # Подключаемся к Redis
     await state_manager.connect()
+    await job_queue.ensure_group()
+
+    if SETTINGS.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    await health_monitor.start()
+    if SETTINGS.WARMUP_ENABLED:
+        warmup.start(IMPORT_STARTED_AT, IMPORT_TIME)
+    else:
+        warmup.done = True
 
     print("✅ All services initialized")
 
@@ -145,6 +282,8 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка при завершении"""
+    await loop_monitor.stop()
+    await health_monitor.stop()
     await state_manager.disconnect()
     print("👋 Shutting down")
 
@@ -158,6 +297,15 @@ async def http_exception_handler(request, exc):
     )
 
 
+@app.exception_handler(SchedulerOverloadedException)
+async def overloaded_exception_handler(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "LLM queue is full, try again later"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     return JSONResponse(
@@ -175,7 +323,15 @@ async def root():
         "endpoints": {
             "POST /invoke": "Interact with the agent_service",
             "POST /rag/search": "Search documents (internal)",
+            "POST /jobs": "Enqueue a query for the agent workers",
+            "GET /jobs/{job_id}": "Poll job status and result",
+            "GET /jobs/{job_id}/events": "Job status updates (SSE)",
             "POST /session/reset": "Reset session state",
-            "GET /health": "Health check"
+            "GET /health": "Health check",
+            "GET /livez": "Liveness probe",
+            "GET /readyz": "Readiness probe",
+            "GET /stats": "Internal component metrics",
+            "GET /metrics": "Prometheus metrics",
+            "GET /debug/profile": "Sampling profile, collapsed stacks (X-Debug-Token)"
         }
     }
\ No newline at end of file
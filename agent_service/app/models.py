@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
+from app.llm.enums import PriorityEnum
 from app.llm.tools.rag import Doc
 
 
@@ -10,6 +11,7 @@ class AgentRequest(BaseModel):
     """Запрос к агенту"""
     query: str = Field(..., description="Запрос пользователя")
     session_id: Optional[str] = Field(None, description="ID сессии (опционально, если передается в заголовке)")
+    priority: PriorityEnum = Field(PriorityEnum.INTERACTIVE, description="Класс приоритета: interactive или background (prefetch)")
 
 
 class RAGRequest(BaseModel):
@@ -41,6 +43,16 @@ class AgentResponse(BaseModel):
     sources: list[Doc] = Field(default_factory=list, description="Источники информации")
     session_id: str = Field(..., description="ID сессии")
     is_error: bool = Field(description="Случилась ли ошибка")
+    is_degraded: bool = Field(False, description="Ответ сформирован в деградированном режиме без LLM")
+
+
+class JobResponse(BaseModel):
+    """Статус асинхронного задания агента"""
+    job_id: str = Field(..., description="ID задания")
+    status: str = Field(..., description="Статус: queued, running, done, failed")
+    session_id: Optional[str] = Field(None, description="ID сессии")
+    result: Optional[AgentResponse] = Field(None, description="Ответ агента, когда задание выполнено")
+    error: Optional[str] = Field(None, description="Описание ошибки, если задание провалилось")
 
 
 # Состояние агента
@@ -0,0 +1,128 @@
+"""
+Детектор блокировок event loop и сэмплирующий профилировщик
+
+LoopLagMonitor: задача в цикле событий обновляет «пульс», сторожевой поток замечает, что пульс
+застыл дольше порога, и пишет в лог стек потока цикла в момент блокировки.
+SamplingProfiler: настенный профиль за N секунд в формате collapsed stacks (flamegraph.pl, speedscope).
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from app.config import SETTINGS
+from app.telemetry import LOOP_LAG
+
+
+def format_thread_stack(thread_id: int) -> list[str]:
+    frame = sys._current_frames().get(thread_id)
+    return traceback.format_stack(frame) if frame else []
+
+
+class LoopLagMonitor:
+    """Задержка цикла событий и стеки синхронного кода, который его блокирует"""
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+        self._max_lag = 0.0
+        self._stalls = 0
+
+    def start(self) -> None:
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _beat(self) -> None:
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            lag = self._heartbeat - started_at - self.interval
+            LOOP_LAG.observe(lag)
+            self._max_lag = max(self._max_lag, lag)
+            if lag > self.threshold:
+                logging.warning(msg={"event": "Event loop lag", "lag": round(lag, 4)})
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked_for = time.monotonic() - heartbeat - self.interval
+            # Одна запись на блокировку: стек снимается, пока синхронный код ещё выполняется
+            if blocked_for > self.threshold and heartbeat != reported_heartbeat:
+                reported_heartbeat = heartbeat
+                self._stalls += 1
+                logging.warning(msg={
+                    "event": "Event loop blocked",
+                    "blocked_for": round(blocked_for, 4),
+                    "stack": "".join(format_thread_stack(self._loop_thread_id)),
+                })
+
+    def stats(self) -> dict:
+        return {"max_lag": round(self._max_lag, 4), "stalls": self._stalls, "threshold": self.threshold}
+
+
+class SamplingProfiler:
+    """Сэмплирование стеков потоков по настенному времени; работает в отдельном потоке"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval: float = 0.005, thread_id: Optional[int] = None) -> str:
+        """Collapsed stacks: «функция (файл:строка);...;функция (файл:строка) число_сэмплов» на строку"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("Profiling is already in progress")
+        try:
+            samples: Counter[str] = Counter()
+            own_thread = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_thread or (thread_id is not None and ident != thread_id):
+                        continue
+                    samples[self._collapse(frame)] += 1
+                time.sleep(interval)
+            return "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+
+# Глобальные экземпляры
+loop_monitor = LoopLagMonitor(interval=SETTINGS.LOOP_MONITOR_INTERVAL, threshold=SETTINGS.LOOP_LAG_THRESHOLD)
+sampling_profiler = SamplingProfiler()
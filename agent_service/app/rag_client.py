@@ -1,28 +1,217 @@
+import re
+import time
 from typing import Optional
 from app.config import SETTINGS
 
-from qdrant_client import QdrantClient
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Filter, QuantizationSearchParams, SearchParams
+
+from app.cassette import InteractionKindEnum, cassette_call
+from app.circuit_breaker import qdrant_breaker
+from app.llm.factory import create_embeddings
+from app.retrieval.cache import SearchCache
+from app.retrieval.neighbors import NeighborExpander
+from app.singleflight import SingleFlight
+from app.telemetry import observe_search
+
+# Суффикс версии коллекции (habr_articles_v3): данные лежат в версиях, поиск идёт только через алиас
+VERSION_SUFFIX_RE = re.compile(r"_v\d+$")
 
 
 class RAGClient:
     """Клиент для работы с векторной БД Qdrant"""
 
-    def __init__(self, qdrant_client: Optional[QdrantClient] = None):
+    # Ключи payload, в которых langchain-qdrant хранит текст и метаданные чанка
+    content_payload_key = "page_content"
+    metadata_payload_key = "metadata"
+
+    def __init__(
+            self,
+            qdrant_client: Optional[QdrantClient] = None,
+            async_client: Optional[AsyncQdrantClient] = None,
+            embeddings: Optional[Embeddings] = None
+    ):
         self.client = qdrant_client
         if not self.client:
             self.client = QdrantClient(
                 url=SETTINGS.QDRANT_URL,
             )
-        self.embedding_model = None
+        self.async_client = async_client
+        if not self.async_client:
+            self.async_client = AsyncQdrantClient(
+                url=SETTINGS.QDRANT_URL,
+            )
+        self.embedding_model = embeddings
+        self.search_flight = SingleFlight("rag_search")
+        self.search_cache = SearchCache(
+            size=SETTINGS.SEARCH_CACHE_SIZE,
+            payload_size=SETTINGS.SEARCH_CACHE_PAYLOAD_SIZE,
+            ttl=SETTINGS.SEARCH_CACHE_TTL,
+            alias_ttl=SETTINGS.SEARCH_CACHE_ALIAS_TTL,
+            enabled=SETTINGS.SEARCH_CACHE_ENABLED
+        )
+        self.neighbors = NeighborExpander(cache_size=SETTINGS.RETRIEVAL_NEIGHBORS_CACHE_SIZE)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Модель эмбеддингов создаётся один раз и переиспользуется между запросами"""
+        if self.embedding_model is None:
+            self.embedding_model = create_embeddings()
+        return self.embedding_model
+
+    async def search(
+            self,
+            collection_name: str,
+            query: str,
+            k: int = 6,
+            timeout: int = 15,
+            hnsw_ef: Optional[int] = None
+    ) -> list[Document]:
+        """Семантический поиск по коллекции; одинаковые одновременные запросы выполняются один раз"""
+        collection_name = self.alias_name(collection_name)
+        hnsw_ef = hnsw_ef or SETTINGS.QDRANT_HNSW_EF
+        # Кассета оборачивает склейку: запись попадает в кассету каждой сессии, а не только ведущей
+        documents = await cassette_call(
+            InteractionKindEnum.SEARCH,
+            {"collection_name": collection_name, "query": query, "k": k, "hnsw_ef": hnsw_ef},
+            lambda: self.search_flight.do(
+                (collection_name, query, k, hnsw_ef),
+                lambda: self._cached_search(collection_name, query, k, timeout, hnsw_ef)
+            )
+        )
+        # Каждый вызывающий получает собственные копии документов
+        return [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in documents]
+
+    async def warm_up(self, collection_name: str, query: str) -> None:
+        """Эмбеддинг и поиск в обход кэша и склейки запросов: прогреваются токен эмбеддингов, пул соединений и индекс"""
+        await self._search(self.alias_name(collection_name), query, k=1, timeout=15, hnsw_ef=SETTINGS.QDRANT_HNSW_EF)
+
+    @staticmethod
+    def alias_name(collection_name: str) -> str:
+        """Имя алиаса для коллекции: конкретная версия может быть удалена после переиндексации"""
+        return VERSION_SUFFIX_RE.sub("", collection_name)
+
+    @staticmethod
+    def search_params(hnsw_ef: Optional[int]) -> SearchParams:
+        """Параметры поиска; настройки квантования игнорируются коллекциями без него"""
+        return SearchParams(
+            hnsw_ef=hnsw_ef,
+            quantization=QuantizationSearchParams(
+                rescore=SETTINGS.QDRANT_QUANTIZATION_RESCORE,
+                oversampling=SETTINGS.QDRANT_QUANTIZATION_OVERSAMPLING
+            )
+        )
+
+    async def _cached_search(
+            self,
+            collection_name: str,
+            query: str,
+            k: int,
+            timeout: int,
+            hnsw_ef: Optional[int]
+    ) -> list[Document]:
+        """Поиск через кэш результатов; ищем прямо в версии за алиасом, чтобы ключ и точки совпадали"""
+        if not self.search_cache.enabled:
+            return await self._search(collection_name, query, k, timeout, hnsw_ef)
+
+        version = await self.search_cache.resolve_version(self.async_client, collection_name)
+        key = self.search_cache.key(version, query, k, hnsw_ef)
+        documents = await self.search_cache.get(
+            key, version, collection_name, lambda ids: self._retrieve(version, ids, collection_name)
+        )
+        if documents is not None:
+            return documents
+
+        started_at = time.perf_counter()
+        documents = await self._search(collection_name, query, k, timeout, hnsw_ef, target=version)
+        await self.search_cache.put(key, version, documents, time.perf_counter() - started_at)
+        return documents
+
+    async def _retrieve(self, target: str, ids: list, collection_name: str) -> list[Document]:
+        """Точки версии коллекции по id одним запросом (для попаданий в кэш без текстов)"""
+        points = await qdrant_breaker.call(
+            lambda: self.async_client.retrieve(collection_name=target, ids=ids, with_payload=True)
+        )
+        return [self._to_document(point, collection_name) for point in points]
+
+    async def expand_neighbors(self, collection_name: str, documents: list[Document], window: int) -> list[Document]:
+        """Склеить найденные чанки с ±window соседями того же файла"""
+        collection_name = self.alias_name(collection_name)
+        version = await self.search_cache.resolve_version(self.async_client, collection_name)
+        return await self.neighbors.expand(
+            version, documents, window, lambda condition, limit: self._scroll(version, condition, limit, collection_name)
+        )
+
+    async def _scroll(self, target: str, condition: Filter, limit: int, collection_name: str) -> list[Document]:
+        started_at = time.perf_counter()
+        try:
+            points, _ = await qdrant_breaker.call(
+                lambda: self.async_client.scroll(
+                    collection_name=target, scroll_filter=condition, limit=limit, with_payload=True, with_vectors=False
+                )
+            )
+        except Exception as e:
+            observe_search(collection_name, "neighbors", time.perf_counter() - started_at, e)
+            raise
+        observe_search(collection_name, "neighbors", time.perf_counter() - started_at)
+        return [self._to_document(point, collection_name) for point in points]
+
+    async def _search(
+            self,
+            collection_name: str,
+            query: str,
+            k: int,
+            timeout: int,
+            hnsw_ef: Optional[int],
+            target: Optional[str] = None
+    ) -> list[Document]:
+        """target — физическая коллекция (версия) для запроса; по умолчанию сам алиас"""
+        started_at = time.perf_counter()
+        try:
+            vector = await self.embeddings.aembed_query(query)
+        except Exception as e:
+            observe_search(collection_name, "embed", time.perf_counter() - started_at, e)
+            raise
+        observe_search(collection_name, "embed", time.perf_counter() - started_at)
+
+        started_at = time.perf_counter()
+        try:
+            response = await qdrant_breaker.call(
+                lambda: self.async_client.query_points(
+                    collection_name=target or collection_name,
+                    query=vector,
+                    limit=k,
+                    with_payload=True,
+                    search_params=self.search_params(hnsw_ef),
+                    timeout=timeout
+                )
+            )
+        except Exception as e:
+            observe_search(collection_name, "query", time.perf_counter() - started_at, e)
+            raise
+        observe_search(collection_name, "query", time.perf_counter() - started_at)
+        return [self._to_document(point, collection_name) for point in response.points]
+
+    def _to_document(self, point, collection_name: str) -> Document:
+        payload = point.payload or {}
+        metadata = dict(payload.get(self.metadata_payload_key) or {})
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = collection_name
+        # У точек из retrieve (Record) скора нет
+        metadata["_score"] = getattr(point, "score", None)
+        return Document(page_content=payload.get(self.content_payload_key, ""), metadata=metadata)
 
     async def health_check(self) -> bool:
         """Проверка здоровья сервиса"""
         try:
-            self.client.get_collections()
+            # Асинхронный клиент: синхронный вызов блокировал бы цикл событий на время запроса
+            await self.async_client.get_collections()
             return True
         except:
             return False
 
 
 # Глобальный экземпляр клиента RAG
-rag_client = RAGClient()
\ No newline at end of file
+rag_client = RAGClient()
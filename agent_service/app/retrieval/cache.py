@@ -0,0 +1,186 @@
+"""
+Кэш результатов векторного поиска
+
+Ключ — версия коллекции за алиасом, нормализованный запрос, k и hnsw_ef: после переиндексации
+алиас указывает на новую версию, и старые записи просто перестают находиться. В LRU и Redis
+хранятся только ссылки на точки со скорами; тексты чанков — в отдельном LRU по (версия, id)
+и при нехватке дочитываются из Qdrant одним запросом retrieve, без эмбеддинга и поиска.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+
+from langchain_core.documents import Document
+from qdrant_client import AsyncQdrantClient
+
+from app.circuit_breaker import qdrant_breaker
+from app.telemetry import SEARCH_CACHE_REQUESTS, SEARCH_CACHE_SAVED
+
+CACHE_KEY = "search_cache:{}"
+# Служебные поля метаданных, которые поиск добавляет к payload
+SERVICE_METADATA = ("_id", "_score", "_collection_name")
+
+# Дочитать документы по id точек версии коллекции
+FetchDocuments = Callable[[list], Awaitable[list[Document]]]
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class LRU:
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.items: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value) -> None:
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class SearchCache:
+    """Ссылки на найденные точки в LRU и Redis, тексты чанков — в LRU процесса"""
+
+    def __init__(
+            self,
+            size: int = 1024,
+            payload_size: int = 4096,
+            ttl: int = 3600,
+            alias_ttl: float = 30.0,
+            enabled: bool = True
+    ) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.alias_ttl = alias_ttl
+        self.refs = LRU(size)
+        self.payloads = LRU(payload_size)
+        self._versions: dict[str, tuple[str, float]] = {}
+        # Скользящее среднее стоимости промаха — оценка сэкономленного времени на попадание
+        self._miss_latency: Optional[float] = None
+        self._hits = {"memory": 0, "redis": 0}
+        self._misses = 0
+        self._saved = 0.0
+
+    @property
+    def redis_client(self):
+        # Импорт здесь: state_manager через app.states зависит от rag_client, а тот — от кэша
+        from app.state_manager import state_manager
+        return state_manager.redis_client
+
+    async def resolve_version(self, client: AsyncQdrantClient, alias: str) -> str:
+        """
+        Коллекция за алиасом; результат живёт alias_ttl секунд, поэтому переключение видно с этой задержкой
+
+        Запрос алиасов идёт через предохранитель Qdrant; если он не удался, используется последняя известная версия.
+        """
+        cached = self._versions.get(alias)
+        if cached and time.monotonic() - cached[1] < self.alias_ttl:
+            return cached[0]
+        try:
+            response = await qdrant_breaker.call(client.get_aliases)
+        except Exception as e:
+            if cached is None:
+                raise
+            logging.warning(msg={"event": "Alias resolution failed, using last known version", "alias": alias, "error": e})
+            return cached[0]
+        version = alias
+        for item in response.aliases:
+            if item.alias_name == alias:
+                version = item.collection_name
+                break
+        self._versions[alias] = (version, time.monotonic())
+        return version
+
+    @staticmethod
+    def key(version: str, query: str, k: int, hnsw_ef: Optional[int]) -> str:
+        raw = json.dumps([version, normalize_query(query), k, hnsw_ef], ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    async def get(self, key: str, version: str, alias: str, fetch: FetchDocuments) -> Optional[list[Document]]:
+        started_at = time.perf_counter()
+        refs, source = self.refs.get(key), "memory"
+        if refs is None:
+            refs, source = await self._redis_get(key), "redis"
+            if refs is not None:
+                self.refs.put(key, refs)
+        if refs is None:
+            self._misses += 1
+            SEARCH_CACHE_REQUESTS.labels(result="miss").inc()
+            return None
+
+        missing = [point_id for point_id, _ in refs if self.payloads.get((version, point_id)) is None]
+        if missing:
+            for document in await fetch(missing):
+                self._put_payload(version, document)
+
+        documents = []
+        for point_id, score in refs:
+            payload = self.payloads.get((version, point_id))
+            if payload is None:
+                # Точка пропала из версии — считаем промахом, результат пересчитается поиском
+                self._misses += 1
+                SEARCH_CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+            metadata = {**payload["metadata"], "_id": point_id, "_collection_name": alias, "_score": score}
+            documents.append(Document(page_content=payload["page_content"], metadata=metadata))
+
+        self._hits[source] += 1
+        SEARCH_CACHE_REQUESTS.labels(result=source).inc()
+        if self._miss_latency is not None:
+            saved = max(self._miss_latency - (time.perf_counter() - started_at), 0.0)
+            self._saved += saved
+            SEARCH_CACHE_SAVED.inc(saved)
+        return documents
+
+    async def put(self, key: str, version: str, documents: list[Document], latency: float) -> None:
+        """Сохранить результат поиска; latency — стоимость промаха (эмбеддинг и запрос к Qdrant)"""
+        self._miss_latency = latency if self._miss_latency is None else 0.9 * self._miss_latency + 0.1 * latency
+        refs = [(document.metadata["_id"], document.metadata["_score"]) for document in documents]
+        self.refs.put(key, refs)
+        for document in documents:
+            self._put_payload(version, document)
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.set(CACHE_KEY.format(key), json.dumps(refs), ex=self.ttl)
+        except Exception as e:
+            logging.warning(msg={"event": "Search cache write failed", "error": e})
+
+    def _put_payload(self, version: str, document: Document) -> None:
+        metadata = {name: value for name, value in document.metadata.items() if name not in SERVICE_METADATA}
+        self.payloads.put((version, document.metadata["_id"]), {"page_content": document.page_content, "metadata": metadata})
+
+    async def _redis_get(self, key: str) -> Optional[list]:
+        if self.redis_client is None:
+            return None
+        try:
+            cached = await self.redis_client.get(CACHE_KEY.format(key))
+        except Exception as e:
+            logging.warning(msg={"event": "Search cache read failed", "error": e})
+            return None
+        return [tuple(ref) for ref in json.loads(cached)] if cached else None
+
+    def stats(self) -> dict:
+        hits = sum(self._hits.values())
+        requests = hits + self._misses
+        return {
+            "enabled": self.enabled,
+            "hits": dict(self._hits),
+            "misses": self._misses,
+            "hit_ratio": round(hits / requests, 4) if requests else 0.0,
+            "saved_seconds": round(self._saved, 3),
+            "miss_latency": round(self._miss_latency, 4) if self._miss_latency is not None else None,
+            "entries": len(self.refs.items),
+            "payloads": len(self.payloads.items),
+        }
@@ -0,0 +1,99 @@
+"""
+Экстрактивное сжатие найденных документов перед промптом
+
+Документ делится на предложения, предложения оцениваются по запросу BM25 (матрица «предложение × термин
+запроса» в NumPy), и в документе остаются лучшие предложения в исходном порядке — в пределах доли
+ratio от исходной длины. Документ остаётся отдельным Doc со своим source, так что атрибуция сохраняется.
+"""
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.telemetry import CONTEXT_COMPRESSION
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?…])\s+|\n{2,}")
+WORD_RE = re.compile(r"\w{3,}", re.UNICODE)
+# Разрыв между оставленными предложениями
+GAP = " … "
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in SENTENCE_SPLIT_RE.split(text) if sentence.strip()]
+
+
+def words(text: str, stem: int = 0) -> list[str]:
+    """Слова текста в нижнем регистре; stem > 0 — грубая основа (первые stem букв) для словоформ"""
+    found = [word.lower() for word in WORD_RE.findall(text)]
+    return [word[:stem] for word in found] if stem else found
+
+
+def term_frequencies(query: str, texts: list[str], stem: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Матрица «текст × термин запроса» и длины текстов в словах"""
+    terms = sorted(set(words(query, stem)))
+    index = {term: i for i, term in enumerate(terms)}
+    tf = np.zeros((len(texts), len(terms)), dtype=np.float32)
+    lengths = np.zeros(len(texts), dtype=np.float32)
+    for row, text in enumerate(texts):
+        text_words = words(text, stem)
+        lengths[row] = len(text_words)
+        for word in text_words:
+            column = index.get(word)
+            if column is not None:
+                tf[row, column] += 1
+    return tf, lengths
+
+
+def bm25(tf: np.ndarray, lengths: np.ndarray, k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """BM25 по матрице частот; idf считается по тем же текстам"""
+    if tf.size == 0:
+        return np.zeros(len(tf), dtype=np.float32)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(tf) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+    return (tf * (k1 + 1) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def bm25_scores(query: str, sentences: list[str], stem: int = 0) -> np.ndarray:
+    """BM25 предложений по терминам запроса"""
+    return bm25(*term_frequencies(query, sentences, stem))
+
+
+def compress_text(query: str, text: str, ratio: float, min_sentences: int = 1) -> str:
+    """Лучшие по запросу предложения текста в исходном порядке, не длиннее ratio от текста"""
+    sentences = split_sentences(text)
+    if len(sentences) <= min_sentences:
+        return text
+    scores = bm25_scores(query, sentences)
+    budget = ratio * len(text)
+    kept, length = [], 0
+    # При равных скорах выигрывает более раннее предложение
+    for i in np.argsort(-scores, kind="stable"):
+        if len(kept) >= min_sentences and length + len(sentences[i]) > budget:
+            continue
+        kept.append(int(i))
+        length += len(sentences[i])
+
+    kept.sort()
+    parts = [sentences[kept[0]]]
+    for previous, current in zip(kept, kept[1:]):
+        parts.append(GAP if current - previous > 1 else " ")
+        parts.append(sentences[current])
+    return "".join(parts)
+
+
+def compress(query: str, documents: list[Document], ratio: float, min_sentences: int = 1) -> list[Document]:
+    """Сжатые копии документов; исходная длина сохраняется в метаданных _original_length"""
+    if ratio >= 1:
+        return documents
+    compressed = []
+    original_length = compressed_length = 0
+    for document in documents:
+        text = compress_text(query, document.page_content, ratio, min_sentences)
+        original_length += len(document.page_content)
+        compressed_length += len(text)
+        metadata = {**document.metadata, "_original_length": len(document.page_content)}
+        compressed.append(Document(page_content=text, metadata=metadata))
+    if original_length:
+        CONTEXT_COMPRESSION.observe(compressed_length / original_length)
+    return compressed
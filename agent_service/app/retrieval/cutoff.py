@@ -0,0 +1,64 @@
+"""
+Отсечение слабых совпадений по скору
+
+Поиск запрашивает max_k кандидатов; в контекст попадают документы со скором не ниже порога,
+до первого резкого падения скора относительно предыдущего документа. Всё, что отсечено здесь,
+не повторяется в промптах последующих вызовов LLM за ход.
+"""
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from app.telemetry import RETRIEVAL_K, RETRIEVAL_TOKENS
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (≈4 символа на токен)"""
+    return len(text) // 4 + 1
+
+
+def select_by_score(
+        documents: list[Document],
+        min_score: Optional[float] = None,
+        drop_ratio: Optional[float] = None,
+        min_k: int = 1,
+        max_k: Optional[int] = None
+) -> list[Document]:
+    """
+    Документы по убыванию скора до порога min_score или первого относительного падения больше drop_ratio
+
+    Первые min_k документов сохраняются всегда; если у выдачи нет скоров, она не отсекается.
+    После реранкера отсечение идёт по его скору (_rerank_score), иначе продвинутые им документы
+    отбрасывались бы первыми; порог min_score задан в единицах плотного поиска и тогда не применяется.
+    Порядок оставшихся документов — исходный (его могли задать реранкер или MMR).
+    """
+    documents = documents[:max_k] if max_k else documents
+    field = "_score"
+    if documents and all(document.metadata.get("_rerank_score") is not None for document in documents):
+        field, min_score = "_rerank_score", None
+    if any(document.metadata.get(field) is None for document in documents):
+        return documents
+
+    selected = []
+    for document in sorted(documents, key=lambda document: document.metadata[field], reverse=True):
+        score = document.metadata[field]
+        if len(selected) >= min_k:
+            if min_score is not None and score < min_score:
+                break
+            previous = selected[-1].metadata[field]
+            if drop_ratio is not None and previous > 0 and (previous - score) / previous > drop_ratio:
+                break
+        selected.append(document)
+    kept = {id(document) for document in selected}
+    return [document for document in documents if id(document) in kept]
+
+
+def observe_selection(candidates: list[Document], selected: list[Document]) -> int:
+    """Метрики отсечения; возвращает оценку сэкономленных токенов контекста"""
+    kept = sum(estimate_tokens(document.page_content) for document in selected)
+    # После MMR выбранные документы могут быть длиннее отброшенных — экономия не уходит в минус
+    dropped = max(sum(estimate_tokens(document.page_content) for document in candidates) - kept, 0)
+    RETRIEVAL_K.observe(len(selected))
+    RETRIEVAL_TOKENS.labels(kind="kept").inc(kept)
+    RETRIEVAL_TOKENS.labels(kind="dropped").inc(dropped)
+    return dropped
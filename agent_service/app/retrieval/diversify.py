@@ -0,0 +1,82 @@
+"""
+Подавление почти-дубликатов и MMR-отбор найденных чанков
+
+Соседние чанки перекрываются (overlap в chunk_text), похожие статьи дают почти одинаковые абзацы.
+Сходство текстов считается косинусом хэшированных словесных шинглов — без эмбеддингов документов,
+поэтому работает и для выдачи из кэша поиска. Релевантность — скор поиска.
+"""
+import re
+import zlib
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.telemetry import RETRIEVAL_DUPLICATES
+
+WORD_RE = re.compile(r"\w+")
+
+
+def shingle_vectors(texts: list[str], size: int = 4096, n: int = 3) -> np.ndarray:
+    """Нормированные векторы хэшированных n-грамм слов (строка на текст)"""
+    vectors = np.zeros((len(texts), size), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = WORD_RE.findall(text.lower())
+        shingles = [" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))]
+        buckets = [zlib.crc32(shingle.encode()) % size for shingle in shingles]
+        np.add.at(vectors[row], buckets, 1.0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def relevance(documents: list[Document], field: str = "_score") -> np.ndarray:
+    """Скоры поиска, приведённые к [0, 1]; без скоров — убывание по позиции в выдаче"""
+    scores = [document.metadata.get(field) for document in documents]
+    if any(score is None for score in scores):
+        return 1.0 - np.arange(len(documents), dtype=np.float32) / max(len(documents), 1)
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = scores.max() - scores.min()
+    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+
+def remove_near_duplicates(similarity: np.ndarray, threshold: float) -> list[int]:
+    """Индексы документов без почти-дубликатов: из группы похожих остаётся первый (лучший по выдаче)"""
+    kept = []
+    for i in range(len(similarity)):
+        if not kept or similarity[i, kept].max() < threshold:
+            kept.append(i)
+    return kept
+
+
+def mmr(similarity: np.ndarray, scores: np.ndarray, k: int, lambda_mult: float) -> list[int]:
+    """Maximal marginal relevance: lambda_mult * релевантность − (1 − lambda_mult) * сходство с уже выбранными"""
+    selected = [int(np.argmax(scores))]
+    candidates = [i for i in range(len(scores)) if i != selected[0]]
+    while candidates and len(selected) < k:
+        redundancy = similarity[np.ix_(candidates, selected)].max(axis=1)
+        marginal = lambda_mult * scores[candidates] - (1 - lambda_mult) * redundancy
+        selected.append(candidates.pop(int(np.argmax(marginal))))
+    return selected
+
+
+def diversify(
+        documents: list[Document],
+        k: Optional[int] = None,
+        lambda_mult: float = 0.7,
+        duplicate_threshold: float = 0.8
+) -> list[Document]:
+    """Убрать почти-дубликаты и выбрать k документов по MMR; порядок — порядок выбора"""
+    if len(documents) < 2:
+        return documents
+    similarity = shingle_vectors([document.page_content for document in documents])
+    similarity = similarity @ similarity.T
+
+    kept = remove_near_duplicates(similarity, duplicate_threshold)
+    RETRIEVAL_DUPLICATES.inc(len(documents) - len(kept))
+    similarity = similarity[np.ix_(kept, kept)]
+    kept_documents = [documents[i] for i in kept]
+    # После реранкера релевантность — его скор
+    reranked = all("_rerank_score" in document.metadata for document in kept_documents)
+    scores = relevance(kept_documents, "_rerank_score" if reranked else "_score")
+    selected = mmr(similarity, scores, k or len(kept), lambda_mult)
+    return [documents[kept[i]] for i in selected]
@@ -0,0 +1,7 @@
+from enum import StrEnum
+
+
+class RerankerEnum(StrEnum):
+    OFF = "off"
+    FEATURES = "features"
+    ONNX = "onnx"
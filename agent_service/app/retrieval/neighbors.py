@@ -0,0 +1,137 @@
+"""
+Расширение найденных чанков соседями (parent-document retrieval)
+
+Для каждого найденного чанка дочитываются ±window соседей того же файла — одним scroll-запросом
+с фильтром по metadata.file_path и metadata.chunk_index (под оба поля есть payload-индексы).
+Соседние чанки склеиваются в непрерывные фрагменты; перекрытие ищется по самому тексту, так как
+чанкер схлопывает пробелы и смещения char_start/char_end не совпадают с позициями в page_content.
+Прочитанные чанки кэшируются по (версия коллекции, файл, номер чанка).
+"""
+from collections import defaultdict
+from typing import Awaitable, Callable, Optional
+
+from langchain_core.documents import Document
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue
+
+from app.retrieval.cache import LRU
+from app.telemetry import RETRIEVAL_NEIGHBORS
+
+# Разделитель чанков без общего текста на стыке
+SEPARATOR = "\n"
+# Совпадение короче считается случайным, а не перекрытием чанков
+MIN_OVERLAP = 16
+
+# Прочитать точки по фильтру: (фильтр, лимит) -> документы
+ScrollDocuments = Callable[[Filter, int], Awaitable[list[Document]]]
+
+
+def source_key(document: Document) -> Optional[tuple[str, str]]:
+    """Поле и значение, по которым ищутся соседи: file_path уникален, source — только имя файла"""
+    metadata = document.metadata
+    if metadata.get("chunk_index") is None:
+        return None
+    if metadata.get("file_path"):
+        return "file_path", metadata["file_path"]
+    if metadata.get("source"):
+        return "source", metadata["source"]
+    return None
+
+
+def overlap_length(previous: str, current: str, min_overlap: int = MIN_OVERLAP) -> int:
+    """Длина самого длинного хвоста previous, с которого начинается current (0 — перекрытия нет)"""
+    probe = current[:min_overlap]
+    start = previous.find(probe, max(len(previous) - len(current), 0))
+    while start != -1:
+        if current.startswith(previous[start:]):
+            return len(previous) - start
+        start = previous.find(probe, start + 1)
+    return 0
+
+
+def merge_chunks(chunks: list[Document]) -> Document:
+    """Склеить подряд идущие чанки одного файла; перекрывающийся текст не дублируется"""
+    text = chunks[0].page_content
+    for chunk in chunks[1:]:
+        overlap = overlap_length(text, chunk.page_content)
+        text += chunk.page_content[overlap:] if overlap else SEPARATOR + chunk.page_content
+    metadata = dict(chunks[0].metadata)
+    metadata["char_end"] = chunks[-1].metadata.get("char_end")
+    metadata["chunk_indexes"] = [chunk.metadata["chunk_index"] for chunk in chunks]
+    return Document(page_content=text, metadata=metadata)
+
+
+class NeighborExpander:
+    """Соседние чанки найденных документов с кэшем по источнику"""
+
+    def __init__(self, cache_size: int = 4096) -> None:
+        self.chunks = LRU(cache_size)
+
+    @staticmethod
+    def _wanted(hit: Document, window: int) -> range:
+        index = hit.metadata["chunk_index"]
+        total = hit.metadata.get("total_chunks")
+        end = index + window + 1 if total is None else min(index + window + 1, total)
+        return range(max(index - window, 0), end)
+
+    async def expand(self, version: str, documents: list[Document], window: int, scroll: ScrollDocuments) -> list[Document]:
+        """Фрагменты ±window чанков вокруг найденных в порядке исходной выдачи; документы без номера чанка — как есть"""
+        if window <= 0:
+            return documents
+        hits = defaultdict(list)
+        for document in documents:
+            key = source_key(document)
+            if key is not None:
+                hits[key].append(document)
+                self.chunks.put((version, key, document.metadata["chunk_index"]), document)
+
+        # Недостающие соседи всех файлов — одним запросом
+        missing = defaultdict(list)
+        for key, file_hits in hits.items():
+            for hit in file_hits:
+                for index in self._wanted(hit, window):
+                    if self.chunks.get((version, key, index)) is None and index not in missing[key]:
+                        missing[key].append(index)
+        missing = {key: indexes for key, indexes in missing.items() if indexes}
+        requested = sum(len(indexes) for indexes in missing.values())
+        RETRIEVAL_NEIGHBORS.labels(result="cache").inc(
+            sum(len(self._wanted(hit, window)) - 1 for file_hits in hits.values() for hit in file_hits) - requested
+        )
+        if missing:
+            RETRIEVAL_NEIGHBORS.labels(result="fetched").inc(requested)
+            condition = Filter(should=[
+                Filter(must=[
+                    FieldCondition(key=f"metadata.{field}", match=MatchValue(value=value)),
+                    FieldCondition(key="metadata.chunk_index", match=MatchAny(any=indexes)),
+                ])
+                for (field, value), indexes in missing.items()
+            ])
+            for chunk in await scroll(condition, requested):
+                key = source_key(chunk)
+                if key is not None:
+                    self.chunks.put((version, key, chunk.metadata["chunk_index"]), chunk)
+
+        passages, covered = [], set()
+        for document in documents:
+            key = source_key(document)
+            if key is None:
+                passages.append(document)
+                continue
+            index = document.metadata["chunk_index"]
+            if (key, index) in covered:
+                continue
+            # Непрерывный отрезок вокруг чанка: соседние окна найденных чанков сливаются
+            indexes = {i for hit in hits[key] for i in self._wanted(hit, window)}
+            low = high = index
+            while low - 1 in indexes and self.chunks.get((version, key, low - 1)) is not None:
+                low -= 1
+            while high + 1 in indexes and self.chunks.get((version, key, high + 1)) is not None:
+                high += 1
+            covered.update((key, i) for i in range(low, high + 1))
+            passage = merge_chunks([self.chunks.get((version, key, i)) for i in range(low, high + 1)])
+            # Скор и служебные поля — от лучшего найденного чанка фрагмента
+            passage.metadata.update({
+                name: value for name, value in document.metadata.items() if name.startswith("_")
+            })
+            passage.metadata["chunk_index"] = index
+            passages.append(passage)
+        return passages
@@ -0,0 +1,121 @@
+"""
+Обработка выдачи поиска перед попаданием в контекст агента
+
+Стадии включаются настройками: переранжирование, подавление дубликатов и MMR, отсечение по скору,
+расширение соседними чанками, сжатие текста. Параметры передаются явно (RefineConfig), поэтому
+офлайн-оценка вызывает тот же refine, что и агент.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from app.config import SETTINGS
+from app.retrieval.compression import compress
+from app.retrieval.cutoff import observe_selection, select_by_score
+from app.retrieval.diversify import diversify
+from app.retrieval.rerank import Reranker, create_reranker, rerank
+
+# Глобальный экземпляр реранкера (None — переранжирование выключено)
+reranker = create_reranker(SETTINGS.RERANKER, SETTINGS.RERANKER_ONNX_PATH)
+
+
+@dataclass
+class RefineConfig:
+    """Параметры стадий обработки выдачи; у агента — из настроек (from_settings)"""
+    max_k: int
+    reranker: Optional[Reranker] = None
+    rerank_fetch_k: int = 30
+    # MMR-отбор max_k документов из fetch_k кандидатов с подавлением почти-дубликатов
+    diversify: bool = False
+    fetch_k: int = 0
+    mmr_lambda: float = 0.7
+    duplicate_threshold: float = 0.8
+    # Адаптивный top-k: отсечение по порогу и падению скора
+    adaptive_k: bool = False
+    score_floor: Optional[float] = None
+    score_drop: Optional[float] = None
+    min_k: int = 1
+    neighbors: int = 0
+    # Доля текста документов после сжатия (1 — без сжатия)
+    compression_ratio: float = 1.0
+    compression_min_sentences: int = 1
+
+    @classmethod
+    def from_settings(cls) -> "RefineConfig":
+        # Собирается на каждый вызов: бенчмарк меняет SETTINGS на ходу
+        return cls(
+            max_k=SETTINGS.RETRIEVAL_MAX_K,
+            reranker=reranker,
+            rerank_fetch_k=SETTINGS.RERANK_FETCH_K,
+            diversify=SETTINGS.RETRIEVAL_DIVERSIFY,
+            fetch_k=SETTINGS.RETRIEVAL_FETCH_K,
+            mmr_lambda=SETTINGS.RETRIEVAL_MMR_LAMBDA,
+            duplicate_threshold=SETTINGS.RETRIEVAL_DUPLICATE_THRESHOLD,
+            adaptive_k=SETTINGS.RETRIEVAL_ADAPTIVE_K,
+            score_floor=SETTINGS.RETRIEVAL_SCORE_FLOOR,
+            score_drop=SETTINGS.RETRIEVAL_SCORE_DROP,
+            min_k=SETTINGS.RETRIEVAL_MIN_K,
+            neighbors=SETTINGS.RETRIEVAL_NEIGHBORS,
+            compression_ratio=SETTINGS.CONTEXT_COMPRESSION_RATIO if SETTINGS.CONTEXT_COMPRESSION_ENABLED else 1.0,
+            compression_min_sentences=SETTINGS.CONTEXT_COMPRESSION_MIN_SENTENCES,
+        )
+
+    @property
+    def keep_k(self) -> int:
+        """Сколько документов ждёт MMR, а без него — контекст"""
+        return max(self.fetch_k, self.max_k) if self.diversify else self.max_k
+
+
+def fetch_k(config: Optional[RefineConfig] = None) -> int:
+    """Сколько кандидатов запрашивать у поиска: для реранкера и MMR нужен запас сверх max_k"""
+    config = config or RefineConfig.from_settings()
+    if config.reranker is not None:
+        return max(config.rerank_fetch_k, config.keep_k)
+    return config.keep_k
+
+
+async def refine(
+        collection_name: str,
+        query: str,
+        candidates: list[Document],
+        config: Optional[RefineConfig] = None
+) -> list[Document]:
+    """Документы для контекста из кандидатов поиска"""
+    config = config or RefineConfig.from_settings()
+    documents = candidates
+    if config.reranker is not None:
+        # Реранкер оставляет столько, сколько ждёт следующая стадия
+        documents = await rerank(config.reranker, query, documents, config.keep_k)
+    if config.diversify:
+        documents = diversify(
+            documents,
+            k=config.max_k,
+            lambda_mult=config.mmr_lambda,
+            duplicate_threshold=config.duplicate_threshold
+        )
+    else:
+        documents = documents[:config.max_k]
+    if config.adaptive_k:
+        documents = select_by_score(
+            documents,
+            min_score=config.score_floor,
+            drop_ratio=config.score_drop,
+            min_k=config.min_k
+        )
+    if config.neighbors > 0:
+        # Импорт здесь: rag_client сам зависит от пакета retrieval
+        from app.rag_client import rag_client
+        documents = await rag_client.expand_neighbors(collection_name, documents, config.neighbors)
+    if config.compression_ratio < 1:
+        documents = compress(
+            query, documents, ratio=config.compression_ratio, min_sentences=config.compression_min_sentences
+        )
+
+    # Экономия считается от max_k лучших кандидатов — того, что попало бы в контекст без обработки
+    saved_tokens = observe_selection(candidates[:config.max_k], documents)
+    logging.info(msg={
+        "event": "RAG refine", "query": query, "found": len(candidates), "kept": len(documents), "saved_tokens": saved_tokens
+    })
+    return documents
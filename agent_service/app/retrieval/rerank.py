@@ -0,0 +1,121 @@
+"""
+Локальное переранжирование кандидатов поиска на CPU
+
+Поиск перевыбирает кандидатов (RERANK_FETCH_K), реранкер переставляет их, дальше идут только лучшие.
+По умолчанию — линейная комбинация признаков без загрузки моделей: скор плотного поиска, BM25
+по кандидатам и покрытие терминов запроса. Если на диске есть ONNX-модель кросс-энкодера
+(model.onnx и tokenizer.json), можно использовать её (pip install onnxruntime tokenizers).
+"""
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.config import SETTINGS
+from app.retrieval.compression import bm25, term_frequencies
+from app.retrieval.diversify import relevance
+from app.retrieval.enums import RerankerEnum
+from app.telemetry import RERANK_DURATION
+
+# Длина основы слова: «асинхронный» и «асинхронного» совпадают
+STEM = 5
+
+
+def normalize(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min() if len(values) else 0.0
+    return (values - values.min()) / spread if spread > 0 else np.zeros_like(values)
+
+
+class Reranker(ABC):
+    """Оценка кандидатов по запросу: чем больше, тем релевантнее"""
+
+    name: str
+
+    @abstractmethod
+    def score(self, query: str, documents: list[Document]) -> np.ndarray:
+        ...
+
+
+class FeatureReranker(Reranker):
+    """Скор поиска, BM25 и покрытие терминов запроса с весами"""
+
+    name = RerankerEnum.FEATURES
+
+    def __init__(self, dense: float = 0.5, bm25: float = 0.3, coverage: float = 0.2) -> None:
+        self.weights = np.asarray([dense, bm25, coverage], dtype=np.float32)
+
+    def score(self, query: str, documents: list[Document]) -> np.ndarray:
+        tf, lengths = term_frequencies(query, [document.page_content for document in documents], STEM)
+        coverage = (tf > 0).mean(axis=1) if tf.shape[1] else np.zeros(len(documents), dtype=np.float32)
+        features = np.stack([
+            relevance(documents),
+            normalize(bm25(tf, lengths)),
+            coverage,
+        ], axis=1)
+        return features @ self.weights
+
+
+class OnnxCrossEncoder(Reranker):
+    """Кросс-энкодер в формате ONNX: пары (запрос, документ) оцениваются моделью батчем"""
+
+    name = RerankerEnum.ONNX
+
+    def __init__(self, path: Path, max_length: int = 512) -> None:
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.session = onnxruntime.InferenceSession(str(path / "model.onnx"), providers=["CPUExecutionProvider"])
+        self.inputs = {item.name for item in self.session.get_inputs()}
+
+    def score(self, query: str, documents: list[Document]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch([(query, document.page_content) for document in documents])
+        feed = {
+            "input_ids": np.asarray([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: value for name, value in feed.items() if name in self.inputs})[0]
+        # Один логит релевантности или два класса — берём последний столбец
+        return logits.reshape(len(documents), -1)[:, -1]
+
+
+def create_reranker(kind: str, onnx_path: Optional[str] = None) -> Optional[Reranker]:
+    """Реранкер по настройке RERANKER; без модели на диске ONNX заменяется признаковым"""
+    if kind not in set(RerankerEnum):
+        raise ValueError(f"Unknown reranker: {kind!r}, expected one of {[item.value for item in RerankerEnum]}")
+    if kind == RerankerEnum.OFF:
+        return None
+    if kind == RerankerEnum.ONNX:
+        path = Path(onnx_path) if onnx_path else None
+        if path and (path / "model.onnx").exists() and (path / "tokenizer.json").exists():
+            try:
+                return OnnxCrossEncoder(path, max_length=SETTINGS.RERANKER_MAX_LENGTH)
+            except ImportError:
+                logging.warning(msg={"event": "onnxruntime or tokenizers is not installed, using feature reranker"})
+        else:
+            logging.warning(msg={"event": "ONNX reranker model not found, using feature reranker", "path": onnx_path})
+    return FeatureReranker()
+
+
+async def rerank(reranker: Reranker, query: str, documents: list[Document], k: int) -> list[Document]:
+    """k лучших кандидатов по реранкеру; скор реранкера — в метаданных _rerank_score"""
+    if len(documents) < 2:
+        return documents
+    started_at = time.perf_counter()
+    # Оценка на CPU (у ONNX — десятки пар по 512 токенов) идёт в потоке, чтобы не блокировать цикл событий
+    scores = await asyncio.to_thread(reranker.score, query, documents)
+    RERANK_DURATION.labels(reranker=reranker.name).observe(time.perf_counter() - started_at)
+    order = np.argsort(-scores, kind="stable")[:k]
+    ranked = []
+    for i in order:
+        documents[i].metadata["_rerank_score"] = float(scores[i])
+        ranked.append(documents[i])
+    return ranked
@@ -0,0 +1,33 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Склейка одинаковых одновременных вызовов: пока вызов в полёте, повторные ждут его результат"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self._calls = 0
+        self._deduplicated = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._deduplicated += 1
+        else:
+            self._calls += 1
+            future = asyncio.ensure_future(call())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield: отмена одного из ожидающих не должна отменять общий вызов для остальных
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self._calls,
+            "deduplicated": self._deduplicated,
+            "in_flight": len(self._in_flight),
+        }
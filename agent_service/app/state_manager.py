@@ -51,17 +51,21 @@ class StateManager:
             print(f"Error getting state: {e}")
         return None
 
+    @staticmethod
+    def serialize_state(state: AgentState) -> str:
+        """Сериализовать состояние в JSON; модели сообщений и документов приводятся к словарям на месте"""
+        messages = [json.loads(message.model_dump_json()) for message in state.get("messages", [])]
+        state["messages"] = messages
+
+        documents = [json.loads(document.model_dump_json()) for document in state.get("documents", [])]
+        state["documents"] = documents
+
+        return json.dumps(state)
+
     async def save_state(self, session_id: str, state: AgentState) -> bool:
         """Сохранить состояние агента"""
         try:
-            # Приводим модели данных к словарям
-            messages = [json.loads(message.model_dump_json()) for message in state.get("messages", [])]
-            state["messages"] = messages
-
-            documents = [json.loads(document.model_dump_json()) for document in state.get("documents", [])]
-            state["documents"] = documents
-
-            data = json.dumps(state)
+            data = self.serialize_state(state)
 
             # Сохраняем с TTL
             await self.redis_client.setex(
@@ -0,0 +1,181 @@
+"""
+Метрики Prometheus и трассировка агента
+
+Гистограммы по узлам графа, вызовам LLM (латентность, очередь планировщика, токены),
+поиску в Qdrant и HTTP-запросам отдаются на /metrics. При OTEL_ENABLED и установленном
+opentelemetry-sdk те же участки выгружаются спанами через OTLP (OTEL_EXPORTER_OTLP_ENDPOINT).
+"""
+import contextlib
+import logging
+import os
+import time
+from typing import Any, Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    REGISTRY,
+)
+
+from app.config import SETTINGS
+
+# Границы корзин: узлы и вызовы LLM длятся секунды, поиск — миллисекунды
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+SEARCH_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 15)
+
+NODE_DURATION = Histogram(
+    "agent_node_duration_seconds", "Время выполнения узла графа", ["node"], buckets=LLM_BUCKETS
+)
+TURN_ITERATIONS = Histogram(
+    "agent_turn_iterations", "Итераций цикла ReAct за ход", ["outcome"], buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15)
+)
+LLM_DURATION = Histogram(
+    "agent_llm_call_duration_seconds", "Латентность вызова LLM без ожидания в очереди",
+    ["model", "outcome"], buckets=LLM_BUCKETS
+)
+LLM_QUEUE_TIME = Histogram(
+    "agent_llm_queue_seconds", "Ожидание слота в планировщике LLM", ["model"], buckets=SEARCH_BUCKETS + (30, 60)
+)
+LLM_TOKENS = Counter("agent_llm_tokens", "Токены вызовов LLM", ["model", "kind"])
+SEARCH_DURATION = Histogram(
+    "agent_qdrant_search_duration_seconds", "Поиск в Qdrant по стадиям: эмбеддинг запроса и запрос к коллекции",
+    ["collection", "stage", "outcome"], buckets=SEARCH_BUCKETS
+)
+REQUEST_DURATION = Histogram(
+    "agent_http_request_duration_seconds", "Время обработки HTTP-запроса",
+    ["method", "path", "status"], buckets=LLM_BUCKETS
+)
+SEARCH_CACHE_REQUESTS = Counter("agent_search_cache_requests", "Обращения к кэшу поиска", ["result"])
+SEARCH_CACHE_SAVED = Counter("agent_search_cache_saved_seconds", "Оценка сэкономленного времени поиска")
+RETRIEVAL_K = Histogram(
+    "agent_retrieval_kept_documents", "Документов в контексте после отсечения по скору", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30)
+)
+RETRIEVAL_TOKENS = Counter(
+    "agent_retrieval_context_tokens", "Оценка токенов найденных документов: в контексте и отсечённых", ["kind"]
+)
+RETRIEVAL_DUPLICATES = Counter("agent_retrieval_duplicates", "Почти-дубликаты, убранные из выдачи поиска")
+RETRIEVAL_NEIGHBORS = Counter(
+    "agent_retrieval_neighbor_chunks", "Соседние чанки для расширения выдачи: из кэша или дочитанные", ["result"]
+)
+RERANK_DURATION = Histogram(
+    "agent_rerank_duration_seconds", "Время переранжирования кандидатов поиска", ["reranker"], buckets=SEARCH_BUCKETS
+)
+CONTEXT_COMPRESSION = Histogram(
+    "agent_context_compression_ratio", "Доля длины найденных документов, оставшаяся после сжатия",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+LOOP_LAG = Histogram(
+    "agent_event_loop_lag_seconds", "Задержка пробуждения задачи в цикле событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+COLD_START = Gauge("agent_cold_start_seconds", "Холодный старт по фазам: импорты, прогрев, всего", ["phase"])
+FIRST_REQUEST = Gauge("agent_first_request_seconds", "Время обработки первого /invoke после старта")
+
+
+def _create_tracer():
+    """Трейсер OpenTelemetry или None, если трассировка выключена или SDK не установлен"""
+    if not SETTINGS.OTEL_ENABLED:
+        return None
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logging.warning(msg={"event": "OpenTelemetry is not installed, tracing disabled"})
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": SETTINGS.OTEL_SERVICE_NAME}))
+    # Адрес и заголовки экспортёра берутся из стандартных OTEL_EXPORTER_OTLP_*
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("agent_service")
+
+
+tracer = _create_tracer()
+
+
+def record_span(name: str, elapsed: float, attributes: dict) -> None:
+    """Спан задним числом: участок уже завершился и длился elapsed секунд"""
+    if tracer is None:
+        return
+    end_time = time.time_ns()
+    span = tracer.start_span(name, start_time=end_time - int(elapsed * 1e9), attributes=attributes)
+    span.end(end_time=end_time)
+
+
+@contextlib.contextmanager
+def request_span(method: str, path: str) -> Iterator[None]:
+    """Корневой спан HTTP-запроса: спаны узлов, LLM и поиска становятся его дочерними"""
+    if tracer is None:
+        yield
+        return
+    with tracer.start_as_current_span(f"{method} {path}", attributes={"http.method": method, "http.route": path}):
+        yield
+
+
+def observe_node(name: str, elapsed: float) -> None:
+    """Наблюдатель узлов графа (см. app.graph.nodes.node_observers)"""
+    NODE_DURATION.labels(node=str(name)).observe(elapsed)
+    record_span(f"node {name}", elapsed, {"agent.node": str(name)})
+
+
+def observe_turn(iterations: int, outcome: str) -> None:
+    TURN_ITERATIONS.labels(outcome=outcome).observe(iterations)
+
+
+def llm_message(result: Any) -> Any:
+    """Сообщение модели из ответа; structured output с include_raw несёт его в raw"""
+    return result.get("raw") if isinstance(result, dict) else result
+
+
+def token_usage(result: Any) -> tuple[int, int]:
+    """(prompt, completion) токены из ответа модели"""
+    result = llm_message(result)
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (getattr(result, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def observe_llm_call(model: str, queue_time: float, latency: float, result: Any, error: Optional[BaseException]) -> None:
+    """Вызов LLM из планировщика: очередь, латентность, токены"""
+    outcome = "error" if error else "ok"
+    LLM_QUEUE_TIME.labels(model=model).observe(queue_time)
+    LLM_DURATION.labels(model=model, outcome=outcome).observe(latency)
+    prompt_tokens, completion_tokens = token_usage(result) if error is None else (0, 0)
+    LLM_TOKENS.labels(model=model, kind="prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(model=model, kind="completion").inc(completion_tokens)
+    record_span("llm call", latency, {
+        "llm.model": model,
+        "llm.queue_time": queue_time,
+        "llm.prompt_tokens": prompt_tokens,
+        "llm.completion_tokens": completion_tokens,
+        "llm.outcome": outcome,
+    })
+
+
+def observe_search(collection: str, stage: str, elapsed: float, error: Optional[BaseException] = None) -> None:
+    outcome = "error" if error else "ok"
+    SEARCH_DURATION.labels(collection=collection, stage=stage, outcome=outcome).observe(elapsed)
+    record_span(f"qdrant {stage}", elapsed, {"qdrant.collection": collection, "qdrant.outcome": outcome})
+
+
+def observe_request(method: str, path: str, status: int, elapsed: float) -> None:
+    REQUEST_DURATION.labels(method=method, path=path, status=str(status)).observe(elapsed)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Текст для /metrics; при нескольких воркерах uvicorn метрики собираются из PROMETHEUS_MULTIPROC_DIR"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
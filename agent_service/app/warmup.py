@@ -0,0 +1,103 @@
+"""
+Прогрев сервиса при старте
+
+До включения готовности компилируются графы, получается токен и открываются соединения
+с GigaChat (модель и эмбеддинги), прогревается поиск в Qdrant. Время импортов, прогрева
+и первого запроса отдаётся в /metrics и /stats.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from app.config import SETTINGS
+from app.graph.enums import CollectionsEnum
+from app.llm.enums import PriorityEnum
+from app.llm.factory import get_chat_model
+from app.rag_client import rag_client
+from app.telemetry import COLD_START, FIRST_REQUEST
+
+WARMUP_QUERY = "прогрев"
+
+
+async def warm_graphs() -> None:
+    from app.agent import get_compiled_graph
+
+    for priority in PriorityEnum:
+        get_compiled_graph(priority)
+
+
+async def warm_llm() -> None:
+    """Токен и TLS-соединение с API модели; у сценарной модели прогревать нечего"""
+    model = get_chat_model()
+    if hasattr(model, "aget_models"):
+        await model.aget_models()
+
+
+async def warm_search() -> None:
+    """Эмбеддинг запроса (токен эмбеддингов) и поиск по алиасу (пул соединений Qdrant, страницы индекса)"""
+    # Мимо кэша поиска: попадание в Redis пропустило бы и эмбеддинг, и поиск
+    await rag_client.warm_up(CollectionsEnum.HABR_ARTICLES, WARMUP_QUERY)
+
+
+class Warmup:
+    """Шаги прогрева с замером времени; ошибки шага не блокируют готовность — только пишутся в лог"""
+
+    def __init__(self, timeout: float = 30.0) -> None:
+        self.timeout = timeout
+        self.steps: list[tuple[str, Callable[[], Awaitable[None]]]] = [
+            ("graphs", warm_graphs),
+            ("llm", warm_llm),
+            ("search", warm_search),
+        ]
+        self.done = False
+        self.durations: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.import_time: Optional[float] = None
+        self.cold_start: Optional[float] = None
+        self.first_request: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, started_at: float, import_time: float) -> None:
+        """Прогрев в фоне: /livez отвечает сразу, /readyz — после прогрева"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run(started_at, import_time))
+
+    async def run(self, started_at: float, import_time: float) -> None:
+        """started_at — time.perf_counter() в начале импорта приложения"""
+        self.import_time = import_time
+        COLD_START.labels(phase="imports").set(import_time)
+        warmup_started_at = time.perf_counter()
+        for name, step in self.steps:
+            step_started_at = time.perf_counter()
+            try:
+                await asyncio.wait_for(step(), timeout=self.timeout)
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                logging.warning(msg={"event": "Warmup step failed", "step": name, "error": self.errors[name]})
+            self.durations[name] = round(time.perf_counter() - step_started_at, 4)
+
+        COLD_START.labels(phase="warmup").set(time.perf_counter() - warmup_started_at)
+        self.cold_start = time.perf_counter() - started_at
+        COLD_START.labels(phase="total").set(self.cold_start)
+        self.done = True
+        logging.info(msg={"event": "Warmup finished", "cold_start": round(self.cold_start, 3), "steps": self.durations})
+
+    def observe_request(self, path: str, elapsed: float) -> None:
+        if self.first_request is None and path == "/invoke":
+            self.first_request = elapsed
+            FIRST_REQUEST.set(elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "done": self.done,
+            "import_time": self.import_time,
+            "cold_start": self.cold_start,
+            "steps": self.durations,
+            "errors": self.errors,
+            "first_request": self.first_request,
+        }
+
+
+# Глобальный экземпляр прогрева
+warmup = Warmup(timeout=SETTINGS.WARMUP_TIMEOUT)
@@ -0,0 +1,140 @@
+"""
+Пул процессов-воркеров агента, разбирающих очередь заданий из Redis Streams
+
+Запуск: python -m app.worker --processes 2 --concurrency 4
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import traceback
+
+from app.agent import run_agent_turn
+from app.config import SETTINGS
+from app.jobs import JobStatusEnum, job_queue
+from app.llm.enums import PriorityEnum
+from app.profiling import loop_monitor
+from app.state_manager import state_manager
+
+logging.basicConfig(level=logging.INFO)
+
+
+class AgentWorker:
+    """Потребитель группы: читает задания, выполняет агента, подтверждает сообщения"""
+
+    def __init__(self, consumer: str, concurrency: int):
+        self.consumer = consumer
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        await state_manager.connect()
+        await job_queue.ensure_group()
+        if SETTINGS.LOOP_MONITOR_ENABLED:
+            loop_monitor.start()
+        print(f"👷 Worker {self.consumer} started (concurrency={self.concurrency})")
+
+        try:
+            while not self._stopping.is_set():
+                # Ждём свободный слот до чтения, чтобы не забирать из стрима больше, чем можем выполнить
+                await self._slots.acquire()
+                self._slots.release()
+                free = self._free_slots()
+
+                messages = await job_queue.claim_stale(self.consumer, count=free)
+                if not messages:
+                    messages = await job_queue.read(self.consumer, count=free, block_ms=SETTINGS.JOB_READ_BLOCK_MS)
+
+                for message_id, fields in messages:
+                    await self._slots.acquire()
+                    task = asyncio.create_task(self._process(message_id, fields))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._on_done)
+        finally:
+            # Дожидаемся уже взятых заданий: неподтверждённые сообщения иначе ушли бы на повтор
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await loop_monitor.stop()
+            await state_manager.disconnect()
+            print(f"👋 Worker {self.consumer} stopped")
+
+    def _free_slots(self) -> int:
+        return max(self.concurrency - len(self._tasks), 1)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _process(self, message_id: str, fields: dict) -> None:
+        job_id = fields["job_id"]
+        try:
+            if await job_queue.delivery_count(message_id) > SETTINGS.JOB_MAX_DELIVERIES:
+                # Задание уже несколько раз роняло воркеров — не зацикливаемся на нём
+                await job_queue.set_status(job_id, JobStatusEnum.FAILED, error="Max deliveries exceeded")
+                await job_queue.ack(message_id)
+                return
+
+            await job_queue.set_status(job_id, JobStatusEnum.RUNNING)
+            response = await run_agent_turn(
+                query=fields["query"],
+                session_id=fields["session_id"],
+                priority=PriorityEnum(fields.get("priority", PriorityEnum.INTERACTIVE))
+            )
+            await job_queue.set_status(job_id, JobStatusEnum.DONE, result=response)
+            await job_queue.ack(message_id)
+        except Exception as e:
+            logging.error(msg={"event": "Job failed", "job_id": job_id, "traceback": traceback.format_exc(), "error": e})
+            await job_queue.set_status(job_id, JobStatusEnum.FAILED, error=str(e))
+            await job_queue.ack(message_id)
+
+
+async def worker_main(consumer: str, concurrency: int) -> None:
+    worker = AgentWorker(consumer=consumer, concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+def run_process(index: int, concurrency: int) -> None:
+    consumer = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    asyncio.run(worker_main(consumer, concurrency))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Пул воркеров агента")
+    parser.add_argument("--processes", type=int, default=SETTINGS.JOB_WORKER_PROCESSES)
+    parser.add_argument("--concurrency", type=int, default=SETTINGS.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_process(0, args.concurrency)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_process, args=(index, args.concurrency))
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def terminate(signum, frame):
+        # Оркестратор шлёт SIGTERM только родителю — пробрасываем его воркерам для мягкой остановки
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
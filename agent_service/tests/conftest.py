@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# Пакет app — из agent_service, чанкер — из scripts в корне репозитория
+AGENT_SERVICE = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(AGENT_SERVICE), str(AGENT_SERVICE.parent / "scripts")]
@@ -0,0 +1,45 @@
+import tracemalloc
+
+from chunking import TokenCounter, iter_chunks
+
+
+def paragraph_lines(size: int, blank_lines: bool):
+    """Строки текста размером около size символов; абзацы разделены пустой строкой или одним переводом строки"""
+    line = "Sentence number {} of a long document goes on. Another sentence follows it here.\n"
+    written = i = 0
+    while written < size:
+        text = line.format(i)
+        yield text
+        if blank_lines:
+            yield "\n"
+        written += len(text)
+        i += 1
+
+
+def peak_memory(lines) -> int:
+    tracemalloc.start()
+    try:
+        for _ in iter_chunks(lines, max_tokens=256, overlap_tokens=32, counter=TokenCounter()):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_memory_does_not_grow_without_blank_lines():
+    """Абзацы без пустых строк не копятся в один блок: пик памяти не зависит от размера файла"""
+    size = 1024 * 1024
+    # Предел — несколько блоков MAX_BLOCK_CHARS; без него весь файл оказывается одним блоком
+    assert peak_memory(paragraph_lines(size, blank_lines=False)) < size // 2
+
+
+def test_long_code_line_is_split_by_words():
+    """Строка кода длиннее чанка режется по словам, а не попадает в чанк целиком"""
+    counter = TokenCounter()
+    lines = ["```\n", " ".join(f"word{i}" for i in range(2000)) + "\n", "x = 1\n", "```\n"]
+
+    chunks = list(iter_chunks(lines, max_tokens=50, overlap_tokens=0, counter=counter))
+
+    assert len(chunks) > 10
+    assert all(chunk.tokens <= 50 for chunk in chunks)
+    assert all(counter.count(chunk.text) <= 60 for chunk in chunks)
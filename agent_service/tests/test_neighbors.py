@@ -0,0 +1,53 @@
+from langchain_core.documents import Document
+
+from app.retrieval.neighbors import merge_chunks, overlap_length
+from chunking import TokenCounter, iter_chunks
+
+TEXT = (
+    "# Заголовок\n"
+    "\n"
+    "Первый абзац.   Sentence number 1 goes on.  Sentence number 2 is here.\n"
+    "\n"
+    "\n"
+    "    Indented sentence number 3 of the paragraph. Sentence number 4 goes on.\n"
+    "Sentence number 5 is here.\n"
+    "\n"
+    "```\n"
+    "def f():\n"
+    "    return 1\n"
+    "```\n"
+    "\n"
+    + "".join(f"Sentence number {i} of the paragraph goes on.  " for i in range(6, 30))
+    + "\n\nLast   paragraph\twith  tabs.\n"
+)
+
+
+def chunk_documents(max_tokens: int, overlap_tokens: int) -> list[Document]:
+    chunks = iter_chunks(TEXT.splitlines(keepends=True), max_tokens, overlap_tokens, TokenCounter())
+    return [
+        Document(page_content=chunk.text, metadata={"chunk_index": i, "char_start": chunk.start, "char_end": chunk.end})
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def test_merged_neighbors_match_unsplit_text():
+    """Склейка перекрывающихся чанков совпадает с текстом, нарезанным одним чанком"""
+    [whole] = chunk_documents(max_tokens=10_000, overlap_tokens=0)
+    chunks = chunk_documents(max_tokens=30, overlap_tokens=14)
+    assert len(chunks) > 5
+    # Каждая пара соседей перекрывается — проверяется именно поиск перекрытия
+    assert all(overlap_length(a.page_content, b.page_content) for a, b in zip(chunks, chunks[1:]))
+
+    merged = merge_chunks(chunks)
+
+    assert merged.page_content == whole.page_content
+    assert merged.metadata["chunk_indexes"] == list(range(len(chunks)))
+
+
+def test_chunks_without_shared_text_are_joined_with_separator():
+    assert overlap_length("первый чанк без общего хвоста", "второй чанк с другим началом") == 0
+    merged = merge_chunks([
+        Document(page_content="first chunk text", metadata={"chunk_index": 0}),
+        Document(page_content="second chunk text", metadata={"chunk_index": 1}),
+    ])
+    assert merged.page_content == "first chunk text\nsecond chunk text"
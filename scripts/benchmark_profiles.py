@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк профилей коллекции Qdrant: полнота recall@k относительно точного поиска,
+латентность p50/p95 при разных hnsw_ef и оценка памяти.
+
+Векторы берутся из рабочей коллекции (по алиасу) или генерируются синтетически; для каждого
+профиля создаётся временная коллекция bench_{профиль}. Точные соседи считаются перебором в numpy.
+"""
+import argparse
+import json
+import os
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import CollectionStatus, OptimizersConfigDiff, PointStruct
+
+from collection_profiles import (
+    DEFAULT_EMBEDDING_DIMENSION,
+    PROFILES,
+    create_collection,
+    estimate_ram_bytes,
+    get_profile,
+    search_params,
+)
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "habr_articles")
+BENCH_PREFIX = "bench_"
+
+
+def load_vectors(client, collection_name, max_points):
+    """Выгрузить векторы рабочей коллекции скроллом"""
+    vectors = []
+    offset = None
+    while len(vectors) < max_points:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=min(256, max_points - len(vectors)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=True,
+        )
+        vectors.extend(point.vector for point in points)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(count, dimension, clusters=50, seed=42):
+    """Кластеризованные векторы — ближе к реальным эмбеддингам, чем равномерный шум"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    return centers[labels] + 0.35 * rng.normal(size=(count, dimension)).astype(np.float32)
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+
+def make_queries(vectors, count, noise=0.05, seed=7):
+    """Запросы — зашумлённые копии случайных точек, чтобы ближайший сосед не совпадал с запросом тривиально"""
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)]
+    scale = noise * np.linalg.norm(picked, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    return picked + scale * rng.normal(size=picked.shape).astype(np.float32)
+
+
+def exact_neighbours(vectors, queries, k):
+    """Точные top-k по косинусной близости"""
+    scores = normalize(queries) @ normalize(vectors).T
+    top = np.argpartition(-scores, kth=min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def wait_for_index(client, collection_name, timeout=600):
+    """Дождаться окончания построения индекса и квантования"""
+    started_at = time.time()
+    while time.time() - started_at < timeout:
+        info = client.get_collection(collection_name)
+        if info.status == CollectionStatus.GREEN:
+            return time.time() - started_at
+        time.sleep(0.5)
+    raise TimeoutError(f"Коллекция '{collection_name}' не проиндексирована за {timeout}s")
+
+
+def fill_collection(client, collection_name, vectors, batch_size=256):
+    for start in range(0, len(vectors), batch_size):
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                PointStruct(id=start + i, vector=vector.tolist())
+                for i, vector in enumerate(vectors[start:start + batch_size])
+            ],
+            wait=True,
+        )
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def bench_profile(client, profile_name, vectors, queries, truth, k, ef_values):
+    profile = get_profile(profile_name)
+    collection_name = f"{BENCH_PREFIX}{profile_name}_{uuid.uuid4().hex[:6]}"
+    # Низкий порог индексации, чтобы HNSW строился и на небольшой выборке
+    create_collection(
+        client, collection_name, vectors.shape[1], profile_name,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=1)
+    )
+    try:
+        started_at = time.time()
+        fill_collection(client, collection_name, vectors)
+        index_time = time.time() - started_at + wait_for_index(client, collection_name)
+
+        results = []
+        for ef in ef_values:
+            latencies = []
+            hits = 0
+            params = search_params(profile, hnsw_ef=ef)
+            for query, expected in zip(queries, truth):
+                started_at = time.perf_counter()
+                response = client.query_points(
+                    collection_name=collection_name,
+                    query=query.tolist(),
+                    limit=k,
+                    search_params=params,
+                )
+                latencies.append(time.perf_counter() - started_at)
+                hits += len({point.id for point in response.points} & set(expected.tolist()))
+            results.append({
+                "hnsw_ef": ef,
+                f"recall@{k}": hits / (len(queries) * k),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+            })
+        return {
+            "profile": profile_name,
+            "index_time_s": index_time,
+            "estimated_ram_mb": estimate_ram_bytes(len(vectors), vectors.shape[1], profile) / 1024 / 1024,
+            "results": results,
+        }
+    finally:
+        client.delete_collection(collection_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк профилей коллекции Qdrant")
+    parser.add_argument("--source", default=QDRANT_COLLECTION, help="Коллекция или алиас с векторами")
+    parser.add_argument("--synthetic", type=int, default=0, help="Сгенерировать N синтетических векторов вместо выгрузки")
+    parser.add_argument("--dimension", type=int, default=DEFAULT_EMBEDDING_DIMENSION, help="Размерность синтетических векторов")
+    parser.add_argument("--max-points", type=int, default=20000, help="Сколько векторов выгрузить из коллекции")
+    parser.add_argument("--profiles", nargs="+", choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--queries", type=int, default=200, help="Число запросов")
+    parser.add_argument("--k", type=int, default=6, help="Размер выдачи (как в rag_call)")
+    parser.add_argument("--ef", type=int, nargs="+", default=[32, 64, 128, 256], help="Значения hnsw_ef")
+    parser.add_argument("--output", help="Сохранить результаты в JSON")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY or None, timeout=60)
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dimension)
+        print(f"🧪 Синтетические векторы: {vectors.shape[0]} x {vectors.shape[1]}")
+    else:
+        vectors = load_vectors(client, args.source, args.max_points)
+        print(f"📥 Выгружено {vectors.shape[0]} векторов из '{args.source}'")
+    if len(vectors) <= args.k:
+        raise SystemExit("❌ Слишком мало векторов для бенчмарка")
+
+    queries = make_queries(vectors, args.queries)
+    truth = exact_neighbours(vectors, queries, args.k)
+
+    report = []
+    for profile_name in args.profiles:
+        print(f"\n⚙️  Профиль '{profile_name}'...")
+        result = bench_profile(client, profile_name, vectors, queries, truth, args.k, args.ef)
+        report.append(result)
+        print(f"   индексация {result['index_time_s']:.1f}s, оценка RAM {result['estimated_ram_mb']:.1f} MB")
+        for row in result["results"]:
+            print(f"   ef={row['hnsw_ef']:<4} recall@{args.k}={row[f'recall@{args.k}']:.3f} "
+                  f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"points": len(vectors), "dimension": int(vectors.shape[1]), "k": args.k, "profiles": report},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Чанкер с учётом структуры текста и числа токенов
+
+Файл читается построчно (постоянная память даже для файлов в сотни МБ), делится на блоки
+по абзацам, заголовкам Markdown и блокам кода, абзацы — на предложения. Блок длиннее
+max_block_chars выдаётся частями по границам строк, чтобы абзац без пустых строк не копился целиком. Из этих единиц
+набираются чанки заданного размера в токенах с перекрытием. Блоки кода не разрезаются,
+пока помещаются в чанк.
+"""
+import itertools
+import re
+from collections import deque
+from dataclasses import dataclass
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?…])[\"»)\]]*\s+(?=[\"«(\[]?[A-ZА-ЯЁ0-9])")
+TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s")
+# Предел блока в символах: дальше блок выдаётся частями по границам строк
+MAX_BLOCK_CHARS = 64 * 1024
+
+
+class TokenCounter:
+    """Подсчёт токенов: tiktoken, если установлен, иначе приближение по словам и знакам"""
+
+    def __init__(self, encoding_name="cl100k_base"):
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(encoding_name)
+        except Exception:
+            self._encoding = None
+
+    @property
+    def name(self):
+        return self._encoding.name if self._encoding else "regex"
+
+    def count(self, text):
+        if self._encoding:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(TOKEN_RE.findall(text))
+
+
+@dataclass
+class Unit:
+    """Неделимая единица текста (предложение или блок кода) с позицией в файле"""
+    text: str
+    start: int
+    end: int
+    tokens: int
+    # Разделитель перед единицей при склейке: новый блок начинается с новой строки
+    separator: str = " "
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    tokens: int
+
+
+def iter_blocks(lines, max_block_chars=MAX_BLOCK_CHARS):
+    """
+    Разбить поток строк на блоки: абзацы, заголовки, блоки кода.
+    Возвращает (текст, смещение начала, является_ли_кодом); смещения — в символах от начала файла
+    """
+    offset = 0
+    block_lines = []
+    block_chars = 0
+    block_start = 0
+    in_fence = False
+
+    def flush(is_code=False):
+        nonlocal block_chars
+        text = "".join(block_lines)
+        block_lines.clear()
+        block_chars = 0
+        if text.strip():
+            return text, block_start, is_code
+        return None
+
+    for line in lines:
+        is_fence = bool(FENCE_RE.match(line))
+        if in_fence:
+            block_lines.append(line)
+            if is_fence:
+                in_fence = False
+                block = flush(is_code=True)
+                if block:
+                    yield block
+        elif is_fence:
+            block = flush()
+            if block:
+                yield block
+            block_start = offset
+            block_lines.append(line)
+            in_fence = True
+        elif not line.strip():
+            block = flush()
+            if block:
+                yield block
+        elif HEADING_RE.match(line):
+            block = flush()
+            if block:
+                yield block
+            block_start = offset
+            block_lines.append(line)
+            # Заголовок — отдельный блок, чтобы он прилипал к следующему абзацу в одном чанке
+            block = flush()
+            if block:
+                yield block
+        else:
+            if not block_lines:
+                block_start = offset
+            block_lines.append(line)
+        offset += len(line)
+        if block_lines:
+            block_chars += len(line)
+            if block_chars >= max_block_chars:
+                # Продолжение длинного абзаца или блока кода — следующая часть с новой строки
+                block = flush(is_code=in_fence)
+                block_start = offset
+                if block:
+                    yield block
+
+    block = flush(is_code=in_fence)
+    if block:
+        yield block
+
+
+def iter_units(lines, counter):
+    """Разложить блоки на предложения (текст) и цельные блоки кода"""
+    for text, block_start, is_code in iter_blocks(lines):
+        if is_code:
+            stripped = text.rstrip("\n")
+            yield Unit(stripped, block_start, block_start + len(stripped), counter.count(stripped), "\n")
+            continue
+        position = 0
+        separator = "\n"
+        # Границы предложений — лениво, без списка всех совпадений блока
+        for match in itertools.chain(SENTENCE_END_RE.finditer(text), [None]):
+            end = match.start() if match else len(text)
+            sentence = text[position:end]
+            stripped = sentence.strip()
+            if stripped:
+                start = block_start + position + (len(sentence) - len(sentence.lstrip()))
+                yield Unit(" ".join(stripped.split()), start, start + len(stripped), counter.count(stripped), separator)
+                separator = " "
+            if match:
+                position = match.end()
+
+
+def iter_pieces(text, max_tokens, counter):
+    """Строки текста, а строки длиннее max_tokens — по словам; возвращает (кусок, разделитель перед ним)"""
+    for i, line in enumerate(text.split("\n")):
+        separator = "\n" if i else ""
+        if counter.count(line) <= max_tokens:
+            yield line, separator
+            continue
+        for j, word in enumerate(line.split(" ")):
+            yield word, separator if j == 0 else " "
+
+
+def split_oversized(unit, max_tokens, counter):
+    """Единица длиннее чанка (огромное предложение или блок кода) режется по строкам, затем по словам"""
+    current = None
+    current_tokens = 0
+    separator = unit.separator
+    # Позиция внутри единицы; смещения приблизительны, если пробелы были схлопнуты
+    position = 0
+    for piece, joiner in iter_pieces(unit.text, max_tokens, counter):
+        piece_tokens = counter.count(piece)
+        if current is not None and current_tokens + piece_tokens > max_tokens:
+            yield Unit(current, unit.start + position, unit.start + position + len(current), current_tokens, separator)
+            position += len(current) + len(joiner)
+            current, current_tokens, separator = None, 0, joiner
+        current = piece if current is None else current + joiner + piece
+        current_tokens += piece_tokens
+    if current is not None:
+        yield Unit(current, unit.start + position, min(unit.end, unit.start + position + len(current)), current_tokens, separator)
+
+
+def iter_chunks(lines, max_tokens=512, overlap_tokens=64, counter=None):
+    """Собрать из единиц чанки не длиннее max_tokens с перекрытием около overlap_tokens"""
+    counter = counter or TokenCounter()
+    window = deque()
+    window_tokens = 0
+    # Сколько единиц в начале окна уже были выданы в предыдущем чанке (перекрытие)
+    carried = 0
+
+    def emit():
+        text = window[0].text + "".join(unit.separator + unit.text for unit in list(window)[1:])
+        return Chunk(text=text, start=window[0].start, end=window[-1].end, tokens=window_tokens)
+
+    for source_unit in iter_units(lines, counter):
+        units = [source_unit] if source_unit.tokens <= max_tokens else split_oversized(source_unit, max_tokens, counter)
+        for unit in units:
+            if window and window_tokens + unit.tokens > max_tokens:
+                if len(window) > carried:
+                    yield emit()
+                # Оставляем хвост окна как перекрытие со следующим чанком
+                while window and (window_tokens > overlap_tokens or window_tokens + unit.tokens > max_tokens):
+                    window_tokens -= window.popleft().tokens
+                carried = len(window)
+            window.append(unit)
+            window_tokens += unit.tokens
+
+    if window and len(window) > carried:
+        yield emit()
+
+
+def chunk_file(file_path, max_tokens=512, overlap_tokens=64, counter=None):
+    """Потоково разбить файл на чанки"""
+    # newline="" сохраняет переводы строк как есть, чтобы смещения совпадали с файлом
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        yield from iter_chunks(f, max_tokens=max_tokens, overlap_tokens=overlap_tokens, counter=counter)
@@ -0,0 +1,149 @@
+"""
+Профили настройки коллекций Qdrant: параметры HNSW, квантование, хранение векторов на диске
+и payload-индексы. Один и тот же профиль применяют init_db.py, load_documents.py и бенчмарк
+"""
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    Distance,
+    HnswConfigDiff,
+    PayloadSchemaType,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+# Размерность EmbeddingsGigaR
+DEFAULT_EMBEDDING_DIMENSION = 2560
+
+# Поля payload (в metadata langchain-qdrant), по которым фильтруется поиск и скролл соседних чанков
+PAYLOAD_INDEXES = {
+    "metadata.source": PayloadSchemaType.KEYWORD,
+    "metadata.file_path": PayloadSchemaType.KEYWORD,
+    "metadata.chunk_index": PayloadSchemaType.INTEGER,
+}
+
+PROFILES = {
+    # Настройки Qdrant по умолчанию, векторы float32 в памяти
+    "default": {
+        "m": 16,
+        "ef_construct": 100,
+        "hnsw_ef": 128,
+        "quantization": None,
+        "on_disk": False,
+    },
+    # Более плотный граф: выше полнота ценой памяти и времени построения
+    "precise": {
+        "m": 32,
+        "ef_construct": 256,
+        "hnsw_ef": 256,
+        "quantization": None,
+        "on_disk": False,
+    },
+    # int8 в памяти, исходные векторы на диске, пересчёт скоров по исходным векторам
+    "scalar": {
+        "m": 16,
+        "ef_construct": 128,
+        "hnsw_ef": 128,
+        "quantization": "scalar",
+        "on_disk": True,
+        "oversampling": 2.0,
+    },
+    # 1 бит на измерение (в 32 раза меньше памяти); для высоких размерностей вроде 2560
+    "binary": {
+        "m": 16,
+        "ef_construct": 128,
+        "hnsw_ef": 128,
+        "quantization": "binary",
+        "on_disk": True,
+        "oversampling": 3.0,
+    },
+}
+
+
+def get_profile(name):
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный профиль '{name}', доступны: {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+
+def vectors_config(dimension, profile):
+    return VectorParams(size=dimension, distance=Distance.COSINE, on_disk=profile["on_disk"])
+
+
+def hnsw_config(profile):
+    return HnswConfigDiff(m=profile["m"], ef_construct=profile["ef_construct"])
+
+
+def quantization_config(profile):
+    if profile["quantization"] == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if profile["quantization"] == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def search_params(profile, hnsw_ef=None, exact=False):
+    """Параметры поиска профиля: ef и пересчёт скоров по исходным векторам при квантовании"""
+    quantization = None
+    if profile["quantization"]:
+        quantization = QuantizationSearchParams(rescore=True, oversampling=profile.get("oversampling"))
+    return SearchParams(hnsw_ef=hnsw_ef or profile["hnsw_ef"], exact=exact, quantization=quantization)
+
+
+def create_collection(client, collection_name, dimension, profile_name="default", optimizers_config=None):
+    """Создать коллекцию по профилю вместе с payload-индексами"""
+    profile = get_profile(profile_name)
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=vectors_config(dimension, profile),
+        hnsw_config=hnsw_config(profile),
+        quantization_config=quantization_config(profile),
+        optimizers_config=optimizers_config,
+    )
+    create_payload_indexes(client, collection_name)
+
+
+def create_payload_indexes(client, collection_name):
+    existing = client.get_collection(collection_name).payload_schema or {}
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=schema)
+
+
+def apply_profile(client, collection_name, profile_name):
+    """
+    Применить профиль к существующей коллекции; Qdrant перестроит индекс и квантование в фоне,
+    поиск при этом продолжает работать
+    """
+    profile = get_profile(profile_name)
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": VectorParamsDiff(on_disk=profile["on_disk"])},
+        hnsw_config=hnsw_config(profile),
+        quantization_config=quantization_config(profile) or Disabled.DISABLED,
+    )
+    create_payload_indexes(client, collection_name)
+
+
+def estimate_ram_bytes(points, dimension, profile):
+    """
+    Оценка памяти под векторы и граф HNSW: float32 в памяти (если не на диске),
+    квантованные векторы и связи графа (~2m соседей на нулевом уровне по 4 байта)
+    """
+    ram = 0
+    if not profile["on_disk"]:
+        ram += points * dimension * 4
+    if profile["quantization"] == "scalar":
+        ram += points * dimension
+    elif profile["quantization"] == "binary":
+        ram += points * dimension // 8
+    ram += points * profile["m"] * 2 * 4
+    return ram
@@ -0,0 +1,94 @@
+"""
+Версионированные коллекции Qdrant за алиасом (blue/green переиндексация)
+
+Поиск всегда идёт по алиасу (например, habr_articles), который указывает на одну из версий
+habr_articles_v{n}. Новая версия наполняется в фоне, проверяется и атомарно подменяет старую.
+"""
+import re
+
+from qdrant_client.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+)
+
+
+def version_name(alias, version):
+    return f"{alias}_v{version}"
+
+
+def list_versions(client, alias):
+    """Все версии коллекции: отсортированный список (номер, имя)"""
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = []
+    for collection in client.get_collections().collections:
+        match = pattern.match(collection.name)
+        if match:
+            versions.append((int(match.group(1)), collection.name))
+    return sorted(versions)
+
+
+def resolve_alias(client, alias):
+    """Имя коллекции, на которую сейчас указывает алиас, или None"""
+    for item in client.get_aliases().aliases:
+        if item.alias_name == alias:
+            return item.collection_name
+    return None
+
+
+def is_plain_collection(client, name):
+    """Существует обычная коллекция с именем алиаса (наследие до перехода на версии)"""
+    return name in [collection.name for collection in client.get_collections().collections]
+
+
+def next_version_name(client, alias):
+    versions = list_versions(client, alias)
+    return version_name(alias, versions[-1][0] + 1 if versions else 1)
+
+
+def pending_version(client, alias):
+    """Недостроенная версия новее живой (прерванная пересборка), которую можно продолжить"""
+    live = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    live_number = next((number for number, name in versions if name == live), 0)
+    candidates = [name for number, name in versions if number > live_number]
+    return candidates[-1] if candidates else None
+
+
+def swap_alias(client, alias, collection_name):
+    """Атомарно переключить алиас на новую коллекцию (удаление и создание в одном запросе)"""
+    operations = []
+    if resolve_alias(client, alias):
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    operations.append(CreateAliasOperation(
+        create_alias=CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+
+
+def garbage_collect(client, alias, keep=2):
+    """Удалить старые версии, оставив живую и keep - 1 предыдущих для отката"""
+    live = resolve_alias(client, alias)
+    versions = list_versions(client, alias)
+    live_number = next((number for number, name in versions if name == live), None)
+    if live_number is None:
+        return []
+    older = [name for number, name in versions if number < live_number]
+    to_delete = older[:max(len(older) - (keep - 1), 0)]
+    for name in to_delete:
+        client.delete_collection(name)
+    return to_delete
+
+
+def smoke_validate(qdrant_store, queries, min_results=1):
+    """Проверка новой версии перед переключением: каждый контрольный запрос что-то находит"""
+    failed = []
+    for query in queries:
+        try:
+            if len(qdrant_store.similarity_search(query, k=min_results)) < min_results:
+                failed.append(query)
+        except Exception as e:
+            print(f"❌ Ошибка контрольного запроса '{query}': {e}")
+            failed.append(query)
+    return failed
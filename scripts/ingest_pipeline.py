@@ -0,0 +1,382 @@
+"""
+Потоковый конвейер индексации документов в Qdrant
+
+поиск файлов -> чанкинг в пуле процессов -> батчевые асинхронные эмбеддинги -> батчевые upsert в Qdrant
+
+Между стадиями стоят ограниченные очереди, поэтому в памяти одновременно находится
+только несколько батчей, а не весь корпус.
+"""
+import asyncio
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import PointIdsList, PointStruct
+
+# Маркер окончания потока в очередях между стадиями
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Пропускная способность стадии конвейера"""
+    name: str
+    items: int = 0
+    busy: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def add(self, items, busy):
+        self.items += items
+        self.busy += busy
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        report = f"{self.name}: {self.items} шт., {self.items / elapsed:.1f}/s"
+        if self.busy:
+            report += f" (в работе {self.items / self.busy:.1f}/s)"
+        return report
+
+
+@dataclass
+class FileTask:
+    """Файл в работе: сколько его чанков ещё не записано в Qdrant"""
+    rel_path: str
+    size: int
+    mtime: float
+    point_ids: list
+    stale_ids: list
+    pending: int = 0
+    # Файл полностью разбит на чанки (для потоковых файлов становится True в конце чтения)
+    chunked: bool = True
+    previous_total: int | None = None
+
+
+def first_error(error):
+    """Исходная ошибка стадии из (вложенных) групп исключений TaskGroup"""
+    while isinstance(error, BaseExceptionGroup):
+        error = error.exceptions[0]
+    return error
+
+
+def is_rate_limited(exc):
+    """429 от GigaChat: gigachat.exceptions.ResponseError(url, status_code, content, headers)"""
+    return len(getattr(exc, "args", ())) > 1 and exc.args[1] == 429
+
+
+class IngestPipeline:
+    """Конвейер инкрементальной индексации с ограниченной конкурентностью и backpressure"""
+
+    def __init__(
+            self,
+            qdrant_url,
+            collection_name,
+            embeddings_model,
+            manifest,
+            save_manifest,
+            build_file_documents,
+            iter_file_documents,
+            relative_path,
+            chunk_workers=os.cpu_count() or 2,
+            embed_batch_size=32,
+            embed_concurrency=4,
+            upsert_batch_size=128,
+            queue_size=8,
+            report_interval=10.0,
+            stream_threshold_bytes=8 * 1024 * 1024,
+            stream_batch_size=256,
+    ):
+        self.qdrant_url = qdrant_url
+        self.collection_name = collection_name
+        self.embeddings_model = embeddings_model
+        self.manifest = manifest
+        self.save_manifest = save_manifest
+        self.build_file_documents = build_file_documents
+        self.iter_file_documents = iter_file_documents
+        self.relative_path = relative_path
+        self.chunk_workers = chunk_workers
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.upsert_batch_size = upsert_batch_size
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.stream_threshold_bytes = stream_threshold_bytes
+        self.stream_batch_size = stream_batch_size
+
+        self.stats = {
+            name: StageStats(name)
+            for name in ("files", "chunks", "embedded", "upserted", "skipped")
+        }
+        self.deleted = 0
+        self.unchanged_files = 0
+        self._files = {}
+        # До этого момента все эмбеддеры ждут после 429 (общий для стадии backoff)
+        self._rate_limited_until = 0.0
+
+    async def run(self, file_paths):
+        """Проиндексировать файлы, вернуть сводку"""
+        self.client = AsyncQdrantClient(url=self.qdrant_url)
+        chunk_queue = asyncio.Queue(maxsize=self.queue_size)
+        embed_queue = asyncio.Queue(maxsize=self.queue_size)
+        upsert_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        reporter = asyncio.create_task(self._report_periodically())
+        try:
+            with ProcessPoolExecutor(max_workers=self.chunk_workers) as pool:
+                # Ошибка любой стадии отменяет остальные: иначе они навсегда встанут на полных очередях
+                try:
+                    async with asyncio.TaskGroup() as stages:
+                        embedders = [
+                            stages.create_task(self._embed_stage(embed_queue, upsert_queue))
+                            for _ in range(self.embed_concurrency)
+                        ]
+                        stages.create_task(self._chunk_stage(pool, file_paths, chunk_queue))
+                        stages.create_task(self._batch_stage(chunk_queue, embed_queue))
+                        stages.create_task(self._finish_embedders(embedders, upsert_queue))
+                        stages.create_task(self._upsert_stage(upsert_queue))
+                except BaseExceptionGroup as group:
+                    raise first_error(group) from group
+            await self._remove_deleted_files(set(map(self.relative_path, file_paths)))
+        finally:
+            reporter.cancel()
+            self.save_manifest(self.manifest)
+            await self.client.close()
+
+        self._print_report()
+        return {
+            "unchanged_files": self.unchanged_files,
+            "added": self.stats["upserted"].items,
+            "deleted": self.deleted,
+        }
+
+    # ------------------------- стадии -------------------------
+
+    async def _chunk_stage(self, pool, file_paths, chunk_queue):
+        """Разбить изменившиеся файлы на чанки в пуле процессов"""
+        loop = asyncio.get_running_loop()
+        in_flight = asyncio.Semaphore(self.chunk_workers * 2)
+        indexed_files = self.manifest["files"]
+
+        async def chunk_file(file_path):
+            try:
+                started_at = time.monotonic()
+                if os.path.getsize(file_path) > self.stream_threshold_bytes:
+                    # Большой файл не собираем в список целиком — читаем чанки порциями
+                    await self._stream_file(file_path, chunk_queue)
+                else:
+                    documents = await loop.run_in_executor(pool, self.build_file_documents, file_path)
+                    await self._on_file_chunked(file_path, documents, chunk_queue)
+                self.stats["files"].add(1, time.monotonic() - started_at)
+            except Exception as e:
+                print(f"  ❌ Ошибка обработки {file_path}: {e}")
+            finally:
+                in_flight.release()
+
+        async with asyncio.TaskGroup() as tasks:
+            for file_path in file_paths:
+                file_stat = os.stat(file_path)
+                entry = indexed_files.get(self.relative_path(file_path))
+                # Быстрый путь: размер и mtime не изменились — файл даже не читаем
+                if entry and entry.get("size") == file_stat.st_size and entry.get("mtime") == file_stat.st_mtime:
+                    self.unchanged_files += 1
+                    continue
+                await in_flight.acquire()
+                tasks.create_task(chunk_file(file_path))
+        await chunk_queue.put(_DONE)
+
+    async def _on_file_chunked(self, file_path, documents, chunk_queue):
+        rel_path = self.relative_path(file_path)
+        entry = self.manifest["files"].get(rel_path)
+        old_ids = set(entry["points"]) if entry else set()
+        point_ids = [doc.id for doc in documents]
+
+        candidates = [doc for doc in documents if doc.id not in old_ids]
+        # Возобновление после прерывания: часть точек могла быть записана, а манифест — нет
+        to_add = await self._drop_existing(candidates)
+        self.stats["skipped"].add(len(candidates) - len(to_add), 0.0)
+
+        file_stat = os.stat(file_path)
+        task = FileTask(
+            rel_path=rel_path,
+            size=file_stat.st_size,
+            mtime=file_stat.st_mtime,
+            point_ids=point_ids,
+            stale_ids=list(old_ids - set(point_ids)),
+            pending=len(to_add),
+            previous_total=len(old_ids) if entry else None,
+        )
+        self._files[rel_path] = task
+        self.stats["chunks"].add(len(documents), 0.0)
+
+        if not to_add:
+            await self._complete_file(task)
+            return
+        for doc in to_add:
+            await chunk_queue.put(doc)
+
+    async def _stream_file(self, file_path, chunk_queue):
+        """Потоковый чанкинг большого файла: в памяти только текущая порция чанков"""
+        rel_path = self.relative_path(file_path)
+        entry = self.manifest["files"].get(rel_path)
+        old_ids = set(entry["points"]) if entry else set()
+        file_stat = os.stat(file_path)
+        task = FileTask(
+            rel_path=rel_path,
+            size=file_stat.st_size,
+            mtime=file_stat.st_mtime,
+            point_ids=[],
+            stale_ids=[],
+            chunked=False,
+        )
+        self._files[rel_path] = task
+
+        documents = self.iter_file_documents(file_path)
+        while batch := await asyncio.to_thread(lambda: list(itertools.islice(documents, self.stream_batch_size))):
+            task.point_ids.extend(doc.id for doc in batch)
+            candidates = [doc for doc in batch if doc.id not in old_ids]
+            to_add = await self._drop_existing(candidates)
+            self.stats["skipped"].add(len(candidates) - len(to_add), 0.0)
+            self.stats["chunks"].add(len(batch), 0.0)
+            task.pending += len(to_add)
+            for doc in to_add:
+                await chunk_queue.put(doc)
+
+        task.stale_ids = list(old_ids - set(task.point_ids))
+        task.chunked = True
+        if task.pending == 0:
+            await self._complete_file(task)
+
+    async def _drop_existing(self, documents):
+        if not documents:
+            return []
+        existing = await self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=[doc.id for doc in documents],
+            with_payload=False,
+            with_vectors=False,
+        )
+        existing_ids = {str(point.id) for point in existing}
+        return [doc for doc in documents if doc.id not in existing_ids]
+
+    async def _batch_stage(self, chunk_queue, embed_queue):
+        """Собрать чанки в батчи для эмбеддера"""
+        batch = []
+        while (doc := await chunk_queue.get()) is not _DONE:
+            batch.append(doc)
+            if len(batch) >= self.embed_batch_size:
+                await embed_queue.put(batch)
+                batch = []
+        if batch:
+            await embed_queue.put(batch)
+        for _ in range(self.embed_concurrency):
+            await embed_queue.put(_DONE)
+
+    async def _embed_stage(self, embed_queue, upsert_queue):
+        """Получить эмбеддинги батча с учётом ограничения частоты запросов"""
+        while (batch := await embed_queue.get()) is not _DONE:
+            vectors = await self._embed_with_backoff([doc.page_content for doc in batch])
+            await upsert_queue.put(list(zip(batch, vectors)))
+
+    async def _embed_with_backoff(self, texts, max_attempts=8):
+        for attempt in range(max_attempts):
+            delay = self._rate_limited_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started_at = time.monotonic()
+            try:
+                vectors = await self.embeddings_model.aembed_documents(texts)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == max_attempts - 1:
+                    raise
+                backoff = min(60.0, 2 ** attempt) * (0.5 + random.random())
+                self._rate_limited_until = max(self._rate_limited_until, time.monotonic() + backoff)
+                print(f"  ⏳ Лимит запросов эмбеддера, пауза {backoff:.1f}s")
+                continue
+            self.stats["embedded"].add(len(texts), time.monotonic() - started_at)
+            return vectors
+
+    async def _finish_embedders(self, embedders, upsert_queue):
+        await asyncio.gather(*embedders)
+        await upsert_queue.put(_DONE)
+
+    async def _upsert_stage(self, upsert_queue):
+        """Записать точки в Qdrant батчами"""
+        buffer = []
+        while (items := await upsert_queue.get()) is not _DONE:
+            buffer.extend(items)
+            if len(buffer) >= self.upsert_batch_size:
+                await self._upsert(buffer)
+                buffer = []
+        if buffer:
+            await self._upsert(buffer)
+
+    async def _upsert(self, items):
+        started_at = time.monotonic()
+        await self.client.upsert(
+            collection_name=self.collection_name,
+            points=[
+                PointStruct(
+                    id=doc.id,
+                    vector=vector,
+                    payload={"page_content": doc.page_content, "metadata": doc.metadata},
+                )
+                for doc, vector in items
+            ],
+        )
+        self.stats["upserted"].add(len(items), time.monotonic() - started_at)
+
+        for doc, _ in items:
+            task = self._files[doc.metadata["file_path"]]
+            task.pending -= 1
+            if task.pending == 0 and task.chunked:
+                await self._complete_file(task)
+
+    async def _complete_file(self, task):
+        """Все чанки файла записаны: удаляем устаревшие точки и фиксируем файл в манифесте"""
+        total_chunks = len(task.point_ids)
+        if total_chunks != task.previous_total:
+            # Число чанков изменилось (или не было известно при потоковом чтении) — обновляем у всех точек файла
+            for start in range(0, total_chunks, 1000):
+                await self.client.set_payload(
+                    collection_name=self.collection_name,
+                    payload={"total_chunks": total_chunks},
+                    points=task.point_ids[start:start + 1000],
+                    key="metadata",
+                )
+        if task.stale_ids:
+            await self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=task.stale_ids),
+            )
+            self.deleted += len(task.stale_ids)
+        self.manifest["files"][task.rel_path] = {"size": task.size, "mtime": task.mtime, "points": task.point_ids}
+        # Манифест сохраняем после каждого файла: прерванный запуск продолжится с того же места
+        self.save_manifest(self.manifest)
+        del self._files[task.rel_path]
+        print(f"  ✅ {task.rel_path}: {len(task.point_ids)} чанков, -{len(task.stale_ids)} устаревших")
+
+    async def _remove_deleted_files(self, seen_files):
+        indexed_files = self.manifest["files"]
+        for rel_path in set(indexed_files) - seen_files:
+            stale_ids = indexed_files.pop(rel_path)["points"]
+            if stale_ids:
+                await self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=PointIdsList(points=stale_ids),
+                )
+            self.save_manifest(self.manifest)
+            self.deleted += len(stale_ids)
+            print(f"  🗑️  {rel_path}: файл удалён, -{len(stale_ids)} чанков")
+
+    # ------------------------- отчёт -------------------------
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self._print_report()
+
+    def _print_report(self):
+        print("📈 " + " | ".join(stats.report() for stats in self.stats.values()))
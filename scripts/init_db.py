@@ -2,20 +2,44 @@
 """
 Скрипт для инициализации коллекции в Qdrant
 """
+import argparse
 import os
 import sys
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance
+
+from collection_profiles import (
+    DEFAULT_EMBEDDING_DIMENSION,
+    PROFILES,
+    apply_profile,
+    create_collection,
+    create_payload_indexes,
+)
+from collection_versions import is_plain_collection, resolve_alias, swap_alias, version_name
 
 # Настройки из переменных окружения
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# Алиас, за которым лежат версии коллекции habr_articles_v{n}
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "habr_articles")
-EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "384"))
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", str(DEFAULT_EMBEDDING_DIMENSION)))
+# Профиль настройки коллекции (см. collection_profiles.PROFILES)
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "default")
+
 
+def print_collection_info(collection_info):
+    params = collection_info.config.params
+    hnsw = collection_info.config.hnsw_config
+    quantization = collection_info.config.quantization_config
+    print(f"   Размерность векторов: {params.vectors.size}")
+    print(f"   Метрика расстояния: {params.vectors.distance}")
+    print(f"   Векторы на диске: {bool(params.vectors.on_disk)}")
+    print(f"   HNSW: m={hnsw.m}, ef_construct={hnsw.ef_construct}")
+    print(f"   Квантование: {type(quantization).__name__ if quantization else 'нет'}")
+    print(f"   Payload-индексы: {sorted((collection_info.payload_schema or {}).keys())}")
 
-def main():
-    print(f"🚀 Инициализация Qdrant коллекции '{QDRANT_COLLECTION}'...")
+
+def main(profile_name=QDRANT_PROFILE, apply=False):
+    print(f"🚀 Инициализация Qdrant коллекции '{QDRANT_COLLECTION}' (профиль '{profile_name}')...")
 
     try:
         # Подключаемся к Qdrant
@@ -29,35 +53,40 @@ def main():
         collections = client.get_collections()
         print(f"✅ Подключено к Qdrant. Доступные коллекции: {[c.name for c in collections.collections]}")
 
-        # Создаем коллекцию если не существует
-        existing_collections = [c.name for c in collections.collections]
-
-        if QDRANT_COLLECTION in existing_collections:
-            print(f"ℹ️ Коллекция '{QDRANT_COLLECTION}' уже существует")
+        live_collection = resolve_alias(client, QDRANT_COLLECTION)
+        if live_collection:
+            print(f"ℹ️ Алиас '{QDRANT_COLLECTION}' уже указывает на '{live_collection}'")
+        elif is_plain_collection(client, QDRANT_COLLECTION):
+            # Старая схема без версий — переведёт на алиас scripts/load_documents.py
+            live_collection = QDRANT_COLLECTION
+            print(f"ℹ️ Коллекция '{QDRANT_COLLECTION}' существует без версий, её перенесёт load_documents.py")
 
-            # Проверяем параметры коллекции
-            collection_info = client.get_collection(QDRANT_COLLECTION)
-            print(f"   Параметры: размерность={collection_info.config.params.vectors.size}, "
-                  f"расстояние={collection_info.config.params.vectors.distance}")
+        if live_collection:
+            collection_info = client.get_collection(live_collection)
+            if collection_info.config.params.vectors.size != EMBEDDING_DIMENSION:
+                print(f"⚠️  Размерность коллекции {collection_info.config.params.vectors.size} "
+                      f"не совпадает с EMBEDDING_DIMENSION={EMBEDDING_DIMENSION}; "
+                      f"пересоберите её через load_documents.py --force-recreate")
+            if apply:
+                # Индекс и квантование перестраиваются в фоне без остановки поиска
+                apply_profile(client, live_collection, profile_name)
+                print(f"🔧 Профиль '{profile_name}' применён к '{live_collection}'")
+            else:
+                create_payload_indexes(client, live_collection)
         else:
-            print(f"📁 Создаем коллекцию '{QDRANT_COLLECTION}'...")
+            live_collection = version_name(QDRANT_COLLECTION, 1)
+            print(f"📁 Создаем коллекцию '{live_collection}'...")
 
-            client.create_collection(
-                collection_name=QDRANT_COLLECTION,
-                vectors_config=VectorParams(
-                    size=EMBEDDING_DIMENSION,
-                    distance=Distance.COSINE
-                )
-            )
-            print(f"✅ Коллекция '{QDRANT_COLLECTION}' успешно создана")
+            create_collection(client, live_collection, EMBEDDING_DIMENSION, profile_name)
+            swap_alias(client, QDRANT_COLLECTION, live_collection)
+            print(f"✅ Коллекция '{live_collection}' успешно создана и доступна по алиасу '{QDRANT_COLLECTION}'")
 
         # Выводим информацию о коллекции
-        collection_info = client.get_collection(QDRANT_COLLECTION)
+        collection_info = client.get_collection(live_collection)
         print(f"\n📊 Информация о коллекции:")
-        print(f"   Имя: {QDRANT_COLLECTION}")
+        print(f"   Имя: {live_collection} (алиас {QDRANT_COLLECTION})")
         print(f"   Количество точек: {collection_info.points_count}")
-        print(f"   Размерность векторов: {collection_info.config.params.vectors.size}")
-        print(f"   Метрика расстояния: {collection_info.config.params.vectors.distance}")
+        print_collection_info(collection_info)
 
         return 0
 
@@ -67,4 +96,8 @@ def main():
 
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Инициализация коллекции Qdrant")
+    parser.add_argument("--profile", choices=list(PROFILES), default=QDRANT_PROFILE, help="Профиль настройки коллекции")
+    parser.add_argument("--apply", action="store_true", help="Применить профиль к уже существующей коллекции")
+    args = parser.parse_args()
+    sys.exit(main(profile_name=args.profile, apply=args.apply))
@@ -1,6 +1,12 @@
+import argparse
+import asyncio
 import getpass
+import hashlib
+import json
 import os
 import glob
+import time
+import uuid
 from pathlib import Path
 from dotenv import find_dotenv, load_dotenv
 from langchain_core.messages import HumanMessage
@@ -10,6 +16,19 @@ from langchain_gigachat.chat_models import GigaChat
 from langchain_qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient
 
+from chunking import TokenCounter, chunk_file
+from collection_profiles import PROFILES, create_collection
+from collection_versions import (
+    garbage_collect,
+    is_plain_collection,
+    next_version_name,
+    pending_version,
+    resolve_alias,
+    smoke_validate,
+    swap_alias,
+)
+from ingest_pipeline import IngestPipeline
+
 load_dotenv(find_dotenv(".env.agent"))
 
 # Правильная настройка GigaChat credentials
@@ -28,65 +47,135 @@ elif not os.environ.get("GIGACHAT_CREDENTIALS"):
 DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "qdrant")
 QDRANT_URL = "localhost"
 QDRANT_PORT = 6333
+# Алиас, по которому ищет агент; данные лежат в версиях habr_articles_v{n}
 COLLECTION_NAME = "habr_articles"
-
-
-def load_text_file(file_path):
-    """Загрузить текстовый файл"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return f.read()
-
-
-def chunk_text(text, chunk_size=990, overlap=150):
-    """Разбить текст на перекрывающиеся чанки"""
-    words = text.split()
-    chunks = []
-
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
-        if i + chunk_size >= len(words):
-            break
-
-    return chunks
-
-
-def process_documents():
-    """Обработать все .txt файлы в папке"""
-    print(f"📂 Загрузка документов из: {DATA_PATH}")
-
-    if not os.path.exists(DATA_PATH):
-        print(f"❌ Папка {DATA_PATH} не существует")
-        return []
-
-    langchain_documents = []
-
-    # Ищем все .txt файлы
+# Сколько версий коллекции хранить (живая + предыдущие для отката)
+KEEP_VERSIONS = int(os.getenv("KEEP_COLLECTION_VERSIONS", "2"))
+# Профиль настройки новых версий коллекции (см. collection_profiles.PROFILES)
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "default")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "EmbeddingsGigaR")
+# Манифесты проиндексированных файлов и их точек — по одному на версию коллекции
+MANIFEST_DIR = os.getenv(
+    "INGEST_MANIFEST_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "data", "ingest_manifests")
+)
+# Размер чанка и перекрытие в токенах
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+TOKEN_COUNTER = TokenCounter()
+# Версия разбиения на чанки: при её смене все файлы переиндексируются
+CHUNKER_VERSION = f"structured-{CHUNK_MAX_TOKENS}-{CHUNK_OVERLAP_TOKENS}-{TOKEN_COUNTER.name}"
+# Пространство имён для uuid5 — ID точек стабильны между запусками и машинами
+POINT_ID_NAMESPACE = uuid.UUID("8f6c1d2e-5b1a-4c7e-9a43-2f0d6b7e9c15")
+
+
+def discover_files():
+    """Найти все .txt файлы в папке с данными"""
     pattern = os.path.join(DATA_PATH, "**/*.txt")
-    for file_path in glob.glob(pattern, recursive=True):
-        try:
-            text = load_text_file(file_path)
-            chunks = chunk_text(text)
-
-            for i, chunk in enumerate(chunks):
-                # Создаем объект Document для LangChain
-                doc = Document(
-                    page_content=chunk,
-                    metadata={
-                        "source": os.path.basename(file_path),
-                        "file_path": file_path,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks)
-                    }
-                )
-                langchain_documents.append(doc)
-
-            print(f"  ✅ Загружен: {file_path} ({len(chunks)} чанков)")
-
-        except Exception as e:
-            print(f"  ❌ Ошибка обработки {file_path}: {e}")
-
-    return langchain_documents
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def relative_path(file_path):
+    """Путь файла относительно папки с данными — стабильный ключ для манифеста и ID точек"""
+    return Path(os.path.relpath(file_path, DATA_PATH)).as_posix()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id(rel_path, chunk_index, chunk_hash):
+    """Детерминированный ID точки: одинаковый чанк всегда получает один и тот же ID"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{rel_path}:{chunk_index}:{chunk_hash}"))
+
+
+def iter_file_documents(file_path):
+    """
+    Потоково разбить файл на чанки и подготовить документы LangChain с детерминированными ID.
+    total_chunks здесь неизвестен — его проставляет конвейер, когда файл записан целиком
+    """
+    rel_path = relative_path(file_path)
+    chunks = chunk_file(
+        file_path,
+        max_tokens=CHUNK_MAX_TOKENS,
+        overlap_tokens=CHUNK_OVERLAP_TOKENS,
+        counter=TOKEN_COUNTER
+    )
+    for i, chunk in enumerate(chunks):
+        chunk_hash = content_hash(chunk.text)
+        # Создаем объект Document для LangChain
+        yield Document(
+            id=point_id(rel_path, i, chunk_hash),
+            page_content=chunk.text,
+            metadata={
+                "source": os.path.basename(file_path),
+                "file_path": rel_path,
+                "chunk_index": i,
+                "total_chunks": None,
+                "content_hash": chunk_hash,
+                "char_start": chunk.start,
+                "char_end": chunk.end,
+                "token_count": chunk.tokens
+            }
+        )
+
+
+def build_file_documents(file_path):
+    """Разбить файл на документы целиком (для небольших файлов, в пуле процессов)"""
+    documents = list(iter_file_documents(file_path))
+    for doc in documents:
+        doc.metadata["total_chunks"] = len(documents)
+    return documents
+
+
+def manifest_path(collection_name):
+    return os.path.join(MANIFEST_DIR, f"{collection_name}.json")
+
+
+def load_manifest(collection_name):
+    """Прочитать манифест проиндексированных файлов; чужой или битый манифест считается пустым"""
+    empty = {"collection": collection_name, "embedding_model": EMBEDDING_MODEL, "chunker": CHUNKER_VERSION, "files": {}}
+    path = manifest_path(collection_name)
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️  Не удалось прочитать манифест {path}: {e}")
+        return empty
+    if (manifest.get("collection"), manifest.get("embedding_model"), manifest.get("chunker")) != \
+            (collection_name, EMBEDDING_MODEL, CHUNKER_VERSION):
+        print("ℹ️ Манифест относится к другой коллекции, модели эмбеддингов или чанкеру — выполняю полную индексацию")
+        return empty
+    return manifest
+
+
+def save_manifest(manifest):
+    """Атомарно записать манифест, чтобы прерванный запуск не оставил его битым"""
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    path = manifest_path(manifest["collection"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def remove_manifest(collection_name):
+    path = manifest_path(collection_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def ensure_collection(client, embeddings_model, collection_name, profile_name=QDRANT_PROFILE):
+    """Создать коллекцию по профилю, если её нет. Возвращает True, если коллекция создана заново"""
+    if collection_exists(client, collection_name):
+        return False
+    dimension = len(embeddings_model.embed_query("test"))
+    create_collection(client, collection_name, dimension, profile_name)
+    print(f"📁 Создана коллекция '{collection_name}' (размерность {dimension}, профиль '{profile_name}')")
+    return True
+
 
 def collection_exists(client, collection_name):
     """Проверить, существует ли коллекция"""
@@ -113,7 +202,94 @@ def test_search(qdrant_store, query, top_k=4):
         print(f"❌ Ошибка поиска: {e}")
 
 
-def main():
+TEST_QUERIES = [
+    "Расскажи про LLM",
+    "Что такое JavaScript?",
+    "Как работает Python?",
+    "Расскажи про машинное обучение",
+    "Что такое нейросети?"
+]
+
+
+def needs_rebuild(client, embeddings_model, live_collection):
+    """Причина пересборки в новую версию или None, если живую версию можно обновить инкрементально"""
+    if live_collection is None:
+        return "алиас ещё не создан"
+    manifest = load_manifest(live_collection)
+    if not manifest["files"] and client.get_collection(live_collection).points_count:
+        # Точки без манифеста (старый загрузчик со случайными ID) иначе задублировались бы
+        return "коллекция не пуста, но манифеста нет"
+    try:
+        QdrantVectorStore(client=client, collection_name=live_collection, embedding=embeddings_model)
+    except Exception as e:
+        if "dimensions" in str(e).lower():
+            return f"несовпадение размерностей эмбеддингов: {e}"
+        raise e
+    return None
+
+
+def sync_collection(client, embeddings_model, collection_name, **pipeline_options):
+    """Синхронизировать версию коллекции с файлами на диске через конвейер индексации"""
+    started_at = time.time()
+    pipeline = IngestPipeline(
+        qdrant_url=f"http://{QDRANT_URL}:{QDRANT_PORT}",
+        collection_name=collection_name,
+        embeddings_model=embeddings_model,
+        manifest=load_manifest(collection_name),
+        save_manifest=save_manifest,
+        build_file_documents=build_file_documents,
+        iter_file_documents=iter_file_documents,
+        relative_path=relative_path,
+        **pipeline_options
+    )
+    stats = asyncio.run(pipeline.run(discover_files()))
+    collection_info = client.get_collection(collection_name)
+    print(f"\n📊 Синхронизация '{collection_name}' за {time.time() - started_at:.1f}s: "
+          f"без изменений файлов {stats['unchanged_files']}, "
+          f"добавлено чанков {stats['added']}, удалено {stats['deleted']}; "
+          f"в коллекции {collection_info.points_count} точек")
+
+
+def rebuild(client, embeddings_model, profile_name=QDRANT_PROFILE, **pipeline_options):
+    """
+    Blue/green пересборка: новая версия наполняется, пока живая продолжает обслуживать поиск,
+    проверяется контрольными запросами и атомарно подменяет живую через алиас
+    """
+    # Прерванная пересборка продолжается с того места, где остановилась
+    target = pending_version(client, COLLECTION_NAME)
+    if target:
+        print(f"♻️  Продолжаю пересборку версии '{target}'")
+    else:
+        target = next_version_name(client, COLLECTION_NAME)
+    if ensure_collection(client, embeddings_model, target, profile_name):
+        remove_manifest(target)
+
+    sync_collection(client, embeddings_model, target, **pipeline_options)
+
+    print(f"\n🧪 Проверка версии '{target}' перед переключением...")
+    failed = smoke_validate(
+        QdrantVectorStore(client=client, collection_name=target, embedding=embeddings_model),
+        TEST_QUERIES
+    )
+    if failed:
+        raise RuntimeError(f"Версия '{target}' не прошла проверку, алиас не переключён: {failed}")
+
+    if is_plain_collection(client, COLLECTION_NAME):
+        # Переход со старой схемы: алиас не может совпадать с именем существующей коллекции,
+        # поэтому на время между удалением и созданием алиаса поиск недоступен
+        client.delete_collection(COLLECTION_NAME)
+        remove_manifest(COLLECTION_NAME)
+        print(f"🗑️  Удалена коллекция старой схемы '{COLLECTION_NAME}'")
+
+    swap_alias(client, COLLECTION_NAME, target)
+    print(f"🔀 Алиас '{COLLECTION_NAME}' переключён на '{target}'")
+
+    for name in garbage_collect(client, COLLECTION_NAME, keep=KEEP_VERSIONS):
+        remove_manifest(name)
+        print(f"🗑️  Удалена старая версия '{name}'")
+
+
+def main(force_recreate=False, profile_name=QDRANT_PROFILE, **pipeline_options):
     """Основная функция загрузки"""
     print("🚀 Начало работы с RAG системой")
 
@@ -121,105 +297,37 @@ def main():
         # Подключаемся к Qdrant для проверки коллекции
         client = QdrantClient(host=QDRANT_URL, port=QDRANT_PORT)
 
-        # Проверяем, существует ли коллекция
-        if collection_exists(client, COLLECTION_NAME):
-            print(f"✅ Коллекция '{COLLECTION_NAME}' уже существует")
-
-            # Подключаемся к существующей коллекции
-            embeddings_model = GigaChatEmbeddings(
-                verify_ssl_certs=False,
-                model='EmbeddingsGigaR'
-            )
-
-            try:
-                qdrant = QdrantVectorStore.from_existing_collection(
-                    embedding=embeddings_model,
-                    collection_name=COLLECTION_NAME,
-                    url=f"http://{QDRANT_URL}:{QDRANT_PORT}"
-                )
-
-                # Получаем информацию о коллекции
-                collection_info = client.get_collection(COLLECTION_NAME)
-                print(f"📊 Коллекция содержит {collection_info.points_count} документов")
-
-            except Exception as e:
-                if "dimensions" in str(e).lower() and ("2560" in str(e) or "384" in str(e)):
-                    print(f"⚠️  Несовпадение размерностей эмбеддингов: {e}")
-                    print("🔄 Пересоздаю коллекцию с новыми эмбеддингами...")
-                    
-                    # Удаляем старую коллекцию
-                    client.delete_collection(COLLECTION_NAME)
-                    print(f"🗑️  Удалена старая коллекция '{COLLECTION_NAME}'")
-                    
-                    # Создаем новую коллекцию
-                    documents = process_documents()
-                    if not documents:
-                        print("⚠️ Не найдено документов для обработки")
-                        return
-
-                    print(f"📊 Найдено {len(documents)} чанков для загрузки")
-                    print("🧠 Инициализация GigaChat Embeddings")
-                    
-                    qdrant = QdrantVectorStore.from_documents(
-                        documents=documents,
-                        embedding=embeddings_model,
-                        url=f"http://localhost:6333",
-                        collection_name=COLLECTION_NAME,
-                        force_recreate=True
-                    )
-                    
-                    print(f"✅ Успешно пересоздана коллекция '{COLLECTION_NAME}' с {len(documents)} чанками")
-                else:
-                    raise e
-
+        print("🧠 Инициализация GigaChat Embeddings")
+        embeddings_model = GigaChatEmbeddings(
+            verify_ssl_certs=False,
+            model=EMBEDDING_MODEL
+        )
+
+        live_collection = resolve_alias(client, COLLECTION_NAME)
+        reason = "запрошена полная переиндексация" if force_recreate else None
+        if is_plain_collection(client, COLLECTION_NAME):
+            reason = f"'{COLLECTION_NAME}' — обычная коллекция, перехожу на версии за алиасом"
+        reason = reason or needs_rebuild(client, embeddings_model, live_collection)
+
+        if reason:
+            print(f"🔄 Пересборка в новую версию: {reason}")
+            rebuild(client, embeddings_model, profile_name, **pipeline_options)
         else:
-            print(f"📝 Коллекция '{COLLECTION_NAME}' не найдена, создаем новую...")
-
-            # 1. Загружаем документы
-            documents = process_documents()
-
-            if not documents:
-                print("⚠️ Не найдено документов для обработки")
-                return
+            print(f"📌 Алиас '{COLLECTION_NAME}' → '{live_collection}', обновляю инкрементально")
+            sync_collection(client, embeddings_model, live_collection, **pipeline_options)
 
-            print(f"📊 Найдено {len(documents)} чанков для загрузки")
-
-            # 2. Инициализируем модель эмбеддингов
-            print("🧠 Инициализация GigaChat Embeddings")
-            embeddings_model = GigaChatEmbeddings(
-                verify_ssl_certs=False,
-                model='EmbeddingsGigaR'
-            )
-
-            # 3. Создаем коллекцию и загружаем документы
-            print(f"🔗 Создаем QdrantVectorStore и загружаем документы")
-
-            qdrant = QdrantVectorStore.from_documents(
-                documents=documents,
-                embedding=embeddings_model,
-                url=f"http://localhost:6333",
-                collection_name=COLLECTION_NAME,
-                force_recreate=False
-            )
-
-            print(f"✅ Успешно загружено {len(documents)} чанков в коллекцию '{COLLECTION_NAME}'")
-
-        # 4. Выполняем тестовые запросы
+        # Тестовые запросы идут через алиас — так же, как ищет агент
         print("\n🧪 Выполняем тестовые запросы...")
-
-        test_queries = [
-            "Расскажи про LLM",
-            "Что такое JavaScript?",
-            "Как работает Python?",
-            "Расскажи про машинное обучение",
-            "Что такое нейросети?"
-        ]
-
-        for query in test_queries:
+        qdrant = QdrantVectorStore(
+            client=client,
+            collection_name=COLLECTION_NAME,
+            embedding=embeddings_model
+        )
+        for query in TEST_QUERIES:
             test_search(qdrant, query)
 
         print(f"\n✅ Все тестовые запросы выполнены!")
-        print(f"💡 Коллекция '{COLLECTION_NAME}' готова к использованию")
+        print(f"💡 Коллекция '{COLLECTION_NAME}' → '{resolve_alias(client, COLLECTION_NAME)}' готова к использованию")
 
     except Exception as e:
         print(f"❌ Критическая ошибка: {e}")
@@ -227,4 +335,23 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Инкрементальная загрузка документов в Qdrant")
+    parser.add_argument("--force-recreate", action="store_true", help="Собрать новую версию коллекции с нуля и переключить на неё алиас")
+    parser.add_argument("--profile", choices=list(PROFILES), default=QDRANT_PROFILE, help="Профиль настройки новой версии коллекции")
+    parser.add_argument("--chunk-workers", type=int, default=os.cpu_count() or 2, help="Процессов для чанкинга")
+    parser.add_argument("--embed-batch-size", type=int, default=32, help="Чанков в одном запросе к эмбеддеру")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Одновременных запросов к эмбеддеру")
+    parser.add_argument("--upsert-batch-size", type=int, default=128, help="Точек в одном upsert")
+    parser.add_argument("--queue-size", type=int, default=8, help="Размер очередей между стадиями")
+    parser.add_argument("--stream-threshold-mb", type=int, default=8, help="Файлы больше этого размера читаются потоково")
+    args = parser.parse_args()
+    main(
+        force_recreate=args.force_recreate,
+        profile_name=args.profile,
+        chunk_workers=args.chunk_workers,
+        embed_batch_size=args.embed_batch_size,
+        embed_concurrency=args.embed_concurrency,
+        upsert_batch_size=args.upsert_batch_size,
+        queue_size=args.queue_size,
+        stream_threshold_bytes=args.stream_threshold_mb * 1024 * 1024
+    )
\ No newline at end of file
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест /invoke: параллельные многоходовые сессии, как у Telegram-бота
+
+Каждый виртуальный пользователь ведёт сессии подряд: первый вопрос из смеси запросов, затем
+уточнения с паузами на «обдумывание». Отчёт: пропускная способность, перцентили латентности,
+доли ошибок, время в очереди (латентность клиента минус X-Process-Time сервиса и очередь
+планировщика LLM из /stats), команды Redis на ход.
+
+Сервис для теста запускается со сценарной моделью вместо GigaChat:
+    LLM_BACKEND=fake FAKE_LLM_LATENCY=1.5 uvicorn app.main:app --workers 2
+    python scripts/load_test.py --users 50 --sessions 200 --turns 2-5 --think-time 2-8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import numpy as np
+
+AGENT_SERVICE_URL = os.getenv("AGENT_SERVICE_URL", "http://localhost:8000")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Смесь запросов: (вес, первые вопросы); уточнения выбираются отдельно
+DEFAULT_MIX = {
+    "first": [
+        [3, "Расскажи про LLM"],
+        [2, "Что такое JavaScript?"],
+        [2, "Как работает Python?"],
+        [2, "Расскажи про машинное обучение"],
+        [1, "Что такое нейросети?"],
+        [1, "Видел статью про пользу Go для JS разработчика. Расскажи, что там"],
+    ],
+    "follow_up": [
+        [3, "Расскажи подробнее"],
+        [2, "Приведи пример"],
+        [1, "А какие есть альтернативы?"],
+        [1, "Где об этом почитать?"],
+    ],
+}
+
+
+def parse_range(value):
+    """'2-5' -> (2.0, 5.0); '3' -> (3.0, 3.0)"""
+    low, _, high = value.partition("-")
+    return float(low), float(high or low)
+
+
+def weighted_choice(rng, items):
+    weights, values = zip(*items)
+    return rng.choices(values, weights=weights, k=1)[0]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = []
+        self.queue_delays = []
+        self.by_turn = defaultdict(list)
+        self.statuses = Counter()
+        self.agent_errors = 0
+        self.sessions = 0
+
+    def add(self, turn, latency, status, process_time, is_error):
+        self.statuses[status] += 1
+        if status == 200:
+            self.latencies.append(latency)
+            self.by_turn[turn].append(latency)
+            self.agent_errors += is_error
+        if process_time is not None:
+            self.queue_delays.append(max(latency - process_time, 0.0))
+
+    @property
+    def turns(self):
+        return sum(self.statuses.values())
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    values_ms = np.asarray(values) * 1000
+    return {f"p{q}": float(np.percentile(values_ms, q)) for q in (50, 90, 95, 99)} | {"max": float(values_ms.max())}
+
+
+async def run_session(client, rng, stats, args, mix, user_index, session_index):
+    session_id = f"tg_load{user_index}_{int(time.time() * 1000)}_{session_index}"
+    turns = rng.randint(*map(int, args.turns))
+    for turn in range(turns):
+        query = weighted_choice(rng, mix["first"] if turn == 0 else mix["follow_up"])
+        started_at = time.perf_counter()
+        try:
+            response = await client.post("/invoke", json={"query": query}, headers={"X-Session-Id": session_id})
+            latency = time.perf_counter() - started_at
+            process_time = response.headers.get("X-Process-Time")
+            is_error = response.status_code == 200 and bool(response.json().get("is_error"))
+            stats.add(turn, latency, response.status_code, float(process_time) if process_time else None, is_error)
+        except httpx.TimeoutException:
+            stats.add(turn, time.perf_counter() - started_at, "timeout", None, False)
+        except httpx.TransportError:
+            stats.add(turn, time.perf_counter() - started_at, "connection", None, False)
+        if turn < turns - 1:
+            await asyncio.sleep(rng.uniform(*args.think_time))
+    stats.sessions += 1
+
+
+async def virtual_user(client, stats, args, mix, user_index, session_counter, deadline):
+    rng = random.Random(args.seed + user_index)
+    # Плавный старт: пользователи подключаются равномерно в течение ramp-up
+    await asyncio.sleep(args.ramp_up * user_index / max(args.users, 1))
+    while time.monotonic() < deadline:
+        session_index = next(session_counter, None)
+        if session_index is None:
+            return
+        await run_session(client, rng, stats, args, mix, user_index, session_index)
+
+
+async def redis_commands(redis_url):
+    """Счётчик выполненных команд Redis; None, если Redis недоступен"""
+    try:
+        from redis.asyncio import Redis
+        client = Redis.from_url(redis_url)
+        try:
+            return (await client.info("stats"))["total_commands_processed"]
+        finally:
+            await client.close()
+    except Exception:
+        return None
+
+
+async def service_stats(client):
+    try:
+        response = await client.get("/stats")
+        return response.json() if response.status_code == 200 else None
+    except httpx.HTTPError:
+        return None
+
+
+async def run(args, mix):
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        redis_before = await redis_commands(args.redis_url) if args.redis_url else None
+        started_at = time.perf_counter()
+        deadline = time.monotonic() + args.duration if args.duration else float("inf")
+        session_counter = iter(range(args.sessions))
+        await asyncio.gather(*(
+            virtual_user(client, stats, args, mix, i, session_counter, deadline) for i in range(args.users)
+        ))
+        elapsed = time.perf_counter() - started_at
+        redis_after = await redis_commands(args.redis_url) if args.redis_url else None
+        scheduler = ((await service_stats(client)) or {}).get("llm_scheduler")
+
+    errors = {str(status): count for status, count in stats.statuses.items() if status != 200}
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key != "mix"},
+        "elapsed_s": elapsed,
+        "sessions": stats.sessions,
+        "turns": stats.turns,
+        "throughput_turns_per_s": stats.turns / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles(stats.latencies),
+        "latency_by_turn_ms": {turn: percentiles(values) for turn, values in sorted(stats.by_turn.items())},
+        "queue_delay_ms": percentiles(stats.queue_delays),
+        "error_rate": sum(errors.values()) / stats.turns if stats.turns else 0.0,
+        "agent_error_rate": stats.agent_errors / stats.turns if stats.turns else 0.0,
+        "errors": errors,
+        "llm_scheduler": scheduler,
+    }
+    if redis_before is not None and redis_after is not None and stats.turns:
+        # Счётчик общий для сервера Redis: сторонняя нагрузка тоже попадёт в результат
+        report["redis_ops_per_turn"] = (redis_after - redis_before) / stats.turns
+    return report
+
+
+def print_report(report):
+    print(f"\n📊 {report['sessions']} сессий, {report['turns']} ходов за {report['elapsed_s']:.1f}s "
+          f"→ {report['throughput_turns_per_s']:.2f} ходов/s")
+    latency = report["latency_ms"]
+    if latency:
+        print(f"⏱️  Латентность: p50 {latency['p50']:.0f}ms, p90 {latency['p90']:.0f}ms, "
+              f"p95 {latency['p95']:.0f}ms, p99 {latency['p99']:.0f}ms, max {latency['max']:.0f}ms")
+    for turn, row in report["latency_by_turn_ms"].items():
+        print(f"   ход {turn + 1}: p50 {row['p50']:.0f}ms, p95 {row['p95']:.0f}ms")
+    queue = report["queue_delay_ms"]
+    if queue:
+        print(f"⏳ Очередь до обработки сервисом: p50 {queue['p50']:.0f}ms, p95 {queue['p95']:.0f}ms")
+    if report.get("llm_scheduler"):
+        scheduler = report["llm_scheduler"]
+        print(f"⏳ Очередь планировщика LLM: p50 {scheduler['queue_time']['p50'] * 1000:.0f}ms, "
+              f"p95 {scheduler['queue_time']['p95'] * 1000:.0f}ms, отклонено {scheduler['rejected']}")
+    print(f"❌ Ошибки: {report['error_rate']:.1%} {report['errors'] or ''}; "
+          f"ответы агента с is_error: {report['agent_error_rate']:.1%}")
+    if "redis_ops_per_turn" in report:
+        print(f"🧮 Команд Redis на ход: {report['redis_ops_per_turn']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест /invoke многоходовыми сессиями")
+    parser.add_argument("--url", default=AGENT_SERVICE_URL)
+    parser.add_argument("--users", type=int, default=20, help="Одновременных виртуальных пользователей")
+    parser.add_argument("--sessions", type=int, default=100, help="Всего сессий")
+    parser.add_argument("--turns", type=parse_range, default="2-5", help="Ходов в сессии, например 2-5")
+    parser.add_argument("--think-time", type=parse_range, default="2-8", help="Пауза между ходами (сек.)")
+    parser.add_argument("--ramp-up", type=float, default=10.0, help="Время подключения всех пользователей (сек.)")
+    parser.add_argument("--duration", type=float, default=0.0, help="Ограничение по времени (сек., 0 — без ограничения)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Таймаут запроса, как у бота")
+    parser.add_argument("--mix", help="JSON со смесью запросов {\"first\": [[вес, текст]], \"follow_up\": [...]}")
+    parser.add_argument("--redis-url", default=REDIS_URL, help="Redis сервиса для подсчёта команд (пусто — не считать)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+
+    mix = DEFAULT_MIX
+    if args.mix:
+        with open(args.mix, "r", encoding="utf-8") as f:
+            mix = json.load(f)
+
+    print(f"🚀 Нагрузка на {args.url}: {args.users} пользователей, {args.sessions} сессий")
+    report = asyncio.run(run(args, mix))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Отчёт сохранён в {args.output}")
+
+
+if __name__ == "__main__":
+    main()